@@ -49,7 +49,7 @@ from neo4j.addressing import Address
 from neo4j.api import *
 from neo4j.bolt.direct import Connection, ConnectionPool, DEFAULT_PORT
 from neo4j.bolt.routing import RoutingConnectionPool
-from neo4j.bolt.security import make_ssl_context
+from neo4j.bolt.security import TLSSessionCache, make_ssl_context
 from neo4j.exceptions import ConnectionExpired, ServiceUnavailable
 from neo4j.meta import experimental, version as __version__
 
@@ -68,10 +68,35 @@ INFINITE = -1
 DEFAULT_MAX_CONNECTION_LIFETIME = 3600  # 1h
 DEFAULT_MAX_CONNECTION_POOL_SIZE = 100
 DEFAULT_CONNECTION_TIMEOUT = 5.0  # 5s
+DEFAULT_CONNECTION_ATTEMPT_DELAY = 0.25  # 250ms
+DEFAULT_MIN_IDLE_CONNECTIONS = 0
+DEFAULT_MAX_IDLE_TIME = INFINITE
+DEFAULT_LIVENESS_CHECK_TIMEOUT = INFINITE
+DEFAULT_READ_BUFFER_SIZE = 32768
+DEFAULT_READ_TIMEOUT = INFINITE
+DEFAULT_KEEP_ALIVE = True
+DEFAULT_KEEP_ALIVE_IDLE = 30  # 30s
+DEFAULT_KEEP_ALIVE_INTERVAL = 10  # 10s
+DEFAULT_KEEP_ALIVE_COUNT = 3
+DEFAULT_TCP_USER_TIMEOUT = 60.0  # 1m
+# Messages are queued and sent together by the driver, so the
+# kernel need not hold back small writes as well
+DEFAULT_TCP_NO_DELAY = True
+DEFAULT_SEND_BUFFER_SIZE = None  # system default
+DEFAULT_RECEIVE_BUFFER_SIZE = None  # system default
+DEFAULT_MAX_CHUNK_SIZE = 16384
 
 
 # Connection Settings
 DEFAULT_CONNECTION_ACQUISITION_TIMEOUT = 60  # 1m
+DEFAULT_RUN_CACHE_SIZE = 64
+DEFAULT_PIPELINED_HELLO = False
+
+
+# Result Settings
+DEFAULT_NUMERIC_ARRAYS = False
+DEFAULT_LAZY_RECORDS = False
+DEFAULT_STRING_CACHE_SIZE = 256
 
 
 # Routing settings
@@ -99,10 +124,31 @@ default_config = {
     "max_connection_lifetime": DEFAULT_MAX_CONNECTION_LIFETIME,
     "max_connection_pool_size": DEFAULT_MAX_CONNECTION_POOL_SIZE,
     "connection_acquisition_timeout": DEFAULT_CONNECTION_ACQUISITION_TIMEOUT,
+    "min_idle_connections": DEFAULT_MIN_IDLE_CONNECTIONS,
+    "max_idle_time": DEFAULT_MAX_IDLE_TIME,
+    "liveness_check_timeout": DEFAULT_LIVENESS_CHECK_TIMEOUT,
 
     # Connection settings:
     "connection_timeout": DEFAULT_CONNECTION_TIMEOUT,
-    "keep_alive": True,
+    "connection_attempt_delay": DEFAULT_CONNECTION_ATTEMPT_DELAY,
+    "keep_alive": DEFAULT_KEEP_ALIVE,
+    "keep_alive_idle": DEFAULT_KEEP_ALIVE_IDLE,
+    "keep_alive_interval": DEFAULT_KEEP_ALIVE_INTERVAL,
+    "keep_alive_count": DEFAULT_KEEP_ALIVE_COUNT,
+    "tcp_user_timeout": DEFAULT_TCP_USER_TIMEOUT,
+    "tcp_no_delay": DEFAULT_TCP_NO_DELAY,
+    "send_buffer_size": DEFAULT_SEND_BUFFER_SIZE,
+    "receive_buffer_size": DEFAULT_RECEIVE_BUFFER_SIZE,
+    "read_buffer_size": DEFAULT_READ_BUFFER_SIZE,
+    "read_timeout": DEFAULT_READ_TIMEOUT,
+    "max_chunk_size": DEFAULT_MAX_CHUNK_SIZE,
+    "run_cache_size": DEFAULT_RUN_CACHE_SIZE,
+    "pipelined_hello": DEFAULT_PIPELINED_HELLO,
+
+    # Result settings:
+    "numeric_arrays": DEFAULT_NUMERIC_ARRAYS,
+    "lazy_records": DEFAULT_LAZY_RECORDS,
+    "string_cache_size": DEFAULT_STRING_CACHE_SIZE,
 
     # Routing settings:
     "max_retry_time": DEFAULT_MAX_RETRY_TIME,
@@ -216,6 +262,16 @@ class Driver:
         raise NotImplementedError("Pipelines are not implemented "
                                   "for the %s class" % type(self).__name__)
 
+    def warm_up(self):
+        """ Open connections to each known server ahead of use, so that
+        the first requests need not wait for them. Each server is given
+        the configured minimum number of idle connections, or a single
+        connection if no minimum is configured. Servers that cannot be
+        reached are skipped.
+        """
+        self._assert_open()
+        self._pool.warm_up()
+
     def close(self):
         """ Shut down, closing any open connections in the pool.
         """
@@ -257,21 +313,29 @@ class DirectDriver(Driver):
             config["encrypted"] = False
         instance._ssl_context = make_ssl_context(**config)
         instance.encrypted = instance._ssl_context is not None
+        instance._tls_session_cache = TLSSessionCache()
 
         def connector(address, **kwargs):
-            return Connection.open(address, **dict(config, **kwargs))
+            return Connection.open(address, **dict(config, ssl_context=instance._ssl_context,
+                                                   tls_session_cache=instance._tls_session_cache,
+                                                   **kwargs))
 
         pool = ConnectionPool(connector, instance.address, **config)
         pool.release(pool.acquire())
+        pool.start_maintenance()
         instance._pool = pool
         instance._max_retry_time = config.get("max_retry_time",
                                               default_config["max_retry_time"])
+        instance._lazy_records = config.get("lazy_records",
+                                            default_config["lazy_records"])
         return instance
 
     def session(self, **parameters):
         self._assert_open()
         if "max_retry_time" not in parameters:
             parameters["max_retry_time"] = self._max_retry_time
+        if "lazy_records" not in parameters:
+            parameters["lazy_records"] = self._lazy_records
         from neo4j.blocking import Session
         return Session(self._pool.acquire, **parameters)
 
@@ -329,10 +393,13 @@ class RoutingDriver(Driver):
             config["encrypted"] = False
         instance._ssl_context = make_ssl_context(**config)
         instance.encrypted = instance._ssl_context is not None
+        instance._tls_session_cache = TLSSessionCache()
         routing_context = cls.parse_routing_context(uri)
 
         def connector(address, **kwargs):
-            return Connection.open(address, **dict(config, **kwargs))
+            return Connection.open(address, **dict(config, ssl_context=instance._ssl_context,
+                                                   tls_session_cache=instance._tls_session_cache,
+                                                   **kwargs))
 
         pool = RoutingConnectionPool(connector, initial_address,
                                      routing_context, initial_address, **config)
@@ -342,15 +409,20 @@ class RoutingDriver(Driver):
             pool.close()
             raise
         else:
+            pool.start_maintenance()
             instance._pool = pool
             instance._max_retry_time = \
                 config.get("max_retry_time", default_config["max_retry_time"])
+            instance._lazy_records = \
+                config.get("lazy_records", default_config["lazy_records"])
             return instance
 
     def session(self, **parameters):
         self._assert_open()
         if "max_retry_time" not in parameters:
             parameters["max_retry_time"] = self._max_retry_time
+        if "lazy_records" not in parameters:
+            parameters["lazy_records"] = self._lazy_records
         from neo4j.blocking import Session
         return Session(self._pool.acquire, **parameters)
 
@@ -448,7 +520,7 @@ class Workspace:
                 except (WorkspaceError, ConnectionExpired, ServiceUnavailable):
                     pass
             if self._connection:
-                self._connection.in_use = False
+                self._connection.release()
                 self._connection = None
             self._connection_access_mode = None
 
@@ -0,0 +1,1076 @@
+/*
+ * Copyright (c) 2002-2019 "Neo4j,"
+ * Neo4j Sweden AB [http://neo4j.com]
+ *
+ * This file is part of Neo4j.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*
+ * Optional compiled PackStream codec.
+ *
+ * This module accelerates the hot paths of neo4j.packstream.Packer and
+ * neo4j.packstream.Unpacker. It is never used directly; the pure Python
+ * classes pick it up automatically if it has been built. Anything that
+ * the codec does not handle natively (subclasses of the core types,
+ * user-registered types, pathologically deep nesting) causes it to
+ * return NotImplemented, at which point the pure Python implementation
+ * takes over. The two implementations must produce identical output.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+
+#define MAX_DEPTH 4096
+
+
+/* ------------------------------------------------------------------------
+ * Packing
+ * ------------------------------------------------------------------------ */
+
+typedef struct {
+    char *data;
+    Py_ssize_t size;
+    Py_ssize_t capacity;
+} Output;
+
+static int
+output_reserve(Output *out, Py_ssize_t n)
+{
+    Py_ssize_t required = out->size + n;
+    if (required > out->capacity) {
+        Py_ssize_t capacity = out->capacity ? out->capacity : 256;
+        char *data;
+        while (capacity < required) {
+            capacity *= 2;
+        }
+        data = PyMem_Realloc(out->data, capacity);
+        if (data == NULL) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        out->data = data;
+        out->capacity = capacity;
+    }
+    return 0;
+}
+
+static int
+output_write(Output *out, const char *b, Py_ssize_t n)
+{
+    if (output_reserve(out, n) < 0) {
+        return -1;
+    }
+    memcpy(out->data + out->size, b, n);
+    out->size += n;
+    return 0;
+}
+
+static int
+output_u8(Output *out, uint8_t x)
+{
+    if (output_reserve(out, 1) < 0) {
+        return -1;
+    }
+    out->data[out->size++] = (char)x;
+    return 0;
+}
+
+static int
+output_marker_u8(Output *out, uint8_t marker, uint8_t x)
+{
+    if (output_reserve(out, 2) < 0) {
+        return -1;
+    }
+    out->data[out->size++] = (char)marker;
+    out->data[out->size++] = (char)x;
+    return 0;
+}
+
+static int
+output_marker_u16(Output *out, uint8_t marker, uint16_t x)
+{
+    if (output_reserve(out, 3) < 0) {
+        return -1;
+    }
+    out->data[out->size++] = (char)marker;
+    out->data[out->size++] = (char)(x >> 8);
+    out->data[out->size++] = (char)x;
+    return 0;
+}
+
+static int
+output_marker_u32(Output *out, uint8_t marker, uint32_t x)
+{
+    int i;
+    if (output_reserve(out, 5) < 0) {
+        return -1;
+    }
+    out->data[out->size++] = (char)marker;
+    for (i = 3; i >= 0; i--) {
+        out->data[out->size++] = (char)(x >> (8 * i));
+    }
+    return 0;
+}
+
+static int
+output_marker_u64(Output *out, uint8_t marker, uint64_t x)
+{
+    int i;
+    if (output_reserve(out, 9) < 0) {
+        return -1;
+    }
+    out->data[out->size++] = (char)marker;
+    for (i = 7; i >= 0; i--) {
+        out->data[out->size++] = (char)(x >> (8 * i));
+    }
+    return 0;
+}
+
+/* Write a size header for a string, list or map. The tiny marker is used for
+ * sizes below 16 and the 8, 16 and 32-bit markers follow sequentially from
+ * marker_8. Returns -1 with an OverflowError set if the size is too large.
+ */
+static int
+pack_sized_header(Output *out, Py_ssize_t size, uint8_t tiny, uint8_t marker_8,
+                  const char *what)
+{
+    if (size < 0x10 && tiny) {
+        return output_u8(out, (uint8_t)(tiny + size));
+    }
+    else if (size < 0x100) {
+        return output_marker_u8(out, marker_8, (uint8_t)size);
+    }
+    else if (size < 0x10000) {
+        return output_marker_u16(out, marker_8 + 1, (uint16_t)size);
+    }
+    else if ((uint64_t)size < 0x100000000ULL) {
+        return output_marker_u32(out, marker_8 + 2, (uint32_t)size);
+    }
+    else {
+        PyErr_Format(PyExc_OverflowError, "%s header size out of range", what);
+        return -1;
+    }
+}
+
+static int pack_value(Output *out, PyObject *value, PyObject *structure_type, int depth);
+
+static int
+pack_long(Output *out, PyObject *value)
+{
+    int overflow = 0;
+    long long x = PyLong_AsLongLongAndOverflow(value, &overflow);
+    if (x == -1 && PyErr_Occurred()) {
+        return -1;
+    }
+    if (overflow) {
+        PyErr_Format(PyExc_OverflowError, "Integer %S out of range", value);
+        return -1;
+    }
+    if (-0x10 <= x && x < 0x80) {
+        return output_u8(out, (uint8_t)x);
+    }
+    else if (-0x80 <= x && x < -0x10) {
+        return output_marker_u8(out, 0xC8, (uint8_t)x);
+    }
+    else if (-0x8000 <= x && x < 0x8000) {
+        return output_marker_u16(out, 0xC9, (uint16_t)x);
+    }
+    else if (-0x80000000LL <= x && x < 0x80000000LL) {
+        return output_marker_u32(out, 0xCA, (uint32_t)x);
+    }
+    else {
+        return output_marker_u64(out, 0xCB, (uint64_t)x);
+    }
+}
+
+static int
+pack_float(Output *out, PyObject *value)
+{
+    double x = PyFloat_AS_DOUBLE(value);
+    uint64_t bits;
+    memcpy(&bits, &x, sizeof(bits));
+    return output_marker_u64(out, 0xC1, bits);
+}
+
+static int
+pack_bytes(Output *out, const char *data, Py_ssize_t size)
+{
+    if (size < 0x100) {
+        if (output_marker_u8(out, 0xCC, (uint8_t)size) < 0) {
+            return -1;
+        }
+    }
+    else if (size < 0x10000) {
+        if (output_marker_u16(out, 0xCD, (uint16_t)size) < 0) {
+            return -1;
+        }
+    }
+    else if ((uint64_t)size < 0x100000000ULL) {
+        if (output_marker_u32(out, 0xCE, (uint32_t)size) < 0) {
+            return -1;
+        }
+    }
+    else {
+        PyErr_SetString(PyExc_OverflowError, "Bytes header size out of range");
+        return -1;
+    }
+    return output_write(out, data, size);
+}
+
+static int
+pack_struct(Output *out, PyObject *signature, PyObject *fields,
+            PyObject *structure_type, int depth)
+{
+    PyObject *seq;
+    Py_ssize_t size, i;
+    if (!PyBytes_Check(signature) || PyBytes_GET_SIZE(signature) != 1) {
+        PyErr_SetString(PyExc_ValueError,
+                        "Structure signature must be a single byte value");
+        return -1;
+    }
+    seq = PySequence_Fast(fields, "Structure fields must be a sequence");
+    if (seq == NULL) {
+        return -1;
+    }
+    size = PySequence_Fast_GET_SIZE(seq);
+    if (size >= 0x10) {
+        Py_DECREF(seq);
+        PyErr_SetString(PyExc_OverflowError, "Structure size out of range");
+        return -1;
+    }
+    if (output_marker_u8(out, (uint8_t)(0xB0 + size),
+                         (uint8_t)PyBytes_AS_STRING(signature)[0]) < 0) {
+        Py_DECREF(seq);
+        return -1;
+    }
+    for (i = 0; i < size; i++) {
+        int status = pack_value(out, PySequence_Fast_GET_ITEM(seq, i),
+                                structure_type, depth + 1);
+        if (status != 0) {
+            Py_DECREF(seq);
+            return status;
+        }
+    }
+    Py_DECREF(seq);
+    return 0;
+}
+
+/* Returns 0 on success, -1 on error and 1 if the value (or something nested
+ * within it) must be packed by the pure Python implementation instead.
+ */
+static int
+pack_value(Output *out, PyObject *value, PyObject *structure_type, int depth)
+{
+    PyTypeObject *type = Py_TYPE(value);
+
+    if (depth > MAX_DEPTH) {
+        return 1;
+    }
+
+    if (value == Py_None) {
+        return output_u8(out, 0xC0);
+    }
+    else if (value == Py_True) {
+        return output_u8(out, 0xC3);
+    }
+    else if (value == Py_False) {
+        return output_u8(out, 0xC2);
+    }
+    else if (type == &PyFloat_Type) {
+        return pack_float(out, value);
+    }
+    else if (type == &PyLong_Type) {
+        return pack_long(out, value);
+    }
+    else if (type == &PyUnicode_Type) {
+        Py_ssize_t size;
+        const char *encoded = PyUnicode_AsUTF8AndSize(value, &size);
+        if (encoded == NULL) {
+            return -1;
+        }
+        if (pack_sized_header(out, size, 0x80, 0xD0, "String") < 0) {
+            return -1;
+        }
+        return output_write(out, encoded, size);
+    }
+    else if (type == &PyBytes_Type) {
+        return pack_bytes(out, PyBytes_AS_STRING(value), PyBytes_GET_SIZE(value));
+    }
+    else if (type == &PyByteArray_Type) {
+        return pack_bytes(out, PyByteArray_AS_STRING(value), PyByteArray_GET_SIZE(value));
+    }
+    else if (type == &PyList_Type) {
+        Py_ssize_t i;
+        if (pack_sized_header(out, PyList_GET_SIZE(value), 0x90, 0xD4, "List") < 0) {
+            return -1;
+        }
+        for (i = 0; i < PyList_GET_SIZE(value); i++) {
+            int status = pack_value(out, PyList_GET_ITEM(value, i),
+                                    structure_type, depth + 1);
+            if (status != 0) {
+                return status;
+            }
+        }
+        return 0;
+    }
+    else if (type == &PyDict_Type) {
+        Py_ssize_t pos = 0;
+        PyObject *key, *item;
+        if (pack_sized_header(out, PyDict_Size(value), 0xA0, 0xD8, "Map") < 0) {
+            return -1;
+        }
+        while (PyDict_Next(value, &pos, &key, &item)) {
+            int status = pack_value(out, key, structure_type, depth + 1);
+            if (status != 0) {
+                return status;
+            }
+            status = pack_value(out, item, structure_type, depth + 1);
+            if (status != 0) {
+                return status;
+            }
+        }
+        return 0;
+    }
+    else if ((PyObject *)type == structure_type) {
+        int status;
+        PyObject *tag = PyObject_GetAttrString(value, "tag");
+        PyObject *fields = NULL;
+        if (tag == NULL) {
+            return -1;
+        }
+        fields = PyObject_GetAttrString(value, "fields");
+        if (fields == NULL) {
+            Py_DECREF(tag);
+            return -1;
+        }
+        status = pack_struct(out, tag, fields, structure_type, depth);
+        Py_DECREF(tag);
+        Py_DECREF(fields);
+        return status;
+    }
+    else {
+        return 1;
+    }
+}
+
+static PyObject *
+output_finish(Output *out, int status)
+{
+    PyObject *result;
+    if (status < 0) {
+        result = NULL;
+    }
+    else if (status > 0) {
+        result = Py_NotImplemented;
+        Py_INCREF(result);
+    }
+    else {
+        result = PyBytes_FromStringAndSize(out->data, out->size);
+    }
+    PyMem_Free(out->data);
+    return result;
+}
+
+PyDoc_STRVAR(pack_doc,
+"pack(value, structure_type)\n\
+\n\
+Encode a value as PackStream, returning the bytes produced or\n\
+NotImplemented if the value cannot be handled natively.");
+
+static PyObject *
+packstream_pack(PyObject *module, PyObject *args)
+{
+    PyObject *value, *structure_type;
+    Output out = {NULL, 0, 0};
+    if (!PyArg_ParseTuple(args, "OO:pack", &value, &structure_type)) {
+        return NULL;
+    }
+    return output_finish(&out, pack_value(&out, value, structure_type, 0));
+}
+
+PyDoc_STRVAR(pack_struct_doc,
+"pack_struct(signature, fields, structure_type)\n\
+\n\
+Encode a structure as PackStream, returning the bytes produced or\n\
+NotImplemented if one of the fields cannot be handled natively.");
+
+static PyObject *
+packstream_pack_struct(PyObject *module, PyObject *args)
+{
+    PyObject *signature, *fields, *structure_type;
+    Output out = {NULL, 0, 0};
+    if (!PyArg_ParseTuple(args, "OOO:pack_struct", &signature, &fields, &structure_type)) {
+        return NULL;
+    }
+    return output_finish(&out, pack_struct(&out, signature, fields, structure_type, 0));
+}
+
+
+/* ------------------------------------------------------------------------
+ * Unpacking
+ * ------------------------------------------------------------------------ */
+
+typedef struct {
+    const unsigned char *data;
+    Py_ssize_t p;
+    Py_ssize_t end;
+    PyObject *structure_type;
+    PyObject *end_of_stream;
+    /* String cache details, mirroring neo4j.packstream.StringCache */
+    PyObject *strings;
+    Py_ssize_t max_length;
+    Py_ssize_t capacity;
+    Py_ssize_t hits;
+    Py_ssize_t misses;
+} Input;
+
+static int
+input_require(Input *in, Py_ssize_t n)
+{
+    if (in->end - in->p < n) {
+        PyErr_SetString(PyExc_ValueError, "Unexpected end of PackStream data");
+        return -1;
+    }
+    return 0;
+}
+
+static uint64_t
+input_uint(Input *in, int n)
+{
+    uint64_t x = 0;
+    int i;
+    for (i = 0; i < n; i++) {
+        x = (x << 8) | in->data[in->p++];
+    }
+    return x;
+}
+
+/* Read an unsigned big-endian size of n bytes, returning -1 on error. */
+static Py_ssize_t
+input_size(Input *in, int n)
+{
+    if (input_require(in, n) < 0) {
+        return -1;
+    }
+    return (Py_ssize_t)input_uint(in, n);
+}
+
+static PyObject *unpack_value(Input *in, int depth);
+
+static PyObject *
+unpack_cached_string(Input *in, const char *data, Py_ssize_t size)
+{
+    PyObject *key, *value;
+    key = PyBytes_FromStringAndSize(data, size);
+    if (key == NULL) {
+        return NULL;
+    }
+    value = PyDict_GetItemWithError(in->strings, key);
+    if (value != NULL) {
+        in->hits += 1;
+        Py_INCREF(value);
+        Py_DECREF(key);
+        return value;
+    }
+    if (PyErr_Occurred()) {
+        Py_DECREF(key);
+        return NULL;
+    }
+    in->misses += 1;
+    value = PyUnicode_DecodeUTF8(data, size, "strict");
+    if (value == NULL) {
+        Py_DECREF(key);
+        return NULL;
+    }
+    if (PyDict_Size(in->strings) >= in->capacity) {
+        PyDict_Clear(in->strings);
+    }
+    if (PyDict_SetItem(in->strings, key, value) < 0) {
+        Py_DECREF(key);
+        Py_DECREF(value);
+        return NULL;
+    }
+    Py_DECREF(key);
+    return value;
+}
+
+static PyObject *
+unpack_string(Input *in, Py_ssize_t size)
+{
+    const char *data;
+    if (size < 0 || input_require(in, size) < 0) {
+        return NULL;
+    }
+    data = (const char *)in->data + in->p;
+    in->p += size;
+    if (in->strings != NULL && size <= in->max_length) {
+        return unpack_cached_string(in, data, size);
+    }
+    return PyUnicode_DecodeUTF8(data, size, "strict");
+}
+
+static PyObject *
+unpack_bytes(Input *in, Py_ssize_t size)
+{
+    PyObject *value;
+    if (size < 0 || input_require(in, size) < 0) {
+        return NULL;
+    }
+    value = PyBytes_FromStringAndSize((const char *)in->data + in->p, size);
+    in->p += size;
+    return value;
+}
+
+static PyObject *
+unpack_list(Input *in, Py_ssize_t size, int depth)
+{
+    PyObject *value;
+    Py_ssize_t i;
+    if (size < 0) {
+        return NULL;
+    }
+    value = PyList_New(size);
+    if (value == NULL) {
+        return NULL;
+    }
+    for (i = 0; i < size; i++) {
+        PyObject *item = unpack_value(in, depth + 1);
+        if (item == NULL || item == Py_NotImplemented) {
+            Py_DECREF(value);
+            return item;
+        }
+        PyList_SET_ITEM(value, i, item);
+    }
+    return value;
+}
+
+static PyObject *
+unpack_list_stream(Input *in, int depth)
+{
+    PyObject *value = PyList_New(0);
+    if (value == NULL) {
+        return NULL;
+    }
+    for (;;) {
+        PyObject *item = unpack_value(in, depth + 1);
+        if (item == NULL || item == Py_NotImplemented) {
+            Py_DECREF(value);
+            return item;
+        }
+        if (item == in->end_of_stream) {
+            Py_DECREF(item);
+            return value;
+        }
+        if (PyList_Append(value, item) < 0) {
+            Py_DECREF(item);
+            Py_DECREF(value);
+            return NULL;
+        }
+        Py_DECREF(item);
+    }
+}
+
+/* Unpack size key-value pairs, or pairs until END_OF_STREAM if size is -2. */
+static PyObject *
+unpack_map(Input *in, Py_ssize_t size, int depth)
+{
+    PyObject *value;
+    Py_ssize_t i;
+    if (size == -1) {
+        return NULL;
+    }
+    value = PyDict_New();
+    if (value == NULL) {
+        return NULL;
+    }
+    for (i = 0; size == -2 || i < size; i++) {
+        PyObject *key, *item;
+        int status;
+        key = unpack_value(in, depth + 1);
+        if (key == NULL || key == Py_NotImplemented) {
+            Py_DECREF(value);
+            return key;
+        }
+        if (size == -2 && key == in->end_of_stream) {
+            Py_DECREF(key);
+            break;
+        }
+        item = unpack_value(in, depth + 1);
+        if (item == NULL || item == Py_NotImplemented) {
+            Py_DECREF(key);
+            Py_DECREF(value);
+            return item;
+        }
+        status = PyDict_SetItem(value, key, item);
+        Py_DECREF(key);
+        Py_DECREF(item);
+        if (status < 0) {
+            Py_DECREF(value);
+            return NULL;
+        }
+    }
+    return value;
+}
+
+static PyObject *
+unpack_structure(Input *in, Py_ssize_t size, int depth)
+{
+    PyObject *args, *value;
+    Py_ssize_t i;
+    if (input_require(in, 1) < 0) {
+        return NULL;
+    }
+    args = PyTuple_New(size + 1);
+    if (args == NULL) {
+        return NULL;
+    }
+    value = PyBytes_FromStringAndSize((const char *)in->data + in->p, 1);
+    in->p += 1;
+    if (value == NULL) {
+        Py_DECREF(args);
+        return NULL;
+    }
+    PyTuple_SET_ITEM(args, 0, value);
+    for (i = 0; i < size; i++) {
+        PyObject *field = unpack_value(in, depth + 1);
+        if (field == NULL || field == Py_NotImplemented) {
+            Py_DECREF(args);
+            return field;
+        }
+        PyTuple_SET_ITEM(args, i + 1, field);
+    }
+    value = PyObject_Call(in->structure_type, args, NULL);
+    Py_DECREF(args);
+    return value;
+}
+
+static PyObject *
+unpack_value(Input *in, int depth)
+{
+    unsigned char marker;
+    unsigned char marker_high;
+
+    if (depth > MAX_DEPTH) {
+        Py_RETURN_NOTIMPLEMENTED;
+    }
+    if (in->p >= in->end) {
+        PyErr_SetString(PyExc_ValueError, "Nothing to unpack");
+        return NULL;
+    }
+    marker = in->data[in->p++];
+    marker_high = marker & 0xF0;
+
+    /* Tiny Integer */
+    if (marker < 0x80) {
+        return PyLong_FromLong(marker);
+    }
+    else if (marker >= 0xF0) {
+        return PyLong_FromLong((long)marker - 0x100);
+    }
+
+    /* Tiny String, List, Map, Structure */
+    switch (marker_high) {
+        case 0x80:
+            return unpack_string(in, marker & 0x0F);
+        case 0x90:
+            return unpack_list(in, marker & 0x0F, depth);
+        case 0xA0:
+            return unpack_map(in, marker & 0x0F, depth);
+        case 0xB0:
+            return unpack_structure(in, marker & 0x0F, depth);
+    }
+
+    switch (marker) {
+        case 0xC0:
+            Py_RETURN_NONE;
+        case 0xC1: {
+            uint64_t bits;
+            double x;
+            if (input_require(in, 8) < 0) {
+                return NULL;
+            }
+            bits = input_uint(in, 8);
+            memcpy(&x, &bits, sizeof(x));
+            return PyFloat_FromDouble(x);
+        }
+        case 0xC2:
+            Py_RETURN_FALSE;
+        case 0xC3:
+            Py_RETURN_TRUE;
+        case 0xC8:
+            if (input_require(in, 1) < 0) {
+                return NULL;
+            }
+            return PyLong_FromLong((int8_t)input_uint(in, 1));
+        case 0xC9:
+            if (input_require(in, 2) < 0) {
+                return NULL;
+            }
+            return PyLong_FromLong((int16_t)input_uint(in, 2));
+        case 0xCA:
+            if (input_require(in, 4) < 0) {
+                return NULL;
+            }
+            return PyLong_FromLong((int32_t)input_uint(in, 4));
+        case 0xCB:
+            if (input_require(in, 8) < 0) {
+                return NULL;
+            }
+            return PyLong_FromLongLong((int64_t)input_uint(in, 8));
+        case 0xCC:
+            return unpack_bytes(in, input_size(in, 1));
+        case 0xCD:
+            return unpack_bytes(in, input_size(in, 2));
+        case 0xCE:
+            return unpack_bytes(in, input_size(in, 4));
+        case 0xD0:
+            return unpack_string(in, input_size(in, 1));
+        case 0xD1:
+            return unpack_string(in, input_size(in, 2));
+        case 0xD2:
+            return unpack_string(in, input_size(in, 4));
+        case 0xD4:
+            return unpack_list(in, input_size(in, 1), depth);
+        case 0xD5:
+            return unpack_list(in, input_size(in, 2), depth);
+        case 0xD6:
+            return unpack_list(in, input_size(in, 4), depth);
+        case 0xD7:
+            return unpack_list_stream(in, depth);
+        case 0xD8:
+            return unpack_map(in, input_size(in, 1), depth);
+        case 0xD9:
+            return unpack_map(in, input_size(in, 2), depth);
+        case 0xDA:
+            return unpack_map(in, input_size(in, 4), depth);
+        case 0xDB:
+            return unpack_map(in, -2, depth);
+        case 0xDF:
+            Py_INCREF(in->end_of_stream);
+            return in->end_of_stream;
+        default:
+            PyErr_Format(PyExc_ValueError, "Unknown PackStream marker %02X", marker);
+            return NULL;
+    }
+}
+
+PyDoc_STRVAR(unpack_doc,
+"unpack(data, offset, end, structure_type, end_of_stream, string_cache=None)\n\
+\n\
+Decode a single PackStream value from data[offset:end], returning a\n\
+2-tuple of the value and the offset immediately following it. If the\n\
+value cannot be handled natively, NotImplemented is returned instead.\n\
+Short strings are decoded through the string cache, if one is given.");
+
+static Py_ssize_t
+get_ssize_attr(PyObject *obj, const char *name)
+{
+    Py_ssize_t value;
+    PyObject *attr = PyObject_GetAttrString(obj, name);
+    if (attr == NULL) {
+        return -1;
+    }
+    value = PyNumber_AsSsize_t(attr, PyExc_OverflowError);
+    Py_DECREF(attr);
+    return value;
+}
+
+/* Add a count to an integer attribute, preserving any exception set. */
+static int
+add_ssize_attr(PyObject *obj, const char *name, Py_ssize_t n)
+{
+    PyObject *type, *value, *traceback, *attr, *total;
+    int status = -1;
+    if (n == 0) {
+        return 0;
+    }
+    PyErr_Fetch(&type, &value, &traceback);
+    attr = PyObject_GetAttrString(obj, name);
+    if (attr != NULL) {
+        PyObject *delta = PyLong_FromSsize_t(n);
+        if (delta != NULL) {
+            total = PyNumber_Add(attr, delta);
+            if (total != NULL) {
+                status = PyObject_SetAttrString(obj, name, total);
+                Py_DECREF(total);
+            }
+            Py_DECREF(delta);
+        }
+        Py_DECREF(attr);
+    }
+    if (type != NULL) {
+        PyErr_Restore(type, value, traceback);
+    }
+    return status;
+}
+
+static PyObject *
+packstream_unpack(PyObject *module, PyObject *args)
+{
+    Py_buffer view;
+    Input in;
+    PyObject *string_cache = Py_None;
+    PyObject *value, *result;
+    in.strings = NULL;
+    in.max_length = in.capacity = in.hits = in.misses = 0;
+    if (!PyArg_ParseTuple(args, "y*nnOO|O:unpack", &view, &in.p, &in.end,
+                          &in.structure_type, &in.end_of_stream, &string_cache)) {
+        return NULL;
+    }
+    if (in.p < 0 || in.end > view.len || in.p > in.end) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_IndexError, "Offsets out of range");
+        return NULL;
+    }
+    if (string_cache != Py_None) {
+        in.strings = PyObject_GetAttrString(string_cache, "strings");
+        if (in.strings != NULL && !PyDict_Check(in.strings)) {
+            Py_CLEAR(in.strings);
+            PyErr_SetString(PyExc_TypeError, "String cache must be backed by a dict");
+        }
+        if (in.strings == NULL ||
+                (in.max_length = get_ssize_attr(string_cache, "max_length")) == -1 ||
+                (in.capacity = get_ssize_attr(string_cache, "capacity")) == -1) {
+            Py_XDECREF(in.strings);
+            PyBuffer_Release(&view);
+            return NULL;
+        }
+    }
+    in.data = (const unsigned char *)view.buf;
+    value = unpack_value(&in, 0);
+    PyBuffer_Release(&view);
+    if (in.strings != NULL) {
+        Py_DECREF(in.strings);
+        if (add_ssize_attr(string_cache, "hits", in.hits) < 0 ||
+                add_ssize_attr(string_cache, "misses", in.misses) < 0) {
+            Py_XDECREF(value);
+            return NULL;
+        }
+    }
+    if (value == NULL || value == Py_NotImplemented) {
+        return value;
+    }
+    result = Py_BuildValue("(Nn)", value, in.p);
+    return result;
+}
+
+
+
+/* ------------------------------------------------------------------------
+ * Skipping
+ * ------------------------------------------------------------------------ */
+
+static int
+input_skip(Input *in, Py_ssize_t n)
+{
+    if (n < 0 || input_require(in, n) < 0) {
+        return -1;
+    }
+    in->p += n;
+    return 0;
+}
+
+/* Move past a single value without decoding it. A stack holds the
+ * number of values still to be skipped at each enclosing level of
+ * nesting, or -1 for a stream. Returns 0 on success or -1 on error. */
+static int
+skip_value(Input *in)
+{
+    Py_ssize_t remaining = 1;
+    Py_ssize_t *stack = NULL;
+    Py_ssize_t depth = 0, capacity = 0;
+    for (;;) {
+        unsigned char marker;
+        /* Number of nested values that follow, or -1 for a stream */
+        Py_ssize_t size = 0;
+        int status = 0;
+        if (in->p >= in->end) {
+            PyErr_SetString(PyExc_ValueError, "Nothing to unpack");
+            goto error;
+        }
+        marker = in->data[in->p++];
+        if (marker < 0x80 || marker >= 0xF0) {
+            /* Tiny Integer */
+        }
+        else if (marker < 0xC0) {
+            switch (marker & 0xF0) {
+                case 0x80:
+                    status = input_skip(in, marker & 0x0F);
+                    break;
+                case 0x90:
+                    size = marker & 0x0F;
+                    break;
+                case 0xA0:
+                    size = 2 * (marker & 0x0F);
+                    break;
+                case 0xB0:
+                    status = input_skip(in, 1);
+                    size = marker & 0x0F;
+                    break;
+            }
+        }
+        else {
+            switch (marker) {
+                case 0xC0:
+                case 0xC2:
+                case 0xC3:
+                    break;
+                case 0xC8:
+                    status = input_skip(in, 1);
+                    break;
+                case 0xC9:
+                    status = input_skip(in, 2);
+                    break;
+                case 0xCA:
+                    status = input_skip(in, 4);
+                    break;
+                case 0xC1:
+                case 0xCB:
+                    status = input_skip(in, 8);
+                    break;
+                case 0xCC:
+                case 0xD0:
+                    status = input_skip(in, input_size(in, 1));
+                    break;
+                case 0xCD:
+                case 0xD1:
+                    status = input_skip(in, input_size(in, 2));
+                    break;
+                case 0xCE:
+                case 0xD2:
+                    status = input_skip(in, input_size(in, 4));
+                    break;
+                case 0xD4:
+                case 0xD5:
+                case 0xD6:
+                    size = input_size(in, 1 << (marker - 0xD4));
+                    status = size < 0 ? -1 : 0;
+                    break;
+                case 0xD8:
+                case 0xD9:
+                case 0xDA:
+                    size = input_size(in, 1 << (marker - 0xD8));
+                    status = size < 0 ? -1 : 0;
+                    size *= 2;
+                    break;
+                case 0xD7:
+                case 0xDB:
+                    size = -1;
+                    break;
+                case 0xDF:
+                    if (remaining != -1) {
+                        PyErr_SetString(PyExc_ValueError, "Unexpected END_OF_STREAM marker");
+                        goto error;
+                    }
+                    /* The stream is complete */
+                    remaining = stack[--depth];
+                    break;
+                default:
+                    PyErr_Format(PyExc_ValueError, "Unknown PackStream marker %02X", marker);
+                    goto error;
+            }
+        }
+        if (status < 0) {
+            goto error;
+        }
+
+        if (size != 0) {
+            /* Descend into a non-empty container or a stream */
+            if (depth == capacity) {
+                Py_ssize_t *resized;
+                capacity = capacity ? 2 * capacity : 16;
+                resized = PyMem_Realloc(stack, capacity * sizeof(Py_ssize_t));
+                if (resized == NULL) {
+                    PyErr_NoMemory();
+                    goto error;
+                }
+                stack = resized;
+            }
+            stack[depth++] = remaining;
+            remaining = size;
+            continue;
+        }
+        /* A value is complete, which may in turn complete the
+         * containers that enclose it */
+        while (remaining != -1) {
+            remaining -= 1;
+            if (remaining != 0) {
+                break;
+            }
+            if (depth == 0) {
+                PyMem_Free(stack);
+                return 0;
+            }
+            remaining = stack[--depth];
+        }
+    }
+error:
+    PyMem_Free(stack);
+    return -1;
+}
+
+PyDoc_STRVAR(skip_doc,
+"skip(data, offset, end)\n\
+\n\
+Move past a single PackStream value in data[offset:end] without\n\
+decoding it, returning the offset immediately following it.");
+
+static PyObject *
+packstream_skip(PyObject *module, PyObject *args)
+{
+    Py_buffer view;
+    Input in;
+    int status;
+    if (!PyArg_ParseTuple(args, "y*nn:skip", &view, &in.p, &in.end)) {
+        return NULL;
+    }
+    if (in.p < 0 || in.end > view.len || in.p > in.end) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_IndexError, "Offsets out of range");
+        return NULL;
+    }
+    in.data = (const unsigned char *)view.buf;
+    status = skip_value(&in);
+    PyBuffer_Release(&view);
+    if (status < 0) {
+        return NULL;
+    }
+    return PyLong_FromSsize_t(in.p);
+}
+
+
+static PyMethodDef packstream_methods[] = {
+    {"pack", packstream_pack, METH_VARARGS, pack_doc},
+    {"pack_struct", packstream_pack_struct, METH_VARARGS, pack_struct_doc},
+    {"unpack", packstream_unpack, METH_VARARGS, unpack_doc},
+    {"skip", packstream_skip, METH_VARARGS, skip_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef packstream_module = {
+    PyModuleDef_HEAD_INIT,
+    "neo4j._packstream",
+    "Optional compiled PackStream codec",
+    -1,
+    packstream_methods
+};
+
+PyMODINIT_FUNC
+PyInit__packstream(void)
+{
+    return PyModule_Create(&packstream_module);
+}
@@ -82,6 +82,10 @@ class Session:
             The maximum time after which to stop attempting retries of failed
             transactions.
 
+        `lazy_records`
+            If true, record values are kept in their encoded form until
+            first accessed, and only those values accessed are ever decoded.
+
     """
 
     # The current connection.
@@ -103,6 +107,9 @@ class Session:
     # Default maximum time to keep retrying failed transactions.
     _max_retry_time = default_config["max_retry_time"]
 
+    # Whether record values should be decoded on demand.
+    _lazy_records = default_config["lazy_records"]
+
     _closed = False
 
     def __init__(self, acquirer, **parameters):
@@ -117,6 +124,8 @@ class Session:
                     self._bookmarks_in = tuple(value)
             elif key == "max_retry_time":
                 self._max_retry_time = value
+            elif key == "lazy_records":
+                self._lazy_records = value
             else:
                 pass  # for compatibility
 
@@ -144,7 +153,7 @@ class Session:
 
     def _disconnect(self):
         if self._connection:
-            self._connection.in_use = False
+            self._connection.release()
             self._connection = None
 
     def close(self):
@@ -214,9 +223,6 @@ class Session:
         statement_timeout = getattr(statement, "timeout", None)
         parameters = fix_parameters(dict(parameters or {}, **kwparameters))
 
-        def fail(_):
-            self._close_transaction()
-
         hydrant = DataHydrator()
         result_metadata = {
             "statement": statement_text,
@@ -224,38 +230,26 @@ class Session:
             "server": server,
             "protocol_version": protocol_version,
         }
-        run_metadata = {
-            "metadata": statement_metadata,
-            "timeout": statement_timeout,
-            "on_success": result_metadata.update,
-            "on_failure": fail,
-        }
-
-        def done(summary_metadata):
-            result_metadata.update(summary_metadata)
-            bookmark = result_metadata.get("bookmark")
-            if bookmark:
-                self._bookmarks_in = tuple([bookmark])
-                self._bookmark_out = bookmark
-
-        self._last_result = result = BoltStatementResult(self, hydrant, result_metadata)
 
         if has_transaction:
             if statement_metadata:
                 raise ValueError("Metadata can only be attached at transaction level")
             if statement_timeout:
                 raise ValueError("Timeouts only apply at transaction level")
+            bookmarks = None
         else:
-            run_metadata["bookmarks"] = self._bookmarks_in
+            bookmarks = self._bookmarks_in
 
-        cx.run(statement_text, parameters, **run_metadata)
-        cx.pull_all(
-            on_records=lambda records: result._records.extend(
-                hydrant.hydrate_records(result.keys(), records)),
-            on_success=done,
-            on_failure=fail,
-            on_summary=lambda: result.detach(sync=False),
-        )
+        self._last_result = result = BoltStatementResult(self, hydrant, result_metadata)
+
+        # The result handles its own records and summary through bound
+        # methods, so no closures need be created for each statement
+        cx.run(statement_text, parameters, bookmarks=bookmarks,
+               metadata=statement_metadata, timeout=statement_timeout,
+               on_success=result_metadata.update, on_failure=self._fail)
+        cx.pull_all(lazy_records=self._lazy_records, on_records=result._on_records,
+                    on_success=result._on_success, on_failure=self._fail,
+                    on_summary=result._on_summary)
 
         if not has_transaction:
             try:
@@ -345,6 +339,15 @@ class Session:
     def _close_transaction(self):
         self._transaction = None
 
+    def _fail(self, _):
+        self._close_transaction()
+
+    def _complete(self, metadata):
+        bookmark = metadata.get("bookmark")
+        if bookmark:
+            self._bookmarks_in = tuple([bookmark])
+            self._bookmark_out = bookmark
+
     def begin_transaction(self, bookmark=None, metadata=None, timeout=None):
         """ Create a new :class:`.Transaction` within this session.
         Calling this method with a bookmark is equivalent to
@@ -776,6 +779,17 @@ class BoltStatementResult(StatementResult):
     def __init__(self, session, hydrant, metadata):
         super(BoltStatementResult, self).__init__(session, hydrant, metadata)
 
+    def _on_records(self, records):
+        self._records.extend(self._hydrant.hydrate_records(self.keys(), records))
+
+    def _on_success(self, metadata):
+        self._metadata.update(metadata)
+        if self._session is not None:
+            self._session._complete(self._metadata)
+
+    def _on_summary(self):
+        self.detach(sync=False)
+
     def value(self, item=0, default=None):
         """ Return the remainder of the result as a list of values.
 
@@ -35,19 +35,23 @@ __all__ = [
 ]
 
 
-from collections import deque
-from logging import getLogger
-from select import select
-from socket import socket, SOL_SOCKET, SO_KEEPALIVE, SHUT_RDWR, \
-    timeout as SocketTimeout, AF_INET, AF_INET6
+from collections import deque, OrderedDict
+from functools import partial
+from itertools import chain, zip_longest
+from io import BytesIO
+from logging import getLogger, DEBUG
+import socket as socket_module
+from socket import socket, SOL_SOCKET, SO_SNDBUF, SHUT_RDWR, \
+    IPPROTO_TCP, timeout as SocketTimeout, AF_INET, AF_INET6
 from ssl import HAS_SNI, SSLSocket, SSLError
 from struct import pack as struct_pack, unpack as struct_unpack
-from threading import RLock, Condition
+from queue import Queue, Empty
+from threading import RLock, Condition, Event, Thread
 from time import perf_counter
 
 from neo4j.addressing import Address, AddressList
 from neo4j.bolt.security import make_ssl_context
-from neo4j.packstream import Packer, UnpackableBuffer, Unpacker
+from neo4j.packstream import PACKED_UINT_16, Packer, StringCache, UnpackableBuffer, Unpacker
 from neo4j.exceptions import ClientError, ProtocolError, SecurityError, \
     ServiceUnavailable, AuthError, CypherError, IncompleteCommitError, \
     ConnectionExpired, DatabaseUnavailableError, NotALeaderError, \
@@ -62,11 +66,59 @@ MAGIC_PREAMBLE = 0x6060B017
 DEFAULT_MAX_CONNECTION_LIFETIME = 3600  # 1h
 DEFAULT_MAX_CONNECTION_POOL_SIZE = 100
 DEFAULT_CONNECTION_TIMEOUT = 5.0  # 5s
+DEFAULT_CONNECTION_ATTEMPT_DELAY = 0.25  # 250ms
+DEFAULT_MIN_IDLE_CONNECTIONS = 0
+DEFAULT_MAX_IDLE_TIME = -1  # no limit
+DEFAULT_MAINTENANCE_INTERVAL = 1.0  # 1s
+DEFAULT_LIVENESS_CHECK_TIMEOUT = -1  # no check
 
 DEFAULT_KEEP_ALIVE = True
+DEFAULT_KEEP_ALIVE_IDLE = 30  # 30s
+DEFAULT_KEEP_ALIVE_INTERVAL = 10  # 10s
+DEFAULT_KEEP_ALIVE_COUNT = 3
+DEFAULT_TCP_USER_TIMEOUT = 60.0  # 1m
+DEFAULT_TCP_NO_DELAY = True
+DEFAULT_SEND_BUFFER_SIZE = None  # system default
+DEFAULT_RECEIVE_BUFFER_SIZE = None  # system default
+DEFAULT_READ_BUFFER_SIZE = 32768
+DEFAULT_READ_TIMEOUT = -1  # no limit
+DEFAULT_MAX_CHUNK_SIZE = 16384
+
+# Largest payload that a single chunk header can describe
+MAX_CHUNK_SIZE = 0xFFFF
+
+# Largest number of buffers passed to a single sendmsg call
+MAX_SEND_BUFFERS = 1024
+
+# Adjacent buffers smaller than this are joined together before being
+# sent, as copying a few bytes costs less than an extra I/O vector
+COALESCE_SIZE = 1024
+
+# Result Settings
+DEFAULT_NUMERIC_ARRAYS = False
+DEFAULT_STRING_CACHE_SIZE = 256
+
+# Socket options that can be set from configuration, as tuples of
+# setting name, default value, option level, option name, and
+# functions to convert a setting value to and from its option value.
+# Options not available on this platform are skipped, as are those
+# with a value of None, which leaves the system default in place.
+SOCKET_OPTIONS = [
+    ("keep_alive", DEFAULT_KEEP_ALIVE, SOL_SOCKET, "SO_KEEPALIVE", int, bool),
+    ("keep_alive_idle", DEFAULT_KEEP_ALIVE_IDLE, IPPROTO_TCP, "TCP_KEEPIDLE", int, int),
+    ("keep_alive_interval", DEFAULT_KEEP_ALIVE_INTERVAL, IPPROTO_TCP, "TCP_KEEPINTVL", int, int),
+    ("keep_alive_count", DEFAULT_KEEP_ALIVE_COUNT, IPPROTO_TCP, "TCP_KEEPCNT", int, int),
+    ("tcp_user_timeout", DEFAULT_TCP_USER_TIMEOUT, IPPROTO_TCP, "TCP_USER_TIMEOUT",
+     lambda seconds: int(1000 * seconds), lambda millis: millis / 1000),
+    ("tcp_no_delay", DEFAULT_TCP_NO_DELAY, IPPROTO_TCP, "TCP_NODELAY", int, bool),
+    ("send_buffer_size", DEFAULT_SEND_BUFFER_SIZE, SOL_SOCKET, "SO_SNDBUF", int, int),
+    ("receive_buffer_size", DEFAULT_RECEIVE_BUFFER_SIZE, SOL_SOCKET, "SO_RCVBUF", int, int),
+]
 
 # Connection Settings
 DEFAULT_CONNECTION_ACQUISITION_TIMEOUT = 60  # 1m
+DEFAULT_PIPELINED_HELLO = False
+DEFAULT_RUN_CACHE_SIZE = 64
 
 
 # Set up logger
@@ -100,61 +152,217 @@ class ServerInfo:
 
 
 class Outbox:
+    """ Queue of outgoing data, divided into chunks. Data written is not
+    copied but held by reference, as a list of payload segments and
+    the chunk headers between them, until sent. Data passed to
+    :meth:`.write` must therefore not be modified afterwards.
+    """
 
-    def __init__(self, capacity=8192, max_chunk_size=16384):
+    def __init__(self, max_chunk_size=DEFAULT_MAX_CHUNK_SIZE, sink=None):
         self._max_chunk_size = max_chunk_size
-        self._header = 0
-        self._start = 2
-        self._end = 2
-        self._data = bytearray(capacity)
+        self._sink = sink
+        # Headers and payload segments of all closed chunks
+        self._buffers = []
+        self._size = 0
+        # Payload segments of the chunk currently being filled
+        self._chunk = []
+        self._chunk_size = 0
+        # Total number of bytes passed to the sink by flush
+        self.flushed = 0
+
+    def __len__(self):
+        """ Return the number of bytes queued.
+        """
+        if self._chunk_size:
+            return self._size + 2 + self._chunk_size
+        return self._size
 
     def max_chunk_size(self):
         return self._max_chunk_size
 
     def clear(self):
-        self._header = 0
-        self._start = 2
-        self._end = 2
-        self._data[0:2] = b"\x00\x00"
+        self._buffers.clear()
+        self._size = 0
+        self._chunk = []
+        self._chunk_size = 0
 
     def write(self, b):
-        to_write = len(b)
+        view = memoryview(b)
+        to_write = len(view)
         max_chunk_size = self._max_chunk_size
         pos = 0
         while to_write > 0:
-            chunk_size = self._end - self._start
-            remaining = max_chunk_size - chunk_size
+            remaining = max_chunk_size - self._chunk_size
             if remaining == 0 or remaining < to_write <= max_chunk_size:
                 self.chunk()
             else:
                 wrote = min(to_write, remaining)
-                new_end = self._end + wrote
-                self._data[self._end:new_end] = b[pos:pos+wrote]
-                self._end = new_end
+                self._chunk.append(view[pos:(pos + wrote)])
+                self._chunk_size += wrote
                 pos += wrote
-                new_chunk_size = self._end - self._start
-                self._data[self._header:(self._header + 2)] = struct_pack(">H", new_chunk_size)
                 to_write -= wrote
 
+    def flush(self):
+        """ Pass all complete chunks to the sink, if there is one,
+        keeping back only the chunk currently being filled.
+        """
+        if self._sink is None or not self._buffers:
+            return
+        self.flushed += self._size
+        self._sink(self._buffers)
+        self._buffers.clear()
+        self._size = 0
+
+    def mark(self):
+        """ Return a marker for the current position, for use with
+        :meth:`.rewind`.
+        """
+        return self.flushed, len(self._buffers), self._size, list(self._chunk), self._chunk_size
+
+    def rewind(self, mark):
+        """ Discard everything written since a marker was taken. This
+        is only possible if nothing has been flushed in the meantime.
+
+        :return: :const:`True` if rewound, :const:`False` otherwise
+        """
+        flushed, n_buffers, size, chunk, chunk_size = mark
+        if flushed != self.flushed:
+            return False
+        del self._buffers[n_buffers:]
+        self._size = size
+        self._chunk = chunk
+        self._chunk_size = chunk_size
+        return True
+
     def chunk(self):
-        self._header = self._end
-        self._start = self._header + 2
-        self._end = self._start
-        self._data[self._header:self._start] = b"\x00\x00"
-
-    def view(self):
-        end = self._end
-        chunk_size = end - self._start
-        if chunk_size == 0:
-            return memoryview(self._data[:self._header])
+        """ Close the chunk currently being filled, even if empty, and
+        start a new one.
+        """
+        size = self._chunk_size
+        self._buffers.append(PACKED_UINT_16[size])
+        self._buffers.extend(self._chunk)
+        self._size += 2 + size
+        self._chunk = []
+        self._chunk_size = 0
+
+    def end_message(self):
+        """ Close the chunk currently being filled, if not empty, and
+        add the empty chunk that marks the end of a message.
+        """
+        size = self._chunk_size
+        buffers = self._buffers
+        if size:
+            buffers.append(PACKED_UINT_16[size])
+            buffers.extend(self._chunk)
+            self._chunk = []
+            self._chunk_size = 0
+        buffers.append(PACKED_UINT_16[0])
+        self._size += 4 + size if size else 2
+
+    def buffers(self):
+        """ Return a list of the buffers queued, including the chunk
+        currently being filled unless it is empty.
+        """
+        if self._chunk_size:
+            return self._buffers + [PACKED_UINT_16[self._chunk_size]] + self._chunk
+        return list(self._buffers)
+
+
+def coalesce(buffers, threshold=COALESCE_SIZE):
+    """ Return a list of buffers holding the same data as those given,
+    with each run of adjacent buffers smaller than a threshold joined
+    into one. Larger buffers are passed through uncopied.
+    """
+    coalesced = []
+    run = []
+    for b in buffers:
+        if len(b) < threshold:
+            run.append(b)
         else:
-            return memoryview(self._data[:end])
+            if run:
+                coalesced.append(b"".join(run) if len(run) > 1 else run[0])
+                run = []
+            coalesced.append(b)
+    if run:
+        coalesced.append(b"".join(run) if len(run) > 1 else run[0])
+    return coalesced
+
+
+def send_buffers(sock, buffers):
+    """ Send a sequence of buffers over a socket, in order. Where the
+    socket supports it, scatter-gather I/O is used so that the buffers
+    need not first be joined together, although small buffers are
+    still coalesced to keep the number of I/O vectors down.
+    """
+    if isinstance(sock, SSLSocket) or not hasattr(sock, "sendmsg"):
+        sock.sendall(b"".join(buffers))
+        return
+    buffers = coalesce(buffers)
+    i = 0
+    n = len(buffers)
+    while i < n:
+        sent = sock.sendmsg(buffers[i:(i + MAX_SEND_BUFFERS)])
+        # Move past the buffers sent in full, and resume any that
+        # was only partly sent from where it left off
+        while i < n:
+            size = len(buffers[i])
+            if sent < size:
+                if sent:
+                    buffers[i] = memoryview(buffers[i])[sent:]
+                break
+            sent -= size
+            i += 1
+
+
+class RunCache:
+    """ Bounded cache of the encoded parts of RUN messages that do not
+    depend on the parameters: the message header and statement that
+    precede them, and the extra metadata that follows. Each entry is
+    keyed on the statement and on the metadata from which the extra
+    field is built. When full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, capacity=DEFAULT_RUN_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def encode(self, key, statement, extra):
+        """ Return the encoded (head, tail) pair for a RUN message,
+        encoding it only if the key is not already in the cache.
+        """
+        entries = self.entries
+        try:
+            parts = entries[key]
+        except KeyError:
+            self.misses += 1
+            stream = BytesIO()
+            packer = Packer(stream)
+            packer.pack_raw(b"\xB3\x10")
+            packer.pack(statement)
+            head = stream.getvalue()
+            packer.pack(extra)
+            parts = entries[key] = (head, stream.getvalue()[len(head):])
+            if len(entries) > self.capacity:
+                entries.popitem(last=False)
+        else:
+            self.hits += 1
+            entries.move_to_end(key)
+        return parts
 
 
 class BufferedSocket:
     """ Wrapper for a regular socket, with an added a dynamically-resizing
     receive buffer to reduce the number of calls to recv.
 
+    The socket is read in whatever mode it is already in, so a blocking
+    socket blocks on each read for no longer than its own timeout. For
+    connections, this is the read timeout, set once when connecting.
+
     NOTE: not all socket methods are implemented yet
     """
 
@@ -207,45 +415,37 @@ class BufferedSocket:
         min_end = self.w_pos + min_bytes
         end = len(self.buffer)
         view = memoryview(self.buffer)
-        self.socket.setblocking(0)
+        recv_into = self.socket.recv_into
         while self.w_pos < min_end:
-            ready_to_read, _, _ = select([self.socket], [], [])
-            subview = view[self.w_pos:end]
-            n = self.socket.recv_into(subview, end - self.w_pos)
+            # Read as much as is available and fits in the buffer,
+            # which may well be more than the minimum required
+            n = recv_into(view[self.w_pos:end], end - self.w_pos)
             if n == 0:
                 raise OSError("No data")
             self.w_pos += n
 
-    def recv_into(self, buffer, n_bytes=0, flags=0):
-        """ Intercepts a regular socket.recv_into call, taking data from the
-        internal buffer, if available. If not enough data exists in the buffer,
-        more will be retrieved first.
-
-        Unlike the lower-level call, this method will never return 0, instead
-        raising an OSError if no data is returned on the underlying socket.
-
-        :param buffer:
-        :param n_bytes:
-        :param flags:
-        :raises OSError:
-        :return:
+    def fill(self, n_bytes):
+        """ Make sure that at least `n_bytes` bytes of unread data are
+        held in the buffer, reading from the socket if necessary. The
+        unread data can then be accessed directly, starting at
+        position `r_pos` of `buffer`.
         """
-        available = self.w_pos - self.r_pos
-        required = n_bytes - available
+        required = n_bytes - (self.w_pos - self.r_pos)
         if required > 0:
             self._fill_buffer(required)
-        view = memoryview(self.buffer)
-        end = self.r_pos + n_bytes
-        buffer[:] = view[self.r_pos:end]
-        self.r_pos = end
-        return n_bytes
 
 
 class Inbox:
 
-    def __init__(self, s, on_error):
+    #: Whether RECORD messages should be left encoded, to be
+    #: decoded on demand (see :class:`neo4j.data.LazyRecord`)
+    lazy_records = False
+
+    def __init__(self, s, on_error, numeric_arrays=False, string_cache=None):
         super(Inbox, self).__init__()
         self.on_error = on_error
+        self.numeric_arrays = numeric_arrays
+        self.string_cache = string_cache
         self._messages = self._yield_messages(s)
 
     def __iter__(self):
@@ -255,36 +455,80 @@ class Inbox:
         return next(self._messages)
 
     @classmethod
-    def _load_chunks(cls, sock, buffer):
-        chunk_size = 0
+    def _load_message(cls, sock, in_place, stitched):
+        """ Receive a whole chunked message from a
+        :class:`.BufferedSocket`, returning the buffer that holds it.
+
+        A message that arrives in a single chunk is left where it is
+        in the receive buffer, and `in_place` is pointed at it. Only
+        a message that spans several chunks is copied, chunk by chunk,
+        into `stitched`.
+        """
         while True:
-            if chunk_size == 0:
-                buffer.receive(sock, 2)
-            chunk_size = buffer.pop_u16()
-            if chunk_size > 0:
-                buffer.receive(sock, chunk_size + 2)
-            yield chunk_size
+            sock.fill(2)
+            data, r_pos = sock.buffer, sock.r_pos
+            chunk_size = 0x100 * data[r_pos] + data[r_pos + 1]
+            if chunk_size:
+                break
+            # Skip empty chunks between messages
+            sock.r_pos = r_pos + 2
+        # Include the header that follows the chunk, which is empty
+        # if the message ends there
+        sock.fill(chunk_size + 4)
+        data = sock.buffer
+        start = sock.r_pos + 2
+        end = start + chunk_size
+        if data[end] == 0 and data[end + 1] == 0:
+            in_place.data = data
+            in_place.p = start
+            in_place.used = end
+            sock.r_pos = end + 2
+            return in_place
+        stitched.reset()
+        while chunk_size:
+            stitched.extend(memoryview(data)[start:end])
+            sock.r_pos = end
+            sock.fill(2)
+            data, r_pos = sock.buffer, sock.r_pos
+            chunk_size = 0x100 * data[r_pos] + data[r_pos + 1]
+            sock.fill(chunk_size + 2)
+            data = sock.buffer
+            start = sock.r_pos + 2
+            end = start + chunk_size
+        sock.r_pos = end
+        return stitched
 
     def _yield_messages(self, sock):
         try:
-            buffer = UnpackableBuffer()
-            chunk_loader = self._load_chunks(sock, buffer)
-            unpacker = Unpacker(buffer)
+            in_place = UnpackableBuffer(b"")
+            in_place_unpacker = Unpacker(in_place, numeric_arrays=self.numeric_arrays,
+                                         string_cache=self.string_cache)
+            stitched = UnpackableBuffer()
+            stitched_unpacker = Unpacker(stitched, numeric_arrays=self.numeric_arrays,
+                                         string_cache=self.string_cache)
             details = []
             while True:
-                unpacker.reset()
                 details[:] = ()
-                chunk_size = -1
-                while chunk_size != 0:
-                    chunk_size = next(chunk_loader)
+                buffer = self._load_message(sock, in_place, stitched)
+                if buffer is in_place:
+                    unpacker = in_place_unpacker
+                else:
+                    unpacker = stitched_unpacker
                 summary_signature = None
                 summary_metadata = None
                 size, signature = unpacker.unpack_structure_header()
                 if size > 1:
                     raise ProtocolError("Expected one field")
                 if signature == b"\x71":
-                    data = unpacker.unpack()
-                    details.append(data)
+                    if self.lazy_records:
+                        # Keep a copy of the encoded values, with an
+                        # unpacker ready to decode them later
+                        data = UnpackableBuffer(memoryview(buffer.data)[buffer.p:buffer.used])
+                        details.append(Unpacker(data, numeric_arrays=self.numeric_arrays,
+                                                   string_cache=self.string_cache))
+                    else:
+                        data = unpacker.unpack()
+                        details.append(data)
                 else:
                     summary_signature = signature
                     summary_metadata = unpacker.unpack_map()
@@ -311,6 +555,9 @@ class Connection:
 
     in_use = False
 
+    #: Time at which this connection was last returned to the pool
+    idle_since = None
+
     _closed = False
 
     _defunct = False
@@ -318,6 +565,18 @@ class Connection:
     #: The pool of which this connection is a member
     pool = None
 
+    #: Whether a liveness check is under way on this connection
+    _checking_liveness = False
+
+    #: Cache of decoded strings for this connection, if enabled
+    string_cache = None
+
+    #: Cache of encoded RUN messages for this connection, if enabled
+    run_cache = None
+
+    #: Durations, in seconds, of the steps taken to open this connection
+    timings = None
+
     #: Error class used for raising connection errors
     # TODO: separate errors for connector API
     Error = ServiceUnavailable
@@ -337,10 +596,37 @@ class Connection:
         self.unresolved_address = unresolved_address
         self.socket = sock
         self.server = ServerInfo(Address(sock.getpeername()), protocol_version)
-        self.outbox = Outbox()
-        self.inbox = Inbox(BufferedSocket(self.socket, 32768), on_error=self._set_defunct)
+        # The local port is looked up once, rather than for every
+        # message logged, as it cannot change
+        try:
+            self.local_port = sock.getsockname()[1]
+        except IOError:
+            self.local_port = 0
+        max_chunk_size = config.get("max_chunk_size", DEFAULT_MAX_CHUNK_SIZE)
+        if max_chunk_size == "auto":
+            max_chunk_size = auto_chunk_size(sock)
+        elif not 0 < max_chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError("Maximum chunk size must be between 1 and "
+                             "{}, not {!r}".format(MAX_CHUNK_SIZE, max_chunk_size))
+        # Parts of a streamed message flushed before it is complete go
+        # through the same error handling as messages sent in full
+        self.outbox = Outbox(max_chunk_size, sink=self._send_buffers)
+        string_cache_size = config.get("string_cache_size", DEFAULT_STRING_CACHE_SIZE)
+        if string_cache_size:
+            self.string_cache = StringCache(string_cache_size)
+        else:
+            self.string_cache = None
+        read_buffer_size = config.get("read_buffer_size", DEFAULT_READ_BUFFER_SIZE)
+        self.inbox = Inbox(BufferedSocket(self.socket, read_buffer_size), on_error=self._set_defunct,
+                           numeric_arrays=config.get("numeric_arrays", DEFAULT_NUMERIC_ARRAYS),
+                           string_cache=self.string_cache)
         self.packer = Packer(self.outbox)
         self.unpacker = Unpacker(self.inbox)
+        run_cache_size = config.get("run_cache_size", DEFAULT_RUN_CACHE_SIZE)
+        if run_cache_size:
+            self.run_cache = RunCache(run_cache_size)
+        else:
+            self.run_cache = None
         self.responses = deque()
         self._max_connection_lifetime = config.get("max_connection_lifetime", DEFAULT_MAX_CONNECTION_LIFETIME)
         self._creation_timestamp = perf_counter()
@@ -381,14 +667,33 @@ class Connection:
     def secure(self):
         return isinstance(self.socket, SSLSocket)
 
-    @property
-    def local_port(self):
-        try:
-            return self.socket.getsockname()[1]
-        except IOError:
-            return 0
+    def socket_options(self):
+        """ Return the effective values of the configurable socket
+        options, as read back from the socket and keyed by setting
+        name. Options not available on this platform are omitted.
+        Note that the system may adjust the values requested; Linux,
+        for example, doubles buffer sizes to allow for overhead.
+        """
+        options = {}
+        for key, _, level, name, _, decode in SOCKET_OPTIONS:
+            option = getattr(socket_module, name, None)
+            if option is None:
+                continue
+            try:
+                options[key] = decode(self.socket.getsockopt(level, option))
+            except OSError:
+                pass
+        return options
+
+    def hello(self, pipelined=False):
+        """ Add a HELLO message to the outgoing queue and, unless
+        pipelined, send it and wait for the response.
 
-    def hello(self):
+        A pipelined HELLO is sent along with the first request made on
+        the connection, saving a round trip. Any failure to initialise
+        the connection, such as an authentication error, is then raised
+        when the first response is fetched.
+        """
         headers = {"user_agent": self.user_agent}
         headers.update(self.auth_dict)
         logged_headers = dict(headers)
@@ -397,8 +702,9 @@ class Connection:
         log.debug("[#%04X]  C: HELLO %r", self.local_port, logged_headers)
         self._append(b"\x01", (headers,),
                      response=InitResponse(self, on_success=self.server.metadata.update))
-        self.send_all()
-        self.fetch_all()
+        if not pipelined:
+            self.send_all()
+            self.fetch_all()
 
     def __del__(self):
         try:
@@ -434,19 +740,28 @@ class Connection:
             except TypeError:
                 raise TypeError("Timeout must be specified as a number of seconds")
         fields = (statement, parameters, extra)
-        log.debug("[#%04X]  C: RUN %s", self.local_port, " ".join(map(repr, fields)))
+        if log.isEnabledFor(DEBUG):
+            log.debug("[#%04X]  C: RUN %s", self.local_port, " ".join(map(repr, fields)))
         if statement.upper() == u"COMMIT":
-            self._append(b"\x10", fields, CommitResponse(self, **handlers))
+            response = CommitResponse(self, **handlers)
         else:
-            self._append(b"\x10", fields, Response(self, **handlers))
+            response = Response(self, **handlers)
+        if self.run_cache is None or "tx_metadata" in extra:
+            # Arbitrary metadata is not a practical cache key
+            self._append(b"\x10", fields, response)
+        else:
+            key = (statement, extra.get("mode"), tuple(extra.get("bookmarks", ())),
+                   extra.get("tx_timeout"))
+            head, tail = self.run_cache.encode(key, statement, extra)
+            self._append_message(response, self.packer.pack_spliced, head, parameters, tail)
 
     def discard_all(self, **handlers):
         log.debug("[#%04X]  C: DISCARD_ALL", self.local_port)
         self._append(b"\x2F", (), Response(self, **handlers))
 
-    def pull_all(self, **handlers):
+    def pull_all(self, lazy_records=False, **handlers):
         log.debug("[#%04X]  C: PULL_ALL", self.local_port)
-        self._append(b"\x3F", (), Response(self, **handlers))
+        self._append(b"\x3F", (), Response(self, lazy_records=lazy_records, **handlers))
 
     def begin(self, mode=None, bookmarks=None, metadata=None, timeout=None, **handlers):
         extra = {}
@@ -485,9 +800,24 @@ class Connection:
         :arg fields: the fields of the message as a tuple
         :arg response: a response object to handle callbacks
         """
-        self.packer.pack_struct(signature, fields)
-        self.outbox.chunk()
-        self.outbox.chunk()
+        self._append_message(response, self.packer.pack_struct, signature, fields)
+
+    def _append_message(self, response, pack, *args):
+        """ Add a message to the outgoing queue, encoded by calling a
+        packing function with the arguments given.
+        """
+        mark = self.outbox.mark()
+        try:
+            pack(*args)
+        except Exception:
+            if not self.outbox.rewind(mark):
+                # Part of the message has already been sent to the
+                # server, which would wait indefinitely for the rest.
+                # The connection therefore cannot be used again.
+                self._defunct = True
+                self.close()
+            raise
+        self.outbox.end_message()
         self.responses.append(response)
 
     def reset(self):
@@ -503,10 +833,53 @@ class Connection:
         self.send_all()
         self.fetch_all()
 
+    def check_liveness(self, timeout=None):
+        """ Check that the server can still be reached over this
+        connection, by a RESET round trip completed within a given
+        time. A connection that fails the check is closed. Any error
+        raised during the check, such as a failure reported for a HELLO
+        still queued on the connection, counts as a failed check.
+
+        The connection is detached from its pool during the check, so
+        that a failure closes this connection alone, rather than
+        deactivating its address and every idle connection to it.
+
+        :return: :const:`True` if the server replied, :const:`False`
+                 otherwise
+        """
+        previous_timeout = self.socket.gettimeout()
+        pool, self.pool = self.pool, None
+        self._checking_liveness = True
+        try:
+            self.socket.settimeout(timeout)
+            self.reset()
+        except Exception as error:
+            log.debug("[#%04X]  C: <LIVENESS CHECK FAILED> %s", self.local_port, error)
+            # The reply may be partly read, or still to come
+            self._defunct = True
+            self.close()
+            return False
+        else:
+            self.socket.settimeout(previous_timeout)
+            return True
+        finally:
+            self._checking_liveness = False
+            self.pool = pool
+
+    def _log_failure(self, message):
+        """ Log a failure to read from or write to the server. This is
+        an error unless found by a liveness check, where failure is
+        expected from time to time and handled by the pool.
+        """
+        if self._checking_liveness:
+            log.debug("[#%04X]  %s", self.local_port, message)
+        else:
+            log.error(message)
+
     def _send_all(self):
-        data = self.outbox.view()
-        if data:
-            self.socket.sendall(data)
+        buffers = self.outbox.buffers()
+        if buffers:
+            send_buffers(self.socket, buffers)
             self.outbox.clear()
 
     def send_all(self):
@@ -520,14 +893,23 @@ class Connection:
             raise self.Error("Failed to write to defunct connection "
                              "{!r} ({!r})".format(self.unresolved_address,
                                                   self.server.address))
+        buffers = self.outbox.buffers()
+        if buffers:
+            self._send_buffers(buffers)
+            self.outbox.clear()
+
+    def _send_buffers(self, buffers):
+        """ Send buffers to the server, deactivating this connection's
+        address in the pool if the socket fails.
+        """
         try:
-            self._send_all()
+            send_buffers(self.socket, buffers)
         except (IOError, OSError) as error:
-            log.error("Failed to write data to connection "
-                      "{!r} ({!r}); ({!r})".
-                      format(self.unresolved_address,
-                             self.server.address,
-                             "; ".join(map(repr, error.args))))
+            self._log_failure("Failed to write data to connection "
+                              "{!r} ({!r}); ({!r})".
+                              format(self.unresolved_address,
+                                     self.server.address,
+                                     "; ".join(map(repr, error.args))))
             if self.pool:
                 self.pool.deactivate(self.unresolved_address)
             raise
@@ -550,14 +932,15 @@ class Connection:
             return 0, 0
 
         # Receive exactly one message
+        self.inbox.lazy_records = self.responses[0].lazy_records
         try:
             details, summary_signature, summary_metadata = next(self.inbox)
         except (IOError, OSError) as error:
-            log.error("Failed to read data from connection "
-                      "{!r} ({!r}); ({!r})".
-                      format(self.unresolved_address,
-                             self.server.address,
-                             "; ".join(map(repr, error.args))))
+            self._log_failure("Failed to read data from connection "
+                              "{!r} ({!r}); ({!r})".
+                              format(self.unresolved_address,
+                                     self.server.address,
+                                     "; ".join(map(repr, error.args))))
             if self.pool:
                 self.pool.deactivate(self.unresolved_address)
             raise
@@ -599,7 +982,7 @@ class Connection:
         message = ("Failed to read from defunct connection " 
                    "{!r} ({!r})".format(self.unresolved_address,
                                         self.server.address))
-        log.error(message)
+        self._log_failure(message)
         # We were attempting to receive data but the connection
         # has unexpectedly terminated. So, we need to close the
         # connection from the client side, and remove the address
@@ -659,6 +1042,16 @@ class Connection:
     def defunct(self):
         return self._defunct
 
+    def release(self):
+        """ Release this connection back into the pool from which it
+        was acquired, or, if it has no pool, simply mark it as no
+        longer in use.
+        """
+        if self.pool is None:
+            self.in_use = False
+        else:
+            self.pool.release(self)
+
 
 class AbstractConnectionPool:
     """ A collection of connections to one or more server addresses.
@@ -668,11 +1061,35 @@ class AbstractConnectionPool:
 
     def __init__(self, connector, **config):
         self.connector = connector
+        # All connections to each address, whether idle or in use
         self.connections = {}
+        # Idle connections to each address, as a stack, so that the
+        # most recently used connection is the first to be reused
+        self.idle_connections = {}
+        # Number of connections to each address currently being opened,
+        # counted against the maximum pool size
+        self.reservations = {}
+        # Guards the tables of per-address state, never held while
+        # waiting for or opening a connection
         self.lock = RLock()
-        self.cond = Condition(self.lock)
+        # One lock per address, guarding the connections to that
+        # address, so that work on one address does not block another
+        self.locks = {}
+        # One condition per address, sharing the address lock, so that
+        # a release wakes a thread waiting for that address only
+        self.conditions = {}
         self._max_connection_pool_size = config.get("max_connection_pool_size", DEFAULT_MAX_CONNECTION_POOL_SIZE)
         self._connection_acquisition_timeout = config.get("connection_acquisition_timeout", DEFAULT_CONNECTION_ACQUISITION_TIMEOUT)
+        self._min_idle_connections = config.get("min_idle_connections", DEFAULT_MIN_IDLE_CONNECTIONS)
+        self._max_idle_time = config.get("max_idle_time", DEFAULT_MAX_IDLE_TIME)
+        self._maintenance_interval = config.get("maintenance_interval", DEFAULT_MAINTENANCE_INTERVAL)
+        self._liveness_check_timeout = config.get("liveness_check_timeout", DEFAULT_LIVENESS_CHECK_TIMEOUT)
+        self._connection_timeout = config.get("connection_timeout", DEFAULT_CONNECTION_TIMEOUT)
+        # Number, failures and total duration in seconds of the
+        # liveness checks carried out before handing out connections
+        self.liveness_check_metrics = {"checks": 0, "failures": 0, "duration": 0.0}
+        self._maintenance = None
+        self._closing = Event()
 
     def __enter__(self):
         return self
@@ -685,53 +1102,141 @@ class AbstractConnectionPool:
         The address supplied should always be an IP address, not
         a host name.
 
+        New connections are opened without holding any lock, so that
+        a slow server only holds up threads waiting for that server.
+
+        Idle connections unused for longer than the liveness check
+        timeout are checked before being handed out.
+
         This method is thread safe.
         """
         if self.closed():
             raise ServiceUnavailable("Connection pool closed")
-        with self.lock:
-            try:
-                connections = self.connections[address]
-            except KeyError:
-                connections = self.connections[address] = deque()
-
-            connection_acquisition_start_timestamp = perf_counter()
-            while True:
-                # try to find a free connection in pool
-                for connection in list(connections):
-                    if connection.closed() or connection.defunct() or connection.timedout():
-                        connections.remove(connection)
-                        continue
-                    if not connection.in_use:
+        condition = self._condition(address)
+        connection_acquisition_start_timestamp = perf_counter()
+        while True:
+            connection = None
+            with condition:
+                while True:
+                    if self._closed:
+                        raise ServiceUnavailable("Connection pool closed")
+                    # The address may have been removed while waiting
+                    connections, idle = self._entries(address)
+                    # Take the most recently used idle connection, checking
+                    # only that one, and discarding it if no longer usable
+                    while idle:
+                        connection = idle.pop()
+                        if connection.closed() or connection.defunct() or connection.timedout():
+                            self._discard(address, connection)
+                            connection = None
+                            continue
                         connection.in_use = True
-                        return connection
-                # all connections in pool are in-use
-                infinite_connection_pool = (self._max_connection_pool_size < 0 or
-                                            self._max_connection_pool_size == float("inf"))
-                can_create_new_connection = infinite_connection_pool or len(connections) < self._max_connection_pool_size
-                if can_create_new_connection:
-                    try:
-                        connection = self.connector(address)
-                    except ServiceUnavailable:
-                        self.remove(address)
-                        raise
+                        if not self._idle_too_long_to_trust(connection):
+                            return connection
+                        break
+                    if connection is not None:
+                        # Check the connection outside the lock
+                        break
+                    # all connections in pool are in-use
+                    reserved = self.reservations.get(address, 0)
+                    if self._has_room(len(connections) + reserved):
+                        # Hold a place in the pool for the new connection
+                        self.reservations[address] = reserved + 1
+                        break
+
+                    # failed to obtain a connection from pool because the pool is full and no free connection in the pool
+                    span_timeout = self._connection_acquisition_timeout - (perf_counter() - connection_acquisition_start_timestamp)
+                    if span_timeout > 0:
+                        # Look again whether woken or timed out, as a
+                        # connection released just as the wait times out
+                        # would otherwise be left idle while others wait
+                        condition.wait(span_timeout)
                     else:
-                        connection.pool = self
-                        connection.in_use = True
-                        connections.append(connection)
-                        return connection
-
-                # failed to obtain a connection from pool because the pool is full and no free connection in the pool
-                span_timeout = self._connection_acquisition_timeout - (perf_counter() - connection_acquisition_start_timestamp)
-                if span_timeout > 0:
-                    self.cond.wait(span_timeout)
-                    # if timed out, then we throw error. This time computation is needed, as with python 2.7, we cannot
-                    # tell if the condition is notified or timed out when we come to this line
-                    if self._connection_acquisition_timeout <= (perf_counter() - connection_acquisition_start_timestamp):
-                        raise ClientError("Failed to obtain a connection from pool within {!r}s".format(
-                            self._connection_acquisition_timeout))
-                else:
-                    raise ClientError("Failed to obtain a connection from pool within {!r}s".format(self._connection_acquisition_timeout))
+                        raise ClientError("Failed to obtain a connection from pool within {!r}s".format(self._connection_acquisition_timeout))
+
+            if connection is None:
+                return self._open(address, in_use=True)
+            if self._check_liveness(address, connection):
+                return connection
+
+    def _idle_too_long_to_trust(self, connection):
+        """ Return :const:`True` if a connection has been idle for long
+        enough that it must pass a liveness check before being used.
+        """
+        return (connection.idle_since is not None and
+                0 <= self._liveness_check_timeout <= perf_counter() - connection.idle_since)
+
+    def _check_liveness(self, address, connection):
+        """ Check a connection that has been taken from the pool, but
+        not yet handed out, discarding it if the check fails. If the
+        check raises an error, the connection is discarded all the same
+        before the error is raised again, so that it does not keep its
+        place in the pool.
+        """
+        t0 = perf_counter()
+        alive = False
+        try:
+            alive = connection.check_liveness(self._connection_timeout)
+        finally:
+            duration = perf_counter() - t0
+            with self.lock:
+                metrics = self.liveness_check_metrics
+                metrics["checks"] += 1
+                metrics["duration"] += duration
+                if not alive:
+                    metrics["failures"] += 1
+            if not alive:
+                condition = self._condition(address)
+                with condition:
+                    connection.in_use = False
+                    self._discard(address, connection)
+                    # Wake every waiter, as one woken alone might time out
+                    # or fail to connect without passing the wakeup on
+                    condition.notify_all()
+        return alive
+
+    def _open(self, address, in_use):
+        """ Open a new connection to a given address, for which a place
+        has already been reserved, and add it to the pool. The new
+        connection is opened without holding the address lock.
+        """
+        condition = self._condition(address)
+        try:
+            connection = self.connector(address)
+        except ServiceUnavailable:
+            self._cancel_reservation(address)
+            # A failure to top up idle connections in the background
+            # must not close connections that are in use, so only a
+            # caller that needs a connection now removes the address
+            if in_use:
+                self.remove(address)
+            raise
+        except Exception:
+            self._cancel_reservation(address)
+            raise
+        with condition:
+            self._end_reservation(address)
+            if self._closed:
+                connection.close()
+                raise ServiceUnavailable("Connection pool closed")
+            connection.pool = self
+            connection.in_use = in_use
+            connections, idle = self._entries(address)
+            connections.append(connection)
+            if not in_use:
+                connection.idle_since = perf_counter()
+                idle.append(connection)
+                condition.notify()
+            return connection
+
+    def _has_room(self, size):
+        """ Return :const:`True` if another connection can be added to
+        an address that has a given number of connections, including
+        those being opened, or :const:`False` otherwise.
+        """
+        if self._max_connection_pool_size < 0 or self._max_connection_pool_size == float("inf"):
+            return True
+        return size < self._max_connection_pool_size
 
     def acquire(self, access_mode=None):
         """ Acquire a connection to a server that can satisfy a set of parameters.
@@ -739,54 +1244,252 @@ class AbstractConnectionPool:
         :param access_mode:
         """
 
+    def targets(self):
+        """ Return the addresses for which idle connections are kept
+        ready by :meth:`.maintain`.
+        """
+        with self.lock:
+            return list(self.connections)
+
+    def warm_up(self, min_idle_connections=None):
+        """ Open connections to each target address until it has a
+        given number of idle connections. This defaults to the minimum
+        number of idle connections configured, or one connection per
+        address if no minimum is configured.
+        """
+        if min_idle_connections is None:
+            min_idle_connections = max(self._min_idle_connections, 1)
+        self.maintain(min_idle_connections)
+
+    def maintain(self, min_idle_connections=None):
+        """ Close idle connections that are no longer usable or that
+        have outlived the maximum connection lifetime, and those idle
+        for longer than the maximum idle time while the address has
+        more than the minimum number of idle connections. Then open
+        connections to each target address until it has the minimum
+        number of idle connections.
+
+        Addresses that cannot be connected to are skipped. This method
+        is thread safe.
+        """
+        if min_idle_connections is None:
+            min_idle_connections = self._min_idle_connections
+        with self.lock:
+            addresses = list(self.idle_connections)
+        for address in addresses:
+            self._evict(address, min_idle_connections)
+        if min_idle_connections > 0:
+            for address in self.targets():
+                try:
+                    self._top_up(address, min_idle_connections)
+                except ServiceUnavailable as error:
+                    log.debug("Unable to open idle connection to %s: %s", address, error)
+
+    def _evict(self, address, min_idle_connections):
+        """ Close unusable, expired and surplus long idle connections
+        to a given address.
+        """
+        condition = self._condition(address)
+        with condition:
+            idle = self.idle_connections.get(address)
+            if not idle:
+                return
+            now = perf_counter()
+            usable = []
+            # The stack holds the longest idle connections at the bottom
+            for connection in idle:
+                if connection.closed() or connection.defunct() or connection.timedout():
+                    self._discard(address, connection)
+                else:
+                    usable.append(connection)
+            surplus = len(usable) - min_idle_connections
+            while surplus > 0 and self._idle_too_long(usable[0], now):
+                self._discard(address, usable.pop(0))
+                surplus -= 1
+            if len(usable) < len(idle):
+                idle[:] = usable
+                # Room has been made for new connections
+                condition.notify_all()
+
+    def _idle_too_long(self, connection, now):
+        return (connection.idle_since is not None and
+                0 <= self._max_idle_time <= now - connection.idle_since)
+
+    def _top_up(self, address, min_idle_connections):
+        """ Open connections to a given address, one at a time, until it
+        has a given number of idle connections or the pool is full.
+        """
+        condition = self._condition(address)
+        while True:
+            with condition:
+                if self._closed:
+                    return
+                connections, idle = self._entries(address)
+                reserved = self.reservations.get(address, 0)
+                if len(idle) >= min_idle_connections or not self._has_room(len(connections) + reserved):
+                    return
+                self.reservations[address] = reserved + 1
+            self._open(address, in_use=False)
+
+    def start_maintenance(self):
+        """ Start a background thread that calls :meth:`.maintain` at
+        regular intervals until the pool is closed. The thread is only
+        started if a minimum number of idle connections or a maximum
+        idle time is configured.
+        """
+        if self._maintenance is not None or self._closed:
+            return
+        if self._min_idle_connections <= 0 and self._max_idle_time < 0:
+            return
+        self._maintenance = Thread(target=self._maintain_until_closed,
+                                   name="neo4j.pool.maintenance")
+        self._maintenance.daemon = True
+        self._maintenance.start()
+
+    def _maintain_until_closed(self):
+        while not self._closing.wait(self._maintenance_interval):
+            try:
+                self.maintain()
+            except Exception as error:
+                log.debug("Connection pool maintenance failed: %s", error)
+
+    def _condition(self, address):
+        """ Return the condition on which threads wait for a connection
+        to a given address. Conditions, like the address locks they
+        use, are never discarded, as threads may still be waiting on
+        one after its address is removed.
+        """
+        with self.lock:
+            try:
+                return self.conditions[address]
+            except KeyError:
+                lock = self.locks[address] = RLock()
+                condition = self.conditions[address] = Condition(lock)
+                return condition
+
+    def _entries(self, address):
+        """ Return the connections and idle connections to a given
+        address, creating both if necessary. The address lock must
+        be held.
+        """
+        with self.lock:
+            try:
+                return self.connections[address], self.idle_connections[address]
+            except KeyError:
+                connections = self.connections[address] = deque()
+                idle = self.idle_connections[address] = []
+                return connections, idle
+
+    def _end_reservation(self, address):
+        """ Remove a place held in the pool for a new connection to a
+        given address. The address lock must be held.
+        """
+        reserved = self.reservations.pop(address, 0) - 1
+        if reserved > 0:
+            self.reservations[address] = reserved
+
+    def _cancel_reservation(self, address):
+        """ Give up a place held in the pool for a new connection to a
+        given address that could not be opened, waking all threads
+        waiting for that address. A single thread woken alone might
+        itself time out or fail to connect, and the wakeup would then
+        be lost.
+        """
+        condition = self._condition(address)
+        with condition:
+            self._end_reservation(address)
+            condition.notify_all()
+
     def release(self, connection):
-        """ Release a connection back into the pool.
+        """ Release a connection back into the pool, waking one thread
+        waiting for a connection to the same address, if any. Every
+        connection acquired from the pool must be returned through
+        this method.
         This method is thread safe.
         """
-        with self.lock:
+        if not connection.in_use:
+            return
+        address = connection.unresolved_address
+        condition = self._condition(address)
+        with condition:
+            if not connection.in_use:
+                return
             connection.in_use = False
-            self.cond.notify_all()
+            if connection.pool is not self:
+                # Removed from the pool while in use
+                return
+            if connection.closed() or connection.defunct():
+                self._discard(address, connection)
+            else:
+                connection.idle_since = perf_counter()
+                self.idle_connections[address].append(connection)
+            condition.notify()
+
+    def _discard(self, address, connection):
+        """ Remove a connection from the pool and close it. The address
+        lock must be held.
+        """
+        try:
+            self.connections[address].remove(connection)
+        except (KeyError, ValueError):
+            pass
+        connection.pool = None
+        try:
+            connection.close()
+        except IOError:
+            pass
 
     def in_use_connection_count(self, address):
         """ Count the number of connections currently in use to a given
-        address.
+        address, including those being opened.
         """
+        reserved = self.reservations.get(address, 0)
         try:
             connections = self.connections[address]
         except KeyError:
-            return 0
+            return reserved
         else:
-            return sum(1 if connection.in_use else 0 for connection in connections)
+            return len(connections) - len(self.idle_connections.get(address, ())) + reserved
 
     def deactivate(self, address):
         """ Deactivate an address from the connection pool, if present, closing
         all idle connection to that address
         """
-        with self.lock:
+        condition = self._condition(address)
+        with condition:
             try:
                 connections = self.connections[address]
             except KeyError: # already removed from the connection pool
                 return
-            for conn in list(connections):
-                if not conn.in_use:
-                    connections.remove(conn)
-                    try:
-                        conn.close()
-                    except IOError:
-                        pass
+            idle = self.idle_connections.get(address, [])
+            while idle:
+                self._discard(address, idle.pop())
             if not connections:
                 self.remove(address)
+            else:
+                # Room has been made for new connections
+                condition.notify_all()
 
     def remove(self, address):
         """ Remove an address from the connection pool, if present, closing
         all connections to that address.
         """
-        with self.lock:
-            for connection in self.connections.pop(address, ()):
+        condition = self._condition(address)
+        with condition:
+            with self.lock:
+                self.idle_connections.pop(address, None)
+                connections = self.connections.pop(address, ())
+            for connection in connections:
+                # Connections still in use are released later, but are
+                # no longer returned to the pool
+                connection.pool = None
                 try:
                     connection.close()
                 except IOError:
                     pass
+            # Wake all waiting threads, so that they can open new
+            # connections or, if the pool is closed, give up
+            condition.notify_all()
 
     def close(self):
         """ Close all connections and empty the pool.
@@ -796,10 +1499,17 @@ class AbstractConnectionPool:
             return
         try:
             with self.lock:
-                if not self._closed:
-                    self._closed = True
-                    for address in list(self.connections):
-                        self.remove(address)
+                if self._closed:
+                    return
+                self._closed = True
+                self._closing.set()
+                # Include addresses without connections, as threads
+                # may be waiting for a connection to one being opened
+                addresses = list(self.conditions)
+            # Address locks are taken outside the pool lock, in the
+            # same order as everywhere else
+            for address in addresses:
+                self.remove(address)
         except TypeError as e:
             pass
 
@@ -820,60 +1530,76 @@ class ConnectionPool(AbstractConnectionPool):
     def acquire(self, access_mode=None):
         return self.acquire_direct(self.address)
 
+    def targets(self):
+        return [self.address]
+
 
 class Response:
     """ Subscriber object for a full response (zero or
     more detail messages followed by one summary message).
+
+    Each handler is held in a slot of its own, or :const:`None` if
+    not given, so that dispatching a message costs no more than an
+    attribute lookup.
     """
 
-    def __init__(self, connection, **handlers):
+    __slots__ = ("connection", "lazy_records", "complete", "_on_records",
+                 "_on_success", "_on_failure", "_on_ignored", "_on_summary")
+
+    def __init__(self, connection, lazy_records=False, on_records=None, on_success=None,
+                 on_failure=None, on_ignored=None, on_summary=None):
         self.connection = connection
-        self.handlers = handlers
+        self.lazy_records = lazy_records
         self.complete = False
+        self._on_records = on_records
+        self._on_success = on_success
+        self._on_failure = on_failure
+        self._on_ignored = on_ignored
+        self._on_summary = on_summary
 
     def on_records(self, records):
         """ Called when one or more RECORD messages have been received.
         """
-        handler = self.handlers.get("on_records")
-        if callable(handler):
-            handler(records)
+        if self._on_records is not None:
+            self._on_records(records)
 
     def on_success(self, metadata):
         """ Called when a SUCCESS message has been received.
         """
-        handler = self.handlers.get("on_success")
-        if callable(handler):
-            handler(metadata)
-        handler = self.handlers.get("on_summary")
-        if callable(handler):
-            handler()
+        if self._on_success is not None:
+            self._on_success(metadata)
+        if self._on_summary is not None:
+            self._on_summary()
 
     def on_failure(self, metadata):
         """ Called when a FAILURE message has been received.
         """
         self.connection.reset()
-        handler = self.handlers.get("on_failure")
-        if callable(handler):
-            handler(metadata)
-        handler = self.handlers.get("on_summary")
-        if callable(handler):
-            handler()
+        if self._on_failure is not None:
+            self._on_failure(metadata)
+        if self._on_summary is not None:
+            self._on_summary()
         raise CypherError.hydrate(**metadata)
 
     def on_ignored(self, metadata=None):
         """ Called when an IGNORED message has been received.
         """
-        handler = self.handlers.get("on_ignored")
-        if callable(handler):
-            handler(metadata)
-        handler = self.handlers.get("on_summary")
-        if callable(handler):
-            handler()
+        if self._on_ignored is not None:
+            self._on_ignored(metadata)
+        if self._on_summary is not None:
+            self._on_summary()
 
 
 class InitResponse(Response):
 
+    __slots__ = ()
+
     def on_failure(self, metadata):
+        # The server closes the connection after a failed HELLO, and
+        # any requests pipelined behind it will not be answered, so
+        # the connection cannot be used again.
+        self.connection._defunct = True
+        self.connection.close()
         code = metadata.get("code")
         message = metadata.get("message", "Connection initialisation failed")
         if code == "Neo.ClientError.Security.Unauthorized":
@@ -884,7 +1610,7 @@ class InitResponse(Response):
 
 class CommitResponse(Response):
 
-    pass
+    __slots__ = ()
 
 
 # TODO: remove in 2.0
@@ -916,6 +1642,45 @@ def last_bookmark(bookmarks):
     return last
 
 
+def auto_chunk_size(sock):
+    """ Choose a maximum chunk size to suit a connected socket: the
+    largest whole number of TCP segments that fits within both the
+    socket send buffer and a single chunk, less the chunk header.
+    """
+    tcp_max_segment = getattr(socket_module, "TCP_MAXSEG", None)
+    if tcp_max_segment is None:
+        return DEFAULT_MAX_CHUNK_SIZE
+    try:
+        mss = sock.getsockopt(IPPROTO_TCP, tcp_max_segment)
+        send_buffer_size = sock.getsockopt(SOL_SOCKET, SO_SNDBUF)
+    except OSError:
+        return DEFAULT_MAX_CHUNK_SIZE
+    if mss <= 2:
+        return DEFAULT_MAX_CHUNK_SIZE
+    limit = min(send_buffer_size, 2 + MAX_CHUNK_SIZE)
+    return min(max(limit // mss, 1) * mss - 2, MAX_CHUNK_SIZE)
+
+
+def apply_socket_options(s, **config):
+    """ Set the configurable socket options on a socket, from
+    settings given or their defaults.
+
+    :raise ValueError: if a setting has a value that the socket option
+                       cannot take, naming the setting, so that this is
+                       not mistaken for a failure to reach the server
+    """
+    for key, default, level, name, encode, _ in SOCKET_OPTIONS:
+        option = getattr(socket_module, name, None)
+        value = config.get(key, default)
+        if option is None or value is None:
+            continue
+        try:
+            s.setsockopt(level, option, encode(value))
+        except (OSError, OverflowError, TypeError, ValueError) as error:
+            raise ValueError("Invalid value {!r} for setting {!r} "
+                             "({})".format(value, key, error))
+
+
 def _connect(resolved_address, **config):
     """
 
@@ -935,11 +1700,12 @@ def _connect(resolved_address, **config):
         t = s.gettimeout()
         s.settimeout(config.get("connection_timeout",
                                 DEFAULT_CONNECTION_TIMEOUT))
+        # Options are set before connecting, as buffer sizes affect
+        # the window scaling agreed during the TCP handshake
+        apply_socket_options(s, **config)
         log.debug("[#0000]  C: <OPEN> %s", resolved_address)
         s.connect(resolved_address)
         s.settimeout(t)
-        keep_alive = 1 if config.get("keep_alive", DEFAULT_KEEP_ALIVE) else 0
-        s.setsockopt(SOL_SOCKET, SO_KEEPALIVE, keep_alive)
     except SocketTimeout:
         log.debug("[#0000]  C: <TIMEOUT> %s", resolved_address)
         log.debug("[#0000]  C: <CLOSE> %s", resolved_address)
@@ -953,18 +1719,23 @@ def _connect(resolved_address, **config):
         s.close()
         raise ServiceUnavailable("Failed to establish connection to {!r} "
                                  "(reason {})".format(resolved_address, error))
+    except ValueError:
+        if s:
+            s.close()
+        raise
     else:
         return s
 
 
-def _secure(s, host, ssl_context):
+def _secure(s, host, ssl_context, tls_session=None):
     local_port = s.getsockname()[1]
     # Secure the connection if an SSL context has been provided
     if ssl_context:
         log.debug("[#%04X]  C: <SECURE> %s", local_port, host)
         try:
             sni_host = host if HAS_SNI and host else None
-            s = ssl_context.wrap_socket(s, server_hostname=sni_host)
+            s = ssl_context.wrap_socket(s, server_hostname=sni_host,
+                                        session=tls_session)
         except SSLError as cause:
             s.close()
             error = SecurityError("Failed to establish secure connection "
@@ -978,18 +1749,39 @@ def _secure(s, host, ssl_context):
                 s.close()
                 raise ProtocolError("When using a secure socket, the server "
                                     "should always provide a certificate")
+            if s.session_reused:
+                log.debug("[#%04X]  S: <SECURE> session resumed", local_port)
     else:
         der_encoded_server_certificate = None
     return s, der_encoded_server_certificate
 
 
-def _handshake(s, resolved_address, der_encoded_server_certificate, **config):
+def _time_left(deadline):
+    """ Return the number of seconds left until a deadline, raising a
+    socket timeout if it has already passed.
+    """
+    left = deadline - perf_counter()
+    if left <= 0:
+        raise SocketTimeout("timed out")
+    return left
+
+
+def _handshake(s, resolved_address, der_encoded_server_certificate,
+               deadline=None, timings=None, **config):
     """
 
     :param s:
+    :param deadline: time, as given by perf_counter, by which the
+                     handshake and HELLO must complete, or None for
+                     no limit
+    :param timings: dictionary to which the durations of the handshake
+                    and HELLO are added
     :return:
     """
     local_port = s.getsockname()[1]
+    if timings is None:
+        timings = OrderedDict()
+    t0 = perf_counter()
 
     # Send details of the protocol versions supported
     supported_versions = [3, 0, 0, 0]
@@ -1001,18 +1793,27 @@ def _handshake(s, resolved_address, der_encoded_server_certificate, **config):
     s.sendall(data)
 
     # Handle the handshake response
-    ready_to_read = False
-    while not ready_to_read:
-        ready_to_read, _, _ = select((s,), (), (), 1)
+    data = b""
     try:
-        data = s.recv(4)
+        if deadline is not None:
+            s.settimeout(_time_left(deadline))
+        while len(data) < 4:
+            received = s.recv(4 - len(data))
+            if not received:
+                break
+            data += received
+    except SocketTimeout:
+        log.debug("[#%04X]  S: <TIMEOUT>", local_port)
+        s.close()
+        raise ServiceUnavailable("Timed out waiting for handshake response "
+                                 "from {!r}".format(resolved_address))
     except OSError:
         raise ServiceUnavailable("Failed to read any data from server {!r} "
                                  "after connected".format(resolved_address))
+    timings["handshake"] = perf_counter() - t0
     data_size = len(data)
     if data_size == 0:
-        # If no data is returned after a successful select
-        # response, the server has closed the connection
+        # If no data is returned, the server has closed the connection
         log.debug("[#%04X]  S: <CLOSE>", local_port)
         s.close()
         raise ServiceUnavailable("Connection to %r closed without handshake "
@@ -1030,12 +1831,25 @@ def _handshake(s, resolved_address, der_encoded_server_certificate, **config):
         log.debug("[#%04X]  C: <CLOSE>", local_port)
         s.shutdown(SHUT_RDWR)
         s.close()
+        raise ServiceUnavailable("Server at {!r} supports none of the Bolt protocol "
+                                 "versions offered".format(resolved_address))
     elif agreed_version in (3,):
         connection = Connection(
             agreed_version, resolved_address, s,
             der_encoded_server_certificate=der_encoded_server_certificate,
             **config)
-        connection.hello()
+        if deadline is not None:
+            s.settimeout(_time_left(deadline))
+        if config.get("pipelined_hello", DEFAULT_PIPELINED_HELLO):
+            connection.hello(pipelined=True)
+        else:
+            t1 = perf_counter()
+            connection.hello()
+            timings["hello"] = perf_counter() - t1
+        connection.timings = timings
+        log.debug("[#%04X]  C: <TIMINGS> %s", local_port,
+                  " ".join("%s=%.1fms" % (step, 1000 * duration)
+                           for step, duration in timings.items()))
         return connection
     elif agreed_version == 0x48545450:
         log.debug("[#%04X]  S: <CLOSE>", local_port)
@@ -1049,12 +1863,138 @@ def _handshake(s, resolved_address, der_encoded_server_certificate, **config):
                             "{}".format(agreed_version))
 
 
+def _attempt(address, resolved_address, ssl_context, tls_session_cache=None, **config):
+    """ Connect to a single resolved address, secure the connection
+    and perform a handshake, returning a Connection object. All of
+    this must complete within the connection timeout, and the time
+    taken by each step is recorded on the connection. The socket is
+    then given the read timeout, if any, for the rest of its life.
+
+    If a TLS session cache is given, a session held for the same
+    server is resumed where possible, and the session in use once the
+    connection is established is stored for next time. A session the
+    server declines to resume is discarded straight away. The session is
+    stored only after the handshake and HELLO, as TLS 1.3 servers
+    send session tickets after the TLS handshake itself has finished.
+    """
+    s = None
+    timings = OrderedDict()
+    t0 = perf_counter()
+    deadline = t0 + config.get("connection_timeout", DEFAULT_CONNECTION_TIMEOUT)
+    try:
+        host = address[0]
+        s = _connect(resolved_address, **config)
+        t1 = perf_counter()
+        timings["connect"] = t1 - t0
+        s.settimeout(_time_left(deadline))
+        session_key = (host, resolved_address)
+        tls_session = None
+        if ssl_context and tls_session_cache is not None:
+            tls_session = tls_session_cache.get(session_key)
+        s, der_encoded_server_certificate = _secure(s, host, ssl_context, tls_session)
+        if tls_session is not None and not s.session_reused:
+            # The server would not resume the session, so it is not
+            # offered again, even if this connection goes on to fail
+            tls_session_cache.remove(session_key)
+        if ssl_context:
+            timings["secure"] = perf_counter() - t1
+        connection = _handshake(s, address, der_encoded_server_certificate,
+                                deadline=deadline, timings=timings, **config)
+        # Reads block for no longer than the read timeout from here on,
+        # and a read that times out makes the connection defunct
+        read_timeout = config.get("read_timeout", DEFAULT_READ_TIMEOUT)
+        s.settimeout(read_timeout if read_timeout is not None and read_timeout >= 0 else None)
+        if ssl_context and tls_session_cache is not None:
+            tls_session_cache.put(session_key, s.session)
+        return connection
+    except SocketTimeout:
+        if s:
+            s.close()
+        raise ServiceUnavailable("Timed out trying to establish connection "
+                                 "to {!r}".format(resolved_address))
+    except Exception:
+        if s:
+            s.close()
+        raise
+
+
+def _interleave(addresses):
+    """ Reorder resolved addresses so that IPv6 and IPv4 addresses
+    alternate, starting with the family of the first address, as
+    recommended by RFC 8305.
+    """
+    families = OrderedDict()
+    for address in addresses:
+        families.setdefault(len(address), []).append(address)
+    return [address for address in chain(*zip_longest(*families.values()))
+            if address is not None]
+
+
+def _close_all(results, count):
+    """ Wait for a number of outstanding connection attempts to finish
+    and close any connections that they open.
+    """
+    for _ in range(count):
+        succeeded, value = results.get()
+        if succeeded:
+            value.close()
+
+
+def _race(attempts, delay):
+    """ Run connection attempts in parallel, starting each one after
+    the previous attempt has failed or a delay has passed, whichever
+    comes first. The first connection established is returned, and
+    any others that complete later are closed. If every attempt fails,
+    the last error raised is raised again.
+
+    :param attempts: sequence of functions, each of which opens and
+                     returns a new connection
+    :param delay: seconds to wait for an attempt to finish before
+                  starting the next
+    """
+    results = Queue()
+
+    def run(attempt):
+        try:
+            results.put((True, attempt()))
+        except Exception as error:
+            results.put((False, error))
+
+    pending = deque(attempts)
+    running = 0
+    last_error = None
+    while pending or running:
+        if pending:
+            Thread(target=run, args=(pending.popleft(),), daemon=True).start()
+            running += 1
+        try:
+            succeeded, value = results.get(timeout=(delay if pending else None))
+        except Empty:
+            continue
+        running -= 1
+        if succeeded:
+            if running:
+                Thread(target=_close_all, args=(results, running), daemon=True).start()
+            return value
+        last_error = value
+    raise last_error
+
+
 def connect(address, **config):
     """ Connect and perform a handshake and return a valid Connection object,
     assuming a protocol version can be agreed.
+
+    Where an address resolves to more than one IP address, staggered
+    connection attempts are made in parallel, in the manner of RFC 8305
+    ("Happy Eyeballs"), so that an unreachable address does not hold
+    up the others for the full connection timeout.
     """
-    ssl_context = make_ssl_context(**config)
-    last_error = None
+    # Drivers share one SSL context, and one TLS session cache, across
+    # all of their connections; otherwise a new context is made here
+    if "ssl_context" in config:
+        ssl_context = config.pop("ssl_context")
+    else:
+        ssl_context = make_ssl_context(**config)
     # Establish a connection to the host and port specified
     # Catches refused connections see:
     # https://docs.python.org/2/library/errno.html
@@ -1062,21 +2002,12 @@ def connect(address, **config):
     address_list = AddressList([address])
     address_list.custom_resolve(config.get("resolver"))
     address_list.dns_resolve()
-    for resolved_address in address_list:
-        s = None
-        try:
-            host = address[0]
-            s = _connect(resolved_address, **config)
-            s, der_encoded_server_certificate = _secure(s, host, ssl_context)
-            connection = _handshake(s, address, der_encoded_server_certificate,
-                                    **config)
-        except Exception as error:
-            if s:
-                s.close()
-            last_error = error
-        else:
-            return connection
-    if last_error is None:
+    resolved_addresses = _interleave(address_list)
+    if not resolved_addresses:
         raise ServiceUnavailable("Failed to resolve addresses for %s" % address)
-    else:
-        raise last_error
+    if len(resolved_addresses) == 1:
+        return _attempt(address, resolved_addresses[0], ssl_context, **config)
+    attempts = [partial(_attempt, address, resolved_address, ssl_context, **config)
+                for resolved_address in resolved_addresses]
+    return _race(attempts, config.get("connection_attempt_delay",
+                                      DEFAULT_CONNECTION_ATTEMPT_DELAY))
@@ -245,8 +245,8 @@ class RoutingConnectionPool(AbstractConnectionPool):
                 raise RoutingProtocolError("Routing support broken on server {!r}".format(address))
 
         try:
-            with self.acquire_direct(address) as cx:
-                _, _, server_version = (cx.server.agent or "").partition("/")
+            cx = self.acquire_direct(address)
+            try:
                 log.debug("[#%04X]  C: <ROUTING> query=%r", cx.local_port, self.routing_context or {})
                 cx.run("CALL dbms.cluster.routing.getRoutingTable({context})",
                        {"context": self.routing_context}, on_success=metadata.update, on_failure=fail)
@@ -255,6 +255,13 @@ class RoutingConnectionPool(AbstractConnectionPool):
                 cx.fetch_all()
                 routing_info = [dict(zip(metadata.get("fields", ()), values)) for values in records]
                 log.debug("[#%04X]  S: <ROUTING> info=%r", cx.local_port, routing_info)
+            except Exception:
+                # Replies may be left unread, so the connection is closed
+                # rather than returned to the pool for reuse
+                cx.close()
+                raise
+            finally:
+                self.release(cx)
             return routing_info
         except RoutingProtocolError as error:
             raise ServiceUnavailable(*error.args)
@@ -344,6 +351,9 @@ class RoutingConnectionPool(AbstractConnectionPool):
             if address not in servers:
                 super(RoutingConnectionPool, self).deactivate(address)
 
+    def targets(self):
+        return list(self.routing_table.servers())
+
     def ensure_routing_table_is_fresh(self, access_mode):
         """ Update the routing table if stale.
 
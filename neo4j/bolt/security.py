@@ -46,3 +46,35 @@ def make_ssl_context(**config):
         return ssl_context
     else:
         return None
+
+
+class TLSSessionCache:
+    """ Store of TLS sessions established by previous connections,
+    keyed by server, so that later connections to the same server can
+    resume a session instead of carrying out a full TLS handshake.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, key):
+        """ Return the most recent session for a server, or
+        :const:`None` if there is none.
+        """
+        return self._sessions.get(key)
+
+    def put(self, key, session):
+        """ Store a session for a server, replacing any held already.
+        """
+        if session is None:
+            self._sessions.pop(key, None)
+        else:
+            self._sessions[key] = session
+
+    def remove(self, key):
+        """ Discard any session held for a server.
+        """
+        self._sessions.pop(key, None)
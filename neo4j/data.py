@@ -19,13 +19,13 @@
 # limitations under the License.
 
 
-from collections.abc import Mapping, Sequence
+from collections.abc import Iterator, Mapping, Sequence
 from datetime import date, time, datetime, timedelta
 from functools import reduce
 from operator import xor as xor_operator
 
 from neo4j.graph import Graph
-from neo4j.packstream import INT64_MIN, INT64_MAX, Structure
+from neo4j.packstream import INT64_MIN, INT64_MAX, Packer, Structure, Unpacker
 from neo4j.spatial import Point, hydrate_point, dehydrate_point
 from neo4j.time import Date, Time, DateTime, Duration
 from neo4j.time.hydration import (
@@ -36,9 +36,6 @@ from neo4j.time.hydration import (
 )
 
 
-map_type = type(map(str, range(0)))
-
-
 def iter_items(iterable):
     """ Iterate through all items (key-value pairs) within an iterable
     dictionary-like object. If the object has a `keys` method, this is
@@ -239,6 +236,71 @@ class Record(tuple, Mapping):
         return dict(self)
 
 
+class LazyRecord(Record):
+    """ A :class:`.Record` whose values are kept in their encoded
+    PackStream form until first accessed. An index of the byte offset
+    at which each value starts is built up front, by skipping over the
+    values without decoding them, so that any single value can later be
+    unpacked and hydrated on its own.
+
+    :param keys: the field names of the record
+    :param unpacker: :class:`.Unpacker` positioned at the start of the
+                     list of encoded values
+    :param hydrant: :class:`.DataHydrator` for the decoded values
+    """
+
+    def __new__(cls, keys, unpacker, hydrant):
+        offsets = unpacker.scan_offsets()
+        inst = Record.__new__(cls, zip(keys, [None] * (len(offsets) - 1)))
+        inst.__unpacker = unpacker
+        inst.__hydrant = hydrant
+        inst.__offsets = offsets[:len(inst)]
+        inst.__values = [None] * len(inst)
+        inst.__decoded = [False] * len(inst)
+        return inst
+
+    def __value(self, index):
+        if not self.__decoded[index]:
+            unpacker = self.__unpacker
+            unpacker.unpackable.p = self.__offsets[index]
+            value, = self.__hydrant.hydrate([unpacker.unpack()])
+            self.__values[index] = value
+            self.__decoded[index] = True
+        return self.__values[index]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.__value(index)
+
+    def __contains__(self, value):
+        return any(item is value or item == value for item in self)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return Record(zip(self.keys()[key], list(self)[key]))
+        try:
+            index = self.index(key)
+        except IndexError:
+            return None
+        else:
+            return self.__value(index)
+
+    def get(self, key, default=None):
+        try:
+            index = self.index(str(key))
+        except KeyError:
+            return default
+        if 0 <= index < len(self):
+            return self.__value(index)
+        else:
+            return default
+
+    def items(self, *keys):
+        if keys:
+            return super(LazyRecord, self).items(*keys)
+        return list(zip(self.keys(), self))
+
+
 class DataHydrator:
 
     def __init__(self):
@@ -286,7 +348,11 @@ class DataHydrator:
 
     def hydrate_records(self, keys, record_values):
         for values in record_values:
-            yield Record(zip(keys, self.hydrate(values)))
+            if isinstance(values, Unpacker):
+                # Values left encoded, to be decoded on demand
+                yield LazyRecord(keys, values, self)
+            else:
+                yield Record(zip(keys, self.hydrate(values)))
 
 
 class DataDehydrator:
@@ -334,13 +400,21 @@ class DataDehydrator:
             elif isinstance(obj, (bytes, bytearray)):
                 # order is important here - bytes must be checked after str
                 return obj
-            elif isinstance(obj, (list, map_type)):
+            elif isinstance(obj, list):
                 return list(map(dehydrate_, obj))
+            elif isinstance(obj, Iterator):
+                # iterators, such as generators, are dehydrated lazily
+                # and packed as list streams, so are never materialised
+                return map(dehydrate_, obj)
             elif isinstance(obj, dict):
                 if any(not isinstance(key, str) for key in obj.keys()):
                     raise TypeError("Non-string dictionary keys are "
                                     "not supported")
                 return {key: dehydrate_(value) for key, value in obj.items()}
+            elif Packer.supports(obj):
+                # values of types with a registered packing converter
+                # are passed through as-is
+                return obj
             else:
                 raise TypeError(obj)
 
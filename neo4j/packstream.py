@@ -19,9 +19,12 @@
 # limitations under the License.
 
 
+from array import array
 from codecs import decode
+from collections.abc import Iterator
 from io import BytesIO
-from struct import pack as struct_pack, unpack as struct_unpack
+from struct import Struct, pack as struct_pack, unpack as struct_unpack
+from sys import byteorder
 
 
 PACKED_UINT_8 = [struct_pack(">B", value) for value in range(0x100)]
@@ -34,6 +37,16 @@ UNPACKED_MARKERS = {b"\xC0": None, b"\xC2": False, b"\xC3": True}
 UNPACKED_MARKERS.update({bytes(bytearray([z])): z for z in range(0x00, 0x80)})
 UNPACKED_MARKERS.update({bytes(bytearray([z + 256])): z for z in range(-0x10, 0x00)})
 
+# Marker byte followed by a fixed-size value
+FLOAT_64 = Struct(">Bd")
+INT_8 = Struct(">Bb")
+INT_16 = Struct(">Bh")
+INT_32 = Struct(">Bi")
+INT_64 = Struct(">Bq")
+UINT_8 = Struct(">BB")
+UINT_16 = Struct(">BH")
+UINT_32 = Struct(">BI")
+
 
 INT64_MIN = -(2 ** 63)
 INT64_MAX = 2 ** 63
@@ -42,6 +55,14 @@ INT64_MAX = 2 ** 63
 EndOfStream = object()
 
 
+try:
+    from neo4j import _packstream as _codec
+except ImportError:
+    # The compiled codec is optional; without it, the pure
+    # Python implementation below is used throughout.
+    _codec = None
+
+
 class Structure:
 
     def __init__(self, tag, *fields):
@@ -72,297 +93,583 @@ class Structure:
 
 class Packer:
 
+    # Types that can be packed without conversion
+    _core_types = frozenset([type(None), bool, float, int, str, bytes,
+                             bytearray, list, dict, Structure])
+
+    # Conversion functions for user-defined types, keyed by type
+    _converters = {}
+
+    # Number of converters registered so far, by which packers
+    # tell whether their own dispatch tables are out of date
+    _registrations = 0
+
+    #: Number of bytes of a list stream to accumulate before it is
+    #: written and flushed through to the stream
+    stream_flush_size = 0x10000
+
+    @classmethod
+    def register(cls, type_, converter):
+        """ Register a function for packing values of a user-defined
+        type. The converter is called with each such value and must
+        return a substitute value that can itself be packed, such as a
+        :class:`.Structure`. Registration affects all packers, including
+        those already created, and applies to subclasses of the type too.
+
+        :param type_: the type of values to convert
+        :param converter: function that converts values of that type
+        :raise ValueError: if the type is natively supported by PackStream
+        """
+        if type_ in cls._core_types:
+            raise ValueError("Values of type %s are natively supported and "
+                             "cannot be converted" % type_)
+        Packer._converters[type_] = converter
+        Packer._registrations += 1
+
+    @classmethod
+    def supports(cls, value):
+        """ Return :const:`True` if values like the one given can be
+        packed, either natively or via a registered converter.
+        """
+        if type(value) in cls._core_types or type(value) in cls._converters:
+            return True
+        return isinstance(value, tuple(cls._core_types) + tuple(cls._converters) + (Iterator,))
+
     def __init__(self, stream):
         self.stream = stream
         self._write = self.stream.write
+        self._flush_stream = getattr(self.stream, "flush", None)
+        # Encoded data is accumulated in a buffer and written to the
+        # stream in one piece by each public method, so that a whole
+        # message reaches the stream through a single write call.
+        self._data = bytearray()
+        self._build_packers()
+
+    def _build_packers(self):
+        """ Build the tables of packing functions from the core types
+        and the converters currently registered.
+        """
+        self._registrations_seen = Packer._registrations
+        # The ordered list of packing functions for each type,
+        # consulted by isinstance for subclasses. Order matters
+        # here as bool is a subclass of int.
+        self._packers_by_base = [
+            (type(None), self._pack_none),
+            (bool, self._pack_bool),
+            (float, self._pack_float),
+            (int, self._pack_int),
+            (str, self._pack_str),
+            (bytes, self._pack_bytes),
+            (bytearray, self._pack_bytes),
+            (list, self._pack_list),
+            (dict, self._pack_dict),
+            (Structure, self._pack_structure),
+            (Iterator, self._pack_list_stream),
+        ]
+        for type_, converter in self._converters.items():
+            self._packers_by_base.insert(0, (type_, self._converting_packer(converter)))
+        # Exact type dispatch, extended with subclasses as they are found
+        self._packers = dict(self._packers_by_base)
+
+    def _check_registrations(self):
+        """ Rebuild the tables of packing functions if any converter
+        has been registered since they were built.
+        """
+        if self._registrations_seen != Packer._registrations:
+            self._build_packers()
+
+    def _flush(self):
+        """ Write everything in the buffer to the stream as one
+        contiguous block, then empty the buffer.
+        """
+        data = self._data
+        if data:
+            # A new buffer is started rather than clearing the old
+            # one, as the stream may choose to keep hold of it.
+            self._data = bytearray()
+            self._write(data)
+
+    def _discard(self):
+        """ Throw away anything in the buffer, such as a partially
+        packed value.
+        """
+        self._data = bytearray()
 
     def pack_raw(self, data):
-        self._write(data)
+        self._pack_raw(data)
+        self._flush()
+
+    def _pack_raw(self, data):
+        self._data += data
 
     def pack(self, value):
-        return self._pack(value)
+        self._check_registrations()
+        if _codec is not None:
+            data = _codec.pack(value, Structure)
+            if data is not NotImplemented:
+                self._write(data)
+                return
+        try:
+            self._pack(value)
+        except Exception:
+            self._discard()
+            raise
+        self._flush()
+
+    def pack_spliced(self, head, value, tail):
+        """ Pack a value between two pieces of data that have already
+        been encoded, writing all three to the stream in one piece.
+        """
+        self._check_registrations()
+        if _codec is not None:
+            data = _codec.pack(value, Structure)
+            if data is not NotImplemented:
+                self._write(b"".join((head, data, tail)))
+                return
+        try:
+            self._pack_raw(head)
+            self._pack(value)
+            self._pack_raw(tail)
+        except Exception:
+            self._discard()
+            raise
+        self._flush()
 
     def _pack(self, value):
-        write = self._write
-
-        # None
-        if value is None:
-            write(b"\xC0")  # NULL
-
-        # Boolean
-        elif value is True:
-            write(b"\xC3")
-        elif value is False:
-            write(b"\xC2")
-
-        # Float (only double precision is supported)
-        elif isinstance(value, float):
-            write(b"\xC1")
-            write(struct_pack(">d", value))
-
-        # Integer
-        elif isinstance(value, int):
-            if -0x10 <= value < 0x80:
-                write(PACKED_UINT_8[value % 0x100])
-            elif -0x80 <= value < -0x10:
-                write(b"\xC8")
-                write(PACKED_UINT_8[value % 0x100])
-            elif -0x8000 <= value < 0x8000:
-                write(b"\xC9")
-                write(PACKED_UINT_16[value % 0x10000])
-            elif -0x80000000 <= value < 0x80000000:
-                write(b"\xCA")
-                write(struct_pack(">i", value))
-            elif INT64_MIN <= value < INT64_MAX:
-                write(b"\xCB")
-                write(struct_pack(">q", value))
-            else:
-                raise OverflowError("Integer %s out of range" % value)
-
-        # String
-        elif isinstance(value, str):
-            encoded = value.encode("utf-8")
-            self.pack_string_header(len(encoded))
-            self.pack_raw(encoded)
-
-        # Bytes
-        elif isinstance(value, bytes):
-            self.pack_bytes_header(len(value))
-            self.pack_raw(value)
-        elif isinstance(value, bytearray):
-            self.pack_bytes_header(len(value))
-            self.pack_raw(bytes(value))
-
-        # List
-        elif isinstance(value, list):
-            self.pack_list_header(len(value))
-            for item in value:
-                self._pack(item)
-
-        # Map
-        elif isinstance(value, dict):
-            self.pack_map_header(len(value))
-            for key, item in value.items():
-                self._pack(key)
-                self._pack(item)
-
-        # Structure
-        elif isinstance(value, Structure):
-            self.pack_struct(value.tag, value.fields)
-
-        # Other
+        try:
+            packer = self._packers[type(value)]
+        except KeyError:
+            packer = self._find_packer(type(value))
+        packer(value)
+
+    def _find_packer(self, type_):
+        for base, packer in self._packers_by_base:
+            if issubclass(type_, base):
+                self._packers[type_] = packer
+                return packer
+        raise ValueError("Values of type %s are not supported" % type_)
+
+    def _converting_packer(self, converter):
+
+        def pack_converted(value):
+            self._pack(converter(value))
+
+        return pack_converted
+
+    def _pack_marker(self, marker):
+        self._data.append(marker)
+
+    def _pack_none(self, _):
+        self._pack_marker(0xC0)
+
+    def _pack_bool(self, value):
+        self._pack_marker(0xC3 if value else 0xC2)
+
+    def _pack_float(self, value):
+        # Only double precision is supported
+        self._data += FLOAT_64.pack(0xC1, value)
+
+    def _pack_int(self, value):
+        if -0x10 <= value < 0x80:
+            self._pack_marker(value & 0xFF)
+        elif -0x80 <= value < -0x10:
+            self._data += INT_8.pack(0xC8, value)
+        elif -0x8000 <= value < 0x8000:
+            self._data += INT_16.pack(0xC9, value)
+        elif -0x80000000 <= value < 0x80000000:
+            self._data += INT_32.pack(0xCA, value)
+        elif INT64_MIN <= value < INT64_MAX:
+            self._data += INT_64.pack(0xCB, value)
         else:
-            raise ValueError("Values of type %s are not supported" % type(value))
-
-    def pack_bytes_header(self, size):
-        write = self._write
-        if size < 0x100:
-            write(b"\xCC")
-            write(PACKED_UINT_8[size])
-        elif size < 0x10000:
-            write(b"\xCD")
-            write(PACKED_UINT_16[size])
-        elif size < 0x100000000:
-            write(b"\xCE")
-            write(struct_pack(">I", size))
+            raise OverflowError("Integer %s out of range" % value)
+
+    def _pack_str(self, value):
+        encoded = value.encode("utf-8")
+        size = len(encoded)
+        if size < 0x10:
+            data = self._data
+            data.append(0x80 + size)
+            data += encoded
         else:
-            raise OverflowError("Bytes header size out of range")
-
-    def pack_string_header(self, size):
-        write = self._write
-        if size == 0x00:
-            write(b"\x80")
-        elif size == 0x01:
-            write(b"\x81")
-        elif size == 0x02:
-            write(b"\x82")
-        elif size == 0x03:
-            write(b"\x83")
-        elif size == 0x04:
-            write(b"\x84")
-        elif size == 0x05:
-            write(b"\x85")
-        elif size == 0x06:
-            write(b"\x86")
-        elif size == 0x07:
-            write(b"\x87")
-        elif size == 0x08:
-            write(b"\x88")
-        elif size == 0x09:
-            write(b"\x89")
-        elif size == 0x0A:
-            write(b"\x8A")
-        elif size == 0x0B:
-            write(b"\x8B")
-        elif size == 0x0C:
-            write(b"\x8C")
-        elif size == 0x0D:
-            write(b"\x8D")
-        elif size == 0x0E:
-            write(b"\x8E")
-        elif size == 0x0F:
-            write(b"\x8F")
+            self._pack_string_header(size)
+            self._pack_raw(encoded)
+
+    def _pack_bytes(self, value):
+        self._pack_bytes_header(len(value))
+        self._pack_raw(value)
+
+    def _pack_list(self, value):
+        self._pack_list_header(len(value))
+        packers = self._packers
+        for item in value:
+            try:
+                packer = packers[type(item)]
+            except KeyError:
+                packer = self._find_packer(type(item))
+            packer(item)
+
+    def _pack_list_stream(self, value):
+        """ Pack the items of an iterator as a list stream, consuming
+        it lazily. Each time enough data has accumulated, the partial
+        value is written out and the stream is flushed, so that the
+        list as a whole need never be held in memory.
+        """
+        self._pack_marker(0xD7)
+        packers = self._packers
+        flush_size = self.stream_flush_size
+        for item in value:
+            try:
+                packer = packers[type(item)]
+            except KeyError:
+                packer = self._find_packer(type(item))
+            packer(item)
+            if len(self._data) >= flush_size:
+                self._flush()
+                if self._flush_stream is not None:
+                    self._flush_stream()
+        self._pack_marker(0xDF)
+
+    def _pack_dict(self, value):
+        self._pack_map_header(len(value))
+        packers = self._packers
+        for key, item in value.items():
+            for x in (key, item):
+                try:
+                    packer = packers[type(x)]
+                except KeyError:
+                    packer = self._find_packer(type(x))
+                packer(x)
+
+    def _pack_structure(self, value):
+        self._pack_struct(value.tag, value.fields)
+
+    def _pack_header(self, size, tiny_marker, markers, name):
+        """ Pack a size header, using a tiny marker for sizes below
+        16 (if a tiny marker exists) and otherwise the smallest
+        of the three sized markers that can hold the size.
+        """
+        if size < 0x10 and tiny_marker is not None:
+            self._pack_marker(tiny_marker + size)
         elif size < 0x100:
-            write(b"\xD0")
-            write(PACKED_UINT_8[size])
+            self._data += UINT_8.pack(markers[0], size)
         elif size < 0x10000:
-            write(b"\xD1")
-            write(PACKED_UINT_16[size])
+            self._data += UINT_16.pack(markers[1], size)
         elif size < 0x100000000:
-            write(b"\xD2")
-            write(struct_pack(">I", size))
+            self._data += UINT_32.pack(markers[2], size)
         else:
-            raise OverflowError("String header size out of range")
+            raise OverflowError("%s header size out of range" % name)
+
+    def pack_bytes_header(self, size):
+        self._pack_bytes_header(size)
+        self._flush()
+
+    def _pack_bytes_header(self, size):
+        self._pack_header(size, None, (0xCC, 0xCD, 0xCE), "Bytes")
+
+    def pack_string_header(self, size):
+        self._pack_string_header(size)
+        self._flush()
+
+    def _pack_string_header(self, size):
+        self._pack_header(size, 0x80, (0xD0, 0xD1, 0xD2), "String")
 
     def pack_list_header(self, size):
-        write = self._write
-        if size == 0x00:
-            write(b"\x90")
-        elif size == 0x01:
-            write(b"\x91")
-        elif size == 0x02:
-            write(b"\x92")
-        elif size == 0x03:
-            write(b"\x93")
-        elif size == 0x04:
-            write(b"\x94")
-        elif size == 0x05:
-            write(b"\x95")
-        elif size == 0x06:
-            write(b"\x96")
-        elif size == 0x07:
-            write(b"\x97")
-        elif size == 0x08:
-            write(b"\x98")
-        elif size == 0x09:
-            write(b"\x99")
-        elif size == 0x0A:
-            write(b"\x9A")
-        elif size == 0x0B:
-            write(b"\x9B")
-        elif size == 0x0C:
-            write(b"\x9C")
-        elif size == 0x0D:
-            write(b"\x9D")
-        elif size == 0x0E:
-            write(b"\x9E")
-        elif size == 0x0F:
-            write(b"\x9F")
-        elif size < 0x100:
-            write(b"\xD4")
-            write(PACKED_UINT_8[size])
-        elif size < 0x10000:
-            write(b"\xD5")
-            write(PACKED_UINT_16[size])
-        elif size < 0x100000000:
-            write(b"\xD6")
-            write(struct_pack(">I", size))
-        else:
-            raise OverflowError("List header size out of range")
+        self._pack_list_header(size)
+        self._flush()
+
+    def _pack_list_header(self, size):
+        self._pack_header(size, 0x90, (0xD4, 0xD5, 0xD6), "List")
 
     def pack_list_stream_header(self):
-        self._write(b"\xD7")
+        self._pack_marker(0xD7)
+        self._flush()
 
     def pack_map_header(self, size):
-        write = self._write
-        if size == 0x00:
-            write(b"\xA0")
-        elif size == 0x01:
-            write(b"\xA1")
-        elif size == 0x02:
-            write(b"\xA2")
-        elif size == 0x03:
-            write(b"\xA3")
-        elif size == 0x04:
-            write(b"\xA4")
-        elif size == 0x05:
-            write(b"\xA5")
-        elif size == 0x06:
-            write(b"\xA6")
-        elif size == 0x07:
-            write(b"\xA7")
-        elif size == 0x08:
-            write(b"\xA8")
-        elif size == 0x09:
-            write(b"\xA9")
-        elif size == 0x0A:
-            write(b"\xAA")
-        elif size == 0x0B:
-            write(b"\xAB")
-        elif size == 0x0C:
-            write(b"\xAC")
-        elif size == 0x0D:
-            write(b"\xAD")
-        elif size == 0x0E:
-            write(b"\xAE")
-        elif size == 0x0F:
-            write(b"\xAF")
-        elif size < 0x100:
-            write(b"\xD8")
-            write(PACKED_UINT_8[size])
-        elif size < 0x10000:
-            write(b"\xD9")
-            write(PACKED_UINT_16[size])
-        elif size < 0x100000000:
-            write(b"\xDA")
-            write(struct_pack(">I", size))
-        else:
-            raise OverflowError("Map header size out of range")
+        self._pack_map_header(size)
+        self._flush()
+
+    def _pack_map_header(self, size):
+        self._pack_header(size, 0xA0, (0xD8, 0xD9, 0xDA), "Map")
 
     def pack_map_stream_header(self):
-        self._write(b"\xDB")
+        self._pack_marker(0xDB)
+        self._flush()
 
     def pack_struct(self, signature, fields):
+        self._check_registrations()
+        if _codec is not None:
+            data = _codec.pack_struct(signature, fields, Structure)
+            if data is not NotImplemented:
+                self._write(data)
+                return
+        try:
+            self._pack_struct(signature, fields)
+        except Exception:
+            self._discard()
+            raise
+        self._flush()
+
+    def _pack_struct(self, signature, fields):
         if len(signature) != 1 or not isinstance(signature, bytes):
             raise ValueError("Structure signature must be a single byte value")
-        write = self._write
         size = len(fields)
-        if size == 0x00:
-            write(b"\xB0")
-        elif size == 0x01:
-            write(b"\xB1")
-        elif size == 0x02:
-            write(b"\xB2")
-        elif size == 0x03:
-            write(b"\xB3")
-        elif size == 0x04:
-            write(b"\xB4")
-        elif size == 0x05:
-            write(b"\xB5")
-        elif size == 0x06:
-            write(b"\xB6")
-        elif size == 0x07:
-            write(b"\xB7")
-        elif size == 0x08:
-            write(b"\xB8")
-        elif size == 0x09:
-            write(b"\xB9")
-        elif size == 0x0A:
-            write(b"\xBA")
-        elif size == 0x0B:
-            write(b"\xBB")
-        elif size == 0x0C:
-            write(b"\xBC")
-        elif size == 0x0D:
-            write(b"\xBD")
-        elif size == 0x0E:
-            write(b"\xBE")
-        elif size == 0x0F:
-            write(b"\xBF")
-        else:
+        if size >= 0x10:
             raise OverflowError("Structure size out of range")
-        write(signature)
+        self._data += UINT_8.pack(0xB0 + size, signature[0])
+        packers = self._packers
         for field in fields:
-            self._pack(field)
+            try:
+                packer = packers[type(field)]
+            except KeyError:
+                packer = self._find_packer(type(field))
+            packer(field)
 
     def pack_end_of_stream(self):
-        self._write(b"\xDF")
+        self._pack_marker(0xDF)
+        self._flush()
+
+
+class StringCache:
+    """ Bounded cache of decoded strings, keyed by their raw UTF-8
+    bytes. Strings that recur across records, such as map keys,
+    labels and relationship types, are decoded only once and every
+    occurrence is then represented by the same object.
+
+    Only strings whose encoded length does not exceed `max_length`
+    bytes are cached. When the cache reaches `capacity` entries, it
+    is emptied and begins to fill again.
+    """
+
+    def __init__(self, capacity=256, max_length=64):
+        self.capacity = capacity
+        self.max_length = max_length
+        self.strings = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.strings)
+
+    def decode(self, data):
+        """ Decode UTF-8 encoded data, via the cache if short enough.
+        """
+        if len(data) > self.max_length:
+            return decode(data, "utf-8")
+        key = bytes(data)
+        strings = self.strings
+        try:
+            value = strings[key]
+        except KeyError:
+            self.misses += 1
+            value = decode(key, "utf-8")
+            if len(strings) >= self.capacity:
+                strings.clear()
+            strings[key] = value
+        else:
+            self.hits += 1
+        return value
+
+
+# Kinds of entry in the unpacking table
+_VALUE, _DECODED, _LIST, _MAP, _STRUCT, _UNKNOWN = range(6)
+
+_unpack_u8 = Struct(">B").unpack
+_unpack_u16 = Struct(">H").unpack
+_unpack_u32 = Struct(">I").unpack
+
+
+def _size_reader(unpack, n):
+
+    def read_size(read):
+        return unpack(read(n))[0]
+
+    return read_size
+
+
+def _decoder(unpack, n):
+
+    def decode_value(read):
+        return unpack(read(n))[0]
+
+    return decode_value
+
+
+def _string_decoder(read_size, string_cache=None):
+    if string_cache is None:
+
+        def decode_string(read):
+            return decode(read(read_size(read)), "utf-8")
+
+    else:
+        cached_decode = string_cache.decode
+
+        def decode_string(read):
+            return cached_decode(read(read_size(read)))
+
+    return decode_string
+
+
+def _tiny_string_decoder(size, string_cache=None):
+    if string_cache is None:
+
+        def decode_tiny_string(read):
+            return decode(read(size), "utf-8")
+
+    else:
+        cached_decode = string_cache.decode
+
+        def decode_tiny_string(read):
+            return cached_decode(read(size))
+
+    return decode_tiny_string
+
+
+def _bytes_decoder(read_size):
+
+    def decode_bytes(read):
+        return read(read_size(read)).tobytes()
+
+    return decode_bytes
+
+
+def _build_unpacking_table(string_cache=None):
+    """ Build a table of 256 (kind, argument) entries describing how
+    to unpack the value that follows each marker byte.
+
+    :param string_cache: optional :class:`.StringCache` through which
+                         to decode strings
+    """
+    read_size_8 = _size_reader(_unpack_u8, 1)
+    read_size_16 = _size_reader(_unpack_u16, 2)
+    read_size_32 = _size_reader(_unpack_u32, 4)
+    table = [(_UNKNOWN, marker) for marker in range(0x100)]
+    for marker in range(0x00, 0x80):
+        table[marker] = (_VALUE, marker)
+    for marker in range(0xF0, 0x100):
+        table[marker] = (_VALUE, marker - 0x100)
+    for size in range(0x10):
+        table[0x80 + size] = (_DECODED, _tiny_string_decoder(size, string_cache))
+        table[0x90 + size] = (_LIST, size)
+        table[0xA0 + size] = (_MAP, size)
+        table[0xB0 + size] = (_STRUCT, size)
+    table[0xC0] = (_VALUE, None)
+    table[0xC1] = (_DECODED, _decoder(Struct(">d").unpack, 8))
+    table[0xC2] = (_VALUE, False)
+    table[0xC3] = (_VALUE, True)
+    table[0xC8] = (_DECODED, _decoder(Struct(">b").unpack, 1))
+    table[0xC9] = (_DECODED, _decoder(Struct(">h").unpack, 2))
+    table[0xCA] = (_DECODED, _decoder(Struct(">i").unpack, 4))
+    table[0xCB] = (_DECODED, _decoder(Struct(">q").unpack, 8))
+    table[0xCC] = (_DECODED, _bytes_decoder(read_size_8))
+    table[0xCD] = (_DECODED, _bytes_decoder(read_size_16))
+    table[0xCE] = (_DECODED, _bytes_decoder(read_size_32))
+    table[0xD0] = (_DECODED, _string_decoder(read_size_8, string_cache))
+    table[0xD1] = (_DECODED, _string_decoder(read_size_16, string_cache))
+    table[0xD2] = (_DECODED, _string_decoder(read_size_32, string_cache))
+    table[0xD4] = (_LIST, read_size_8)
+    table[0xD5] = (_LIST, read_size_16)
+    table[0xD6] = (_LIST, read_size_32)
+    table[0xD7] = (_LIST, None)
+    table[0xD8] = (_MAP, read_size_8)
+    table[0xD9] = (_MAP, read_size_16)
+    table[0xDA] = (_MAP, read_size_32)
+    table[0xDB] = (_MAP, None)
+    table[0xDF] = (_VALUE, EndOfStream)
+    return table
+
+
+UNPACKING_TABLE = _build_unpacking_table()
+
+
+# Kinds of entry in the skipping table
+_SKIP_FIXED, _SKIP_SIZED, _SKIP_CONTAINER, _SKIP_STREAM, _SKIP_END = range(5)
+
+
+def _build_skipping_table():
+    """ Build a table of 256 (kind, arguments) entries describing how
+    to step over the value that follows each marker byte, without
+    decoding it. Unknown markers map to :const:`None`.
+    """
+    table = [None] * 0x100
+    for marker in range(0x00, 0x80):
+        table[marker] = (_SKIP_FIXED, 0)
+    for marker in range(0xF0, 0x100):
+        table[marker] = (_SKIP_FIXED, 0)
+    for size in range(0x10):
+        table[0x80 + size] = (_SKIP_FIXED, size)
+        # Containers: (bytes after the marker, size in those bytes
+        # or None if fixed, fixed size, values per item)
+        table[0x90 + size] = (_SKIP_CONTAINER, (0, None, size, 1))
+        table[0xA0 + size] = (_SKIP_CONTAINER, (0, None, size, 2))
+        table[0xB0 + size] = (_SKIP_CONTAINER, (1, None, size, 1))
+    for marker in (0xC0, 0xC2, 0xC3):
+        table[marker] = (_SKIP_FIXED, 0)
+    table[0xC1] = (_SKIP_FIXED, 8)
+    table[0xC8] = (_SKIP_FIXED, 1)
+    table[0xC9] = (_SKIP_FIXED, 2)
+    table[0xCA] = (_SKIP_FIXED, 4)
+    table[0xCB] = (_SKIP_FIXED, 8)
+    for width, (bytes_marker, string_marker, list_marker, map_marker) in zip(
+            (1, 2, 4), ((0xCC, 0xD0, 0xD4, 0xD8),
+                        (0xCD, 0xD1, 0xD5, 0xD9),
+                        (0xCE, 0xD2, 0xD6, 0xDA))):
+        table[bytes_marker] = (_SKIP_SIZED, width)
+        table[string_marker] = (_SKIP_SIZED, width)
+        table[list_marker] = (_SKIP_CONTAINER, (width, width, 0, 1))
+        table[map_marker] = (_SKIP_CONTAINER, (width, width, 0, 2))
+    table[0xD7] = (_SKIP_STREAM, None)
+    table[0xDB] = (_SKIP_STREAM, None)
+    table[0xDF] = (_SKIP_END, None)
+    return table
+
+
+SKIPPING_TABLE = _build_skipping_table()
+
+
+def _array_typecode(kind, itemsize):
+    """ Find the array typecode for a signed integer (kind "i") or a
+    float (kind "f") with the given item size in bytes.
+    """
+    for typecode in ("bhilq" if kind == "i" else "d"):
+        if array(typecode).itemsize == itemsize:
+            return typecode
+    raise ValueError("No array type for %d-byte values" % itemsize)
+
+
+# Markers of fixed-size numeric values that can be decoded in bulk,
+# mapped to the array typecode and size of the value that follows
+NUMERIC_MARKERS = {
+    0xC1: (_array_typecode("f", 8), 8),
+    0xC8: (_array_typecode("i", 1), 1),
+    0xC9: (_array_typecode("i", 2), 2),
+    0xCA: (_array_typecode("i", 4), 4),
+    0xCB: (_array_typecode("i", 8), 8),
+}
 
 
 class Unpacker:
+    """ PackStream decoder.
+
+    :param unpackable: source of the data to unpack
+    :param numeric_arrays: if true, lists made up entirely of floats, or
+                           entirely of integers of the same size, are
+                           returned as :class:`array.array` objects
+                           instead of lists
+    :param string_cache: optional :class:`.StringCache` through which
+                         short strings are decoded
+    """
+
+    # Minimum size of list for which bulk decoding is attempted
+    numeric_list_threshold = 0x10
 
-    def __init__(self, unpackable):
+    def __init__(self, unpackable, numeric_arrays=False, string_cache=None):
         self.unpackable = unpackable
+        self.numeric_arrays = numeric_arrays
+        self.string_cache = string_cache
+        if string_cache is None:
+            self._table = UNPACKING_TABLE
+        else:
+            self._table = _build_unpacking_table(string_cache)
 
     def reset(self):
         self.unpackable.reset()
@@ -374,167 +681,282 @@ class Unpacker:
         return self.unpackable.read_u8()
 
     def unpack(self):
+        unpackable = self.unpackable
+        if (_codec is not None and not self.numeric_arrays and
+                isinstance(unpackable, UnpackableBuffer)):
+            result = _codec.unpack(unpackable.data, unpackable.p, unpackable.used,
+                                   Structure, EndOfStream, self.string_cache)
+            if result is not NotImplemented:
+                value, unpackable.p = result
+                return value
         return self._unpack()
 
-    def _unpack(self):
-        marker = self.read_u8()
+    def _unpack(self, marker=None):
+        """ Unpack a single value. Containers are filled in place,
+        using an explicit stack of partially-built containers rather
+        than recursion, so that deeply nested values cannot exhaust
+        the Python stack.
 
-        if marker == -1:
-            raise ValueError("Nothing to unpack")
-
-        # Tiny Integer
-        if 0x00 <= marker <= 0x7F:
-            return marker
-        elif 0xF0 <= marker <= 0xFF:
-            return marker - 0x100
+        :param marker: the marker of the value to unpack, if it has
+                       already been read
+        """
+        read = self.unpackable.read
+        read_u8 = self.unpackable.read_u8
+        table = self._table
+        stack = []
+        while True:
+            if marker is None:
+                marker = read_u8()
+                if marker == -1:
+                    raise ValueError("Nothing to unpack")
+            kind, arg = table[marker]
+            marker = None
+
+            if kind == _VALUE:
+                value = arg
+            elif kind == _DECODED:
+                value = arg(read)
+            elif kind == _UNKNOWN:
+                raise ValueError("Unknown PackStream marker %02X" % arg)
+            else:
+                # Containers: arg is the size for tiny containers, a
+                # function to read the size for sized containers, or
+                # None for streams.
+                size = arg(read) if callable(arg) else arg
+                if kind == _LIST:
+                    value = None
+                    if size is not None and size >= self.numeric_list_threshold:
+                        value = self._unpack_numeric_list(size)
+                    if value is None:
+                        value = container = [] if size is None else [None] * size
+                    else:
+                        # Decoded in bulk, so already complete
+                        size = 0
+                elif kind == _MAP:
+                    value = container = {}
+                    if size is not None:
+                        size *= 2
+                else:
+                    value = Structure(read(1).tobytes())
+                    container = value.fields = [None] * size
+                if size != 0:
+                    stack.append([kind, container, value, 0, size, None])
+                    continue
+
+            # Add the completed value to the innermost open container,
+            # closing that container (and possibly those that enclose
+            # it) if it is now full.
+            while stack:
+                frame = stack[-1]
+                kind, container, result, i, size, key = frame
+                if size is None:
+                    # Streamed containers end with END_OF_STREAM, in
+                    # place of a list item or a map key.
+                    if value is EndOfStream and (kind == _LIST or i % 2 == 0):
+                        stack.pop()
+                        value = result
+                        continue
+                    if kind == _LIST:
+                        container.append(value)
+                    elif i % 2 == 0:
+                        frame[5] = value
+                    else:
+                        container[key] = value
+                elif kind == _MAP:
+                    if i % 2 == 0:
+                        frame[5] = value
+                    else:
+                        container[key] = value
+                else:
+                    container[i] = value
+                i += 1
+                if i == size:
+                    stack.pop()
+                    value = result
+                else:
+                    frame[3] = i
+                    break
+            else:
+                return value
 
-        # Null
-        elif marker == 0xC0:
+    def _unpack_numeric_list(self, size):
+        """ Attempt to decode a list of `size` items in one go, which
+        is possible if the items are all tiny positive integers or if
+        they all share the same fixed-size numeric marker. If neither
+        is the case, nothing is consumed and :const:`None` is returned.
+        """
+        buffer = self.unpackable
+        if not isinstance(buffer, UnpackableBuffer):
             return None
+        data = buffer.data
+        p = buffer.p
+        if p >= buffer.used:
+            return None
+        marker = data[p]
+        if marker < 0x80:
+            end = p + size
+            if end > buffer.used:
+                return None
+            block = data[p:end]
+            if max(block) >= 0x80:
+                return None
+            values = array("B", block)
+        else:
+            try:
+                typecode, width = NUMERIC_MARKERS[marker]
+            except KeyError:
+                return None
+            stride = width + 1
+            end = p + stride * size
+            if end > buffer.used or data[p:end:stride].count(marker) != size:
+                return None
+            # Gather the value bytes from between the markers
+            raw = bytearray(width * size)
+            for i in range(width):
+                raw[i::width] = data[p + 1 + i:end:stride]
+            values = array(typecode, raw)
+            if byteorder == "little":
+                values.byteswap()
+        buffer.p = end
+        if self.numeric_arrays:
+            return values
+        else:
+            return values.tolist()
 
-        # Float
-        elif marker == 0xC1:
-            value, = struct_unpack(">d", self.read(8))
-            return value
-
-        # Boolean
-        elif marker == 0xC2:
-            return False
-        elif marker == 0xC3:
-            return True
-
-        # Integer
-        elif marker == 0xC8:
-            return struct_unpack(">b", self.read(1))[0]
-        elif marker == 0xC9:
-            return struct_unpack(">h", self.read(2))[0]
-        elif marker == 0xCA:
-            return struct_unpack(">i", self.read(4))[0]
-        elif marker == 0xCB:
-            return struct_unpack(">q", self.read(8))[0]
-
-        # Bytes
-        elif marker == 0xCC:
-            size, = struct_unpack(">B", self.read(1))
-            return self.read(size).tobytes()
-        elif marker == 0xCD:
-            size, = struct_unpack(">H", self.read(2))
-            return self.read(size).tobytes()
-        elif marker == 0xCE:
-            size, = struct_unpack(">I", self.read(4))
-            return self.read(size).tobytes()
+    def skip(self):
+        """ Move past the next value without decoding it, leaving the
+        data unchanged and creating no Python objects for it.
 
+        :raise ValueError: if the data ends before the value does, or
+                           if it contains an unknown marker
+        """
+        buffer = self.unpackable
+        if not isinstance(buffer, UnpackableBuffer):
+            raise TypeError("Values can only be skipped within an UnpackableBuffer")
+        if _codec is not None:
+            buffer.p = _codec.skip(buffer.data, buffer.p, buffer.used)
         else:
-            marker_high = marker & 0xF0
-            # String
-            if marker_high == 0x80:  # TINY_STRING
-                return decode(self.read(marker & 0x0F), "utf-8")
-            elif marker == 0xD0:  # STRING_8:
-                size, = struct_unpack(">B", self.read(1))
-                return decode(self.read(size), "utf-8")
-            elif marker == 0xD1:  # STRING_16:
-                size, = struct_unpack(">H", self.read(2))
-                return decode(self.read(size), "utf-8")
-            elif marker == 0xD2:  # STRING_32:
-                size, = struct_unpack(">I", self.read(4))
-                return decode(self.read(size), "utf-8")
-
-            # List
-            elif 0x90 <= marker <= 0x9F or 0xD4 <= marker <= 0xD7:
-                return list(self._unpack_list_items(marker))
-
-            # Map
-            elif 0xA0 <= marker <= 0xAF or 0xD8 <= marker <= 0xDB:
-                return self._unpack_map(marker)
-
-            # Structure
-            elif 0xB0 <= marker <= 0xBF:
-                size, tag = self._unpack_structure_header(marker)
-                value = Structure(tag, *([None] * size))
-                for i in range(len(value)):
-                    value[i] = self._unpack()
-                return value
+            self._skip()
 
-            elif marker == 0xDF:  # END_OF_STREAM:
-                return EndOfStream
-
-            else:
+    def _skip(self):
+        """ Move past a single value without decoding it. Containers
+        are stepped over by counting the values still to be skipped
+        at each level of nesting.
+        """
+        buffer = self.unpackable
+        data = buffer.data
+        end = buffer.used
+        p = buffer.p
+        table = SKIPPING_TABLE
+        # Values remaining at the current level, or None within a stream
+        remaining = 1
+        stack = []
+        while True:
+            if p >= end:
+                raise ValueError("Nothing to unpack")
+            marker = data[p]
+            entry = table[marker]
+            if entry is None:
                 raise ValueError("Unknown PackStream marker %02X" % marker)
-
-    def _unpack_list_items(self, marker):
-        marker_high = marker & 0xF0
-        if marker_high == 0x90:
-            size = marker & 0x0F
-            if size == 0:
-                return
-            elif size == 1:
-                yield self._unpack()
+            kind, arg = entry
+            if kind == _SKIP_FIXED:
+                p += 1 + arg
+                size = 0
+            elif kind == _SKIP_SIZED:
+                p += 1 + arg + int.from_bytes(data[(p + 1):(p + 1 + arg)], "big")
+                size = 0
+            elif kind == _SKIP_CONTAINER:
+                extra, width, size, per_item = arg
+                if width:
+                    size = int.from_bytes(data[(p + 1):(p + 1 + width)], "big")
+                p += 1 + extra
+                size *= per_item
+            elif kind == _SKIP_STREAM:
+                p += 1
+                size = None
+            elif remaining is None:
+                # END_OF_STREAM completes the stream it closes
+                p += 1
+                remaining = stack.pop()
+                size = 0
             else:
-                for _ in range(size):
-                    yield self._unpack()
-        elif marker == 0xD4:  # LIST_8:
-            size, = struct_unpack(">B", self.read(1))
-            for _ in range(size):
-                yield self._unpack()
-        elif marker == 0xD5:  # LIST_16:
-            size, = struct_unpack(">H", self.read(2))
-            for _ in range(size):
-                yield self._unpack()
-        elif marker == 0xD6:  # LIST_32:
-            size, = struct_unpack(">I", self.read(4))
-            for _ in range(size):
-                yield self._unpack()
-        elif marker == 0xD7:  # LIST_STREAM:
-            item = None
-            while item is not EndOfStream:
-                item = self._unpack()
-                if item is not EndOfStream:
-                    yield item
-        else:
-            return
+                raise ValueError("Unexpected END_OF_STREAM marker")
+
+            if size != 0:
+                # Descend into a non-empty container or a stream
+                stack.append(remaining)
+                remaining = size
+                continue
+            # A value is complete, which may in turn complete the
+            # containers that enclose it
+            while remaining is not None:
+                remaining -= 1
+                if remaining != 0:
+                    break
+                if not stack:
+                    if p > end:
+                        raise ValueError("Nothing to unpack")
+                    buffer.p = p
+                    return
+                remaining = stack.pop()
+
+    def scan_offsets(self):
+        """ Find where each of the values inside the next list, map or
+        structure begins, by skipping over them rather than decoding
+        them. Keys and values of a map are both included, in order,
+        but the signature of a structure is not.
+
+        The offsets returned are positions within the data of the
+        underlying :class:`.UnpackableBuffer`. The start of each value
+        is followed by the end of the last, so that value `i` occupies
+        ``data[offsets[i]:offsets[i + 1]]``. Afterwards, the unpacker
+        is positioned after the end of the container.
+
+        :return: list of offsets, one longer than the number of values
+        :raise ValueError: if the next value is not a list, map or
+                           structure, in which case nothing is consumed
+        """
+        buffer = self.unpackable
+        if not isinstance(buffer, UnpackableBuffer):
+            raise TypeError("Values can only be scanned within an UnpackableBuffer")
+        start = buffer.p
+        marker = self.read_u8()
+        if marker == -1:
+            raise ValueError("Nothing to unpack")
+        kind, arg = self._table[marker]
+        if kind not in (_LIST, _MAP, _STRUCT):
+            buffer.p = start
+            raise ValueError("Expected list, map or structure, found marker %02X" % marker)
+        offsets = []
+        if arg is None:
+            # Streamed list or map, closed by END_OF_STREAM
+            data = buffer.data
+            while True:
+                if buffer.p >= buffer.used:
+                    raise ValueError("Nothing to unpack")
+                offsets.append(buffer.p)
+                if data[buffer.p] == 0xDF:
+                    buffer.p += 1
+                    return offsets
+                self.skip()
+        size = arg(self.read) if callable(arg) else arg
+        if kind == _MAP:
+            size *= 2
+        elif kind == _STRUCT:
+            buffer.p += 1
+        offsets.append(buffer.p)
+        for _ in range(size):
+            self.skip()
+            offsets.append(buffer.p)
+        return offsets
 
     def unpack_map(self):
         marker = self.read_u8()
         return self._unpack_map(marker)
 
     def _unpack_map(self, marker):
-        marker_high = marker & 0xF0
-        if marker_high == 0xA0:
-            size = marker & 0x0F
-            value = {}
-            for _ in range(size):
-                key = self._unpack()
-                value[key] = self._unpack()
-            return value
-        elif marker == 0xD8:  # MAP_8:
-            size, = struct_unpack(">B", self.read(1))
-            value = {}
-            for _ in range(size):
-                key = self._unpack()
-                value[key] = self._unpack()
-            return value
-        elif marker == 0xD9:  # MAP_16:
-            size, = struct_unpack(">H", self.read(2))
-            value = {}
-            for _ in range(size):
-                key = self._unpack()
-                value[key] = self._unpack()
-            return value
-        elif marker == 0xDA:  # MAP_32:
-            size, = struct_unpack(">I", self.read(4))
-            value = {}
-            for _ in range(size):
-                key = self._unpack()
-                value[key] = self._unpack()
-            return value
-        elif marker == 0xDB:  # MAP_STREAM:
-            value = {}
-            key = None
-            while key is not EndOfStream:
-                key = self._unpack()
-                if key is not EndOfStream:
-                    value[key] = self._unpack()
-            return value
+        if self._table[marker][0] == _MAP:
+            return self._unpack(marker)
         else:
             return None
 
@@ -586,27 +1008,14 @@ class UnpackableBuffer:
         else:
             return -1
 
-    def pop_u16(self):
-        """ Remove the last two bytes of data, returning them as a big-endian
-        16-bit unsigned integer.
+    def extend(self, b):
+        """ Append data to the end of the buffer.
         """
-        if self.used >= 2:
-            value = 0x100 * self.data[self.used - 2] + self.data[self.used - 1]
-            self.used -= 2
-            return value
-        else:
-            return -1
-
-    def receive(self, sock, n_bytes):
-        end = self.used + n_bytes
+        end = self.used + len(b)
         if end > len(self.data):
             self.data += bytearray(end - len(self.data))
-        view = memoryview(self.data)
-        while self.used < end:
-            n = sock.recv_into(view[self.used:end], end - self.used)
-            if n == 0:
-                raise OSError("No data")
-            self.used += n
+        self.data[self.used:end] = b
+        self.used = end
 
 
 class PackStream:
@@ -24,6 +24,7 @@ from threading import Thread, Lock
 from time import sleep
 
 from neo4j import Workspace
+from neo4j.bolt.direct import InitResponse
 
 
 class Pipeline(Workspace):
@@ -38,13 +39,23 @@ class Pipeline(Workspace):
     def push(self, statement, parameters=None):
         self._connection.run(statement, parameters)
         self._connection.pull_all(on_records=self._data.extend)
-        output_buffer_size = len(self._connection.outbox.view())
+        output_buffer_size = len(self._connection.outbox)
         if output_buffer_size >= self._flush_every:
             self._connection.send_all()
 
+    def _fetch_hello(self):
+        """ Fetch the reply to a HELLO still outstanding on a connection
+        opened with a pipelined HELLO, so that the replies that follow
+        are matched to the statements pushed.
+        """
+        connection = self._connection
+        while connection.responses and isinstance(connection.responses[0], InitResponse):
+            connection.fetch_message()
+
     def _results_generator(self):
         results_returned_count = 0
         try:
+            self._fetch_hello()
             summary = 0
             while summary == 0:
                 _, summary = self._connection.fetch_message()
@@ -20,7 +20,7 @@
 
 
 from os.path import dirname, join as path_join
-from setuptools import find_packages, setup
+from setuptools import Extension, find_packages, setup
 
 from neo4j.meta import package, version
 
@@ -43,6 +43,11 @@ entry_points = {
     ],
 }
 packages = find_packages(exclude=["tests"])
+ext_modules = [
+    # The compiled PackStream codec is optional; if it cannot be built,
+    # the pure Python implementation in neo4j.packstream is used instead.
+    Extension("neo4j._packstream", ["neo4j/_packstream.c"], optional=True),
+]
 readme = open(path_join(dirname(__file__), "README.rst")).read()
 setup_args = {
     "name": package,
@@ -57,6 +62,7 @@ setup_args = {
     "install_requires": install_requires,
     "classifiers": classifiers,
     "packages": packages,
+    "ext_modules": ext_modules,
     "entry_points": entry_points,
 }
 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+# Copyright (c) 2002-2019 "Neo4j,"
+# Neo4j Sweden AB [http://neo4j.com]
+#
+# This file is part of Neo4j.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" PackStream throughput benchmarks, run with pytest-benchmark::
+
+    $ pytest tests/performance --benchmark-group-by=func
+
+Each benchmark is run both with and without the compiled codec (if it
+has been built) so that the two can be compared side by side.
+"""
+
+
+from io import BytesIO
+
+from pytest import fixture, skip
+
+from neo4j import packstream
+from neo4j.packstream import Packer, UnpackableBuffer, Unpacker, Structure
+
+
+RECORD_COUNT = 10000
+VECTOR_SIZE = 1000000
+
+
+def make_record(i):
+    return Structure(b"\x71", [
+        i,
+        u"person-%d" % i,
+        i / 7.0,
+        {u"name": u"Alice", u"age": 33, u"tags": [u"a", u"b", u"c"]},
+        Structure(b"N", i, [u"Person"], {u"born": 1985}),
+    ])
+
+
+@fixture(params=["pure", "compiled"])
+def codec(request):
+    saved = packstream._codec
+    if request.param == "pure":
+        packstream._codec = None
+    elif saved is None:
+        skip("Compiled PackStream codec not available")
+    yield request.param
+    packstream._codec = saved
+
+
+@fixture(scope="module")
+def records():
+    return [make_record(i) for i in range(RECORD_COUNT)]
+
+
+@fixture(scope="module")
+def packed_records(records):
+    stream = BytesIO()
+    packer = Packer(stream)
+    for record in records:
+        packer.pack(record)
+    return stream.getvalue()
+
+
+def pack_all(records):
+    stream = BytesIO()
+    packer = Packer(stream)
+    for record in records:
+        packer.pack_struct(record.tag, record.fields)
+    return stream
+
+
+def unpack_all(data):
+    buffer = UnpackableBuffer(data)
+    unpacker = Unpacker(buffer)
+    count = 0
+    while buffer.p < buffer.used:
+        unpacker.unpack()
+        count += 1
+    return count
+
+
+@fixture(scope="module")
+def packed_vector():
+    stream = BytesIO()
+    Packer(stream).pack([i / 7.0 for i in range(VECTOR_SIZE)])
+    return stream.getvalue()
+
+
+def test_pack_records(benchmark, codec, records):
+    benchmark(pack_all, records)
+
+
+def test_unpack_records(benchmark, codec, packed_records):
+    count = benchmark(unpack_all, packed_records)
+    assert count == RECORD_COUNT
+
+
+def test_unpack_vector(benchmark, codec, packed_vector):
+    vector = benchmark(lambda: Unpacker(UnpackableBuffer(packed_vector)).unpack())
+    assert len(vector) == VECTOR_SIZE
+
+
+def test_unpack_vector_as_array(benchmark, packed_vector):
+    vector = benchmark(lambda: Unpacker(UnpackableBuffer(packed_vector), numeric_arrays=True).unpack())
+    assert len(vector) == VECTOR_SIZE
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+# Copyright (c) 2002-2019 "Neo4j,"
+# Neo4j Sweden AB [http://neo4j.com]
+#
+# This file is part of Neo4j.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Per-statement client overhead benchmarks, run with pytest-benchmark::
+
+    $ pytest tests/performance/test_session.py
+
+The scripted stub server used by the stub tests plays each script only
+once, so these benchmarks run against an in-process stub instead. It
+answers every request immediately with a canned reply, which leaves
+the time taken by a round trip to be dominated by the driver itself.
+"""
+
+
+from io import BytesIO
+from socket import socket
+from struct import pack as struct_pack
+from threading import Thread
+
+from pytest import fixture
+
+from neo4j import GraphDatabase
+from neo4j.packstream import Packer, Structure
+
+
+def chunked(*messages):
+    data = bytearray()
+    for message in messages:
+        stream = BytesIO()
+        Packer(stream).pack(message)
+        payload = stream.getvalue()
+        data += struct_pack(">H", len(payload)) + payload + b"\x00\x00"
+    return bytes(data)
+
+
+SUCCESS = chunked(Structure(b"\x70", {}))
+
+# Replies by request message signature
+REPLIES = {
+    0x01: chunked(Structure(b"\x70", {u"server": u"Neo4j/3.5.0"})),             # HELLO
+    0x10: chunked(Structure(b"\x70", {u"fields": [u"x"], u"t_first": 0})),      # RUN
+    0x3F: chunked(Structure(b"\x71", [1]), Structure(b"\x70", {u"t_last": 0})),  # PULL_ALL
+    0x2F: SUCCESS,  # DISCARD_ALL
+    0x0F: SUCCESS,  # RESET
+    0x11: SUCCESS,  # BEGIN
+    0x12: chunked(Structure(b"\x70", {u"bookmark": u"bookmark:1"})),            # COMMIT
+    0x13: SUCCESS,  # ROLLBACK
+}
+
+
+class StubServer(Thread):
+    """ Bolt server that answers every request with a canned reply.
+    """
+
+    def __init__(self):
+        super(StubServer, self).__init__(daemon=True)
+        self.listener = socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                s, _ = self.listener.accept()
+            except OSError:
+                return
+            Thread(target=self.serve, args=(s,), daemon=True).start()
+
+    def serve(self, s):
+        with s:
+            if len(s.recv(20)) != 20:
+                return
+            s.sendall(b"\x00\x00\x00\x03")
+            data = bytearray()
+            message = bytearray()
+            while True:
+                received = s.recv(65536)
+                if not received:
+                    return
+                data += received
+                replies = []
+                p = 0
+                while p + 2 <= len(data):
+                    size = 0x100 * data[p] + data[p + 1]
+                    if p + 2 + size > len(data):
+                        break
+                    if size:
+                        message += data[(p + 2):(p + 2 + size)]
+                    elif message:
+                        signature = message[1]
+                        if signature == 0x02:   # GOODBYE
+                            return
+                        replies.append(REPLIES[signature])
+                        message = bytearray()
+                    p += 2 + size
+                del data[:p]
+                if replies:
+                    s.sendall(b"".join(replies))
+
+    def close(self):
+        self.listener.close()
+
+
+@fixture(scope="module")
+def driver():
+    server = StubServer()
+    server.start()
+    driver = GraphDatabase.driver("bolt://127.0.0.1:{}".format(server.port),
+                                  auth=("neo4j", "password"))
+    try:
+        yield driver
+    finally:
+        driver.close()
+        server.close()
+
+
+@fixture
+def session(driver):
+    with driver.session() as session:
+        yield session
+
+
+def run_return_1(session):
+    return session.run("RETURN 1").single().value()
+
+
+def run_return_1_in_transaction(session):
+    with session.begin_transaction() as tx:
+        value = tx.run("RETURN 1").single().value()
+        tx.success = True
+    return value
+
+
+def test_auto_commit_statement(benchmark, session):
+    assert benchmark(run_return_1, session) == 1
+
+
+def test_explicit_transaction(benchmark, session):
+    assert benchmark(run_return_1_in_transaction, session) == 1
@@ -19,16 +19,31 @@
 # limitations under the License.
 
 
-from unittest import TestCase
+from io import BytesIO
+from logging import ERROR
+import socket
+from socket import timeout as SocketTimeout
+from struct import pack as struct_pack, unpack as struct_unpack
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
 from threading import Thread, Event
+from time import perf_counter, sleep
 
-from neo4j.bolt.direct import Connection, ConnectionPool
-from neo4j.exceptions import ClientError, ServiceUnavailable
+from neo4j.addressing import Address
+from neo4j.bolt.direct import BufferedSocket, Connection, ConnectionPool, Inbox, Outbox, \
+    Response, RunCache, MAX_SEND_BUFFERS, _connect, connect, _interleave, _race, apply_socket_options, auto_chunk_size, coalesce, \
+    send_buffers
+from neo4j.blocking import Session
+from neo4j.bolt.security import TLSSessionCache
+from neo4j.exceptions import AuthError, ClientError, CypherError, ServiceUnavailable
+from neo4j.pipelining import Pipeline
+from neo4j.packstream import Packer, StringCache, Structure, UnpackableBuffer, Unpacker
 
 
 class FakeSocket:
     def __init__(self, address):
         self.address = address
+        self.sent = bytearray()
 
     def setblocking(self, flag):
         pass
@@ -36,18 +51,118 @@ class FakeSocket:
     def getpeername(self):
         return self.address
 
+    def getsockname(self):
+        return ("127.0.0.1", 50000)
+
     def sendall(self, data):
-        return
+        self.sent += data
 
     def close(self):
         return
 
 
+class BrokenSocket(FakeSocket):
+    """ Socket to which nothing can be sent.
+    """
+
+    def sendall(self, data):
+        raise OSError("Broken pipe")
+
+
+class DeactivationRecorder:
+    """ Stand-in for a pool, recording the addresses deactivated.
+    """
+
+    def __init__(self):
+        self.deactivated = []
+
+    def deactivate(self, address):
+        self.deactivated.append(address)
+
+
+class TunedSocket(FakeSocket):
+    """ Socket that reports a given MSS and send buffer size.
+    """
+
+    def __init__(self, address, mss, send_buffer_size):
+        super(TunedSocket, self).__init__(address)
+        self.mss = mss
+        self.send_buffer_size = send_buffer_size
+
+    def getsockopt(self, level, option):
+        if (level, option) == (socket.SOL_SOCKET, socket.SO_SNDBUF):
+            return self.send_buffer_size
+        return self.mss
+
+
+class OptionSocket:
+    """ Socket that records the options set on it.
+    """
+
+    def __init__(self):
+        self.options = {}
+
+    def setsockopt(self, level, option, value):
+        if value < 0:
+            raise OSError(22, "Invalid argument")
+        self.options[(level, option)] = value
+
+
+class ReadableSocket:
+    """ Socket that can only be read from, returning data in the
+    pieces given, one piece per read.
+    """
+
+    def __init__(self, *pieces):
+        self.pieces = list(pieces)
+        self.reads = 0
+
+    def recv_into(self, buffer, n_bytes=0, flags=0):
+        self.reads += 1
+        if not self.pieces:
+            return 0
+        piece = self.pieces.pop(0)
+        if isinstance(piece, Exception):
+            raise piece
+        size = min(len(piece), n_bytes or len(buffer))
+        buffer[:size] = piece[:size]
+        if size < len(piece):
+            self.pieces.insert(0, piece[size:])
+        return size
+
+
+class ReplyingSocket(FakeSocket, ReadableSocket):
+    """ Socket that records data sent and replies with the pieces
+    given, one piece per read.
+    """
+
+    def __init__(self, address, *pieces):
+        FakeSocket.__init__(self, address)
+        ReadableSocket.__init__(self, *pieces)
+
+
+class TimedReplyingSocket(ReplyingSocket):
+    """ Replying socket that records the timeouts set on it.
+    """
+
+    def __init__(self, address, *pieces):
+        super(TimedReplyingSocket, self).__init__(address, *pieces)
+        self.timeouts = []
+
+    def gettimeout(self):
+        return self.timeouts[-1] if self.timeouts else None
+
+    def settimeout(self, timeout):
+        self.timeouts.append(timeout)
+
+
 class QuickConnection:
 
+    alive = True
+
     def __init__(self, socket):
         self.socket = socket
-        self.address = socket.getpeername()
+        self.address = self.unresolved_address = socket.getpeername()
 
     def reset(self):
         pass
@@ -64,11 +179,43 @@ class QuickConnection:
     def timedout(self):
         return False
 
+    def check_liveness(self, timeout=None):
+        self.liveness_checks = getattr(self, "liveness_checks", 0) + 1
+        return self.alive
+
+    def release(self):
+        if self.pool is None:
+            self.in_use = False
+        else:
+            self.pool.release(self)
+
 
 def connector(address, **kwargs):
     return QuickConnection(FakeSocket(address))
 
 
+class CheckedConnection(QuickConnection):
+    """ Connection that counts how often it is checked for liveness,
+    and that can be marked as closed.
+    """
+
+    def __init__(self, socket):
+        super(CheckedConnection, self).__init__(socket)
+        self.checks = 0
+        self.is_closed = False
+
+    def close(self):
+        self.is_closed = True
+
+    def closed(self):
+        self.checks += 1
+        return self.is_closed
+
+
+def checked_connector(address, **kwargs):
+    return CheckedConnection(FakeSocket(address))
+
+
 class ConnectionTestCase(TestCase):
 
     def test_conn_timedout(self):
@@ -90,6 +237,819 @@ class ConnectionTestCase(TestCase):
         self.assertEqual(connection.timedout(), False)
 
 
+    def test_streamed_parameter_is_sent_incrementally(self):
+        address = ("127.0.0.1", 7687)
+        socket = FakeSocket(address)
+        connection = Connection(1, address, socket)
+        rows = ({u"n": n} for n in range(100000))
+        connection.run(u"UNWIND $rows AS row RETURN row", {u"rows": rows})
+        self.assertGreater(len(socket.sent), 0)
+        connection.send_all()
+        messages = dechunk(socket.sent)
+        self.assertEqual(len(messages), 1)
+        run = Unpacker(UnpackableBuffer(messages[0])).unpack()
+        self.assertEqual(run.fields[1][u"rows"], [{u"n": n} for n in range(100000)])
+
+    def test_failure_to_send_streamed_parameter_deactivates_address(self):
+        address = ("127.0.0.1", 7687)
+        socket = BrokenSocket(address)
+        connection = Connection(1, address, socket)
+        connection.pool = DeactivationRecorder()
+        rows = ({u"n": n} for n in range(100000))
+        with self.assertRaises(OSError):
+            connection.run(u"UNWIND $rows AS row RETURN row", {u"rows": rows})
+        self.assertEqual(connection.pool.deactivated, [address])
+        self.assertTrue(connection.defunct())
+        self.assertTrue(connection.closed())
+
+    def test_pipelined_hello_is_sent_with_first_request(self):
+        address = ("127.0.0.1", 7687)
+        socket = FakeSocket(address)
+        connection = Connection(3, address, socket)
+        connection.hello(pipelined=True)
+        self.assertEqual(socket.sent, b"")
+        connection.run(u"RETURN 1")
+        connection.pull_all()
+        connection.send_all()
+        signatures = [message[1:2] for message in dechunk(socket.sent)]
+        self.assertEqual(signatures, [b"\x01", b"\x10", b"\x3F"])
+
+    def test_pipelined_hello_success(self):
+        address = ("127.0.0.1", 7687)
+        socket = ReplyingSocket(address,
+                                chunked(Structure(b"\x70", {u"server": u"Neo4j/3.5.0"}), 1024),
+                                chunked(Structure(b"\x70", {u"fields": [u"1"]}), 1024),
+                                chunked(Structure(b"\x71", [1]), 1024),
+                                chunked(Structure(b"\x70", {}), 1024))
+        connection = Connection(3, address, socket)
+        connection.hello(pipelined=True)
+        records = []
+        connection.run(u"RETURN 1")
+        connection.pull_all(on_records=records.extend)
+        connection.send_all()
+        connection.fetch_all()
+        self.assertEqual(connection.server.agent, u"Neo4j/3.5.0")
+        self.assertEqual(records, [[1]])
+
+    def test_pipeline_after_pipelined_hello(self):
+        address = ("127.0.0.1", 7687)
+        replies = [chunked(Structure(b"\x70", {u"server": u"Neo4j/3.5.0"}), 1024)]
+        for _ in range(2):
+            replies += [chunked(Structure(b"\x70", {u"fields": [u"1"]}), 1024),
+                        chunked(Structure(b"\x71", [1]), 1024),
+                        chunked(Structure(b"\x70", {}), 1024)]
+        connection = Connection(3, address, ReplyingSocket(address, *replies))
+        connection.hello(pipelined=True)
+        pipeline = Pipeline(lambda access_mode: connection, flush_every=0)
+        pipeline.push(u"RETURN 1")
+        pipeline.push(u"RETURN 1")
+        self.assertEqual([list(pipeline.pull()), list(pipeline.pull())], [[[1]], [[1]]])
+        self.assertEqual(connection.server.agent, u"Neo4j/3.5.0")
+
+    def test_liveness_check_success(self):
+        address = ("127.0.0.1", 7687)
+        socket = TimedReplyingSocket(address, chunked(Structure(b"\x70", {}), 1024))
+        connection = Connection(3, address, socket)
+        self.assertTrue(connection.check_liveness(2.0))
+        self.assertEqual(socket.sent, b"\x00\x02\xB0\x0F\x00\x00")
+        self.assertEqual(socket.timeouts, [2.0, None])
+        self.assertFalse(connection.closed())
+
+    def test_liveness_check_failure(self):
+        address = ("127.0.0.1", 7687)
+        socket = TimedReplyingSocket(address, SocketTimeout("timed out"))
+        connection = Connection(3, address, socket)
+        self.assertFalse(connection.check_liveness(2.0))
+        self.assertTrue(connection.defunct())
+        self.assertTrue(connection.closed())
+
+    def test_read_timeout_makes_connection_defunct(self):
+        address = ("127.0.0.1", 7687)
+        socket = ReplyingSocket(address, SocketTimeout("timed out"))
+        connection = Connection(3, address, socket)
+        connection.run(u"RETURN 1")
+        connection.send_all()
+        with self.assertRaises(ServiceUnavailable):
+            connection.fetch_all()
+        self.assertTrue(connection.defunct())
+        self.assertTrue(connection.closed())
+
+    def test_liveness_check_failure_on_error_reply(self):
+        address = ("127.0.0.1", 7687)
+        connection = Connection(3, address, TimedReplyingSocket(address))
+        pool = connection.pool = DeactivationRecorder()
+
+        def reset():
+            raise CypherError("The client is unauthorized")
+
+        connection.reset = reset
+        self.assertFalse(connection.check_liveness(2.0))
+        self.assertTrue(connection.defunct())
+        self.assertTrue(connection.closed())
+        self.assertIs(connection.pool, pool)
+        self.assertEqual(pool.deactivated, [])
+
+    def test_pipelined_hello_auth_failure(self):
+        address = ("127.0.0.1", 7687)
+        socket = ReplyingSocket(address,
+                                chunked(Structure(b"\x7F", {
+                                    u"code": u"Neo.ClientError.Security.Unauthorized",
+                                    u"message": u"The client is unauthorized"}), 1024),
+                                chunked(Structure(b"\x7E"), 1024),
+                                chunked(Structure(b"\x7E"), 1024))
+        connection = Connection(3, address, socket)
+        connection.hello(pipelined=True)
+        connection.run(u"RETURN 1")
+        connection.pull_all()
+        connection.send_all()
+        with self.assertRaises(AuthError):
+            connection.fetch_all()
+        self.assertTrue(connection.defunct())
+        self.assertTrue(connection.closed())
+
+    def test_failed_message_is_not_sent(self):
+        address = ("127.0.0.1", 7687)
+        socket = FakeSocket(address)
+        connection = Connection(1, address, socket)
+        connection.run(u"RETURN 1")
+        with self.assertRaises(ValueError):
+            connection.run(u"RETURN $x", {u"x": object()})
+        connection.send_all()
+        self.assertFalse(connection.defunct())
+        self.assertEqual(len(dechunk(socket.sent)), 1)
+
+    def test_failure_in_partly_sent_message_makes_connection_defunct(self):
+        address = ("127.0.0.1", 7687)
+        connection = Connection(1, address, FakeSocket(address))
+
+        def rows():
+            for n in range(100000):
+                yield n
+            yield object()
+
+        with self.assertRaises(ValueError):
+            connection.run(u"UNWIND $rows AS row RETURN row", {u"rows": rows()})
+        self.assertTrue(connection.defunct())
+        self.assertTrue(connection.closed())
+
+    def test_cached_run_is_encoded_identically(self):
+        address = ("127.0.0.1", 7687)
+        sockets = [FakeSocket(address), FakeSocket(address)]
+        connections = [Connection(1, address, sockets[0]),
+                       Connection(1, address, sockets[1], run_cache_size=0)]
+        for connection in connections:
+            for i in range(3):
+                connection.run(u"RETURN $x", {u"x": i}, mode="r", bookmarks=[u"bm:1"])
+                connection.run(u"RETURN $x", {u"x": i}, timeout=5, metadata={u"app": u"test"})
+            connection.send_all()
+        self.assertEqual(sockets[0].sent, sockets[1].sent)
+        self.assertIsNone(connections[1].run_cache)
+
+    def test_run_cache_counts_hits_and_misses(self):
+        address = ("127.0.0.1", 7687)
+        connection = Connection(1, address, FakeSocket(address))
+        connection.run(u"RETURN $x", {u"x": 1})
+        connection.run(u"RETURN $x", {u"x": 2})
+        connection.run(u"RETURN $x", {u"x": 3}, mode="r")
+        connection.run(u"RETURN $x", {u"x": 4}, metadata={u"app": u"test"})
+        self.assertEqual(connection.run_cache.hits, 1)
+        self.assertEqual(connection.run_cache.misses, 2)
+        self.assertEqual(len(connection.run_cache), 2)
+
+    def test_failed_cached_run_is_not_sent(self):
+        address = ("127.0.0.1", 7687)
+        socket = FakeSocket(address)
+        connection = Connection(1, address, socket)
+        connection.run(u"RETURN $x", {u"x": 1})
+        with self.assertRaises(ValueError):
+            connection.run(u"RETURN $x", {u"x": object()})
+        connection.send_all()
+        self.assertEqual(len(dechunk(socket.sent)), 1)
+
+
+class ScatterGatherSocket:
+    """ Socket that supports sendmsg, sending no more than a given
+    number of bytes per call.
+    """
+
+    def __init__(self, max_send):
+        self.max_send = max_send
+        self.sent = bytearray()
+        self.calls = 0
+
+    def sendmsg(self, buffers):
+        self.calls += 1
+        data = b"".join(buffers)[:self.max_send]
+        self.sent += data
+        return len(data)
+
+
+class OutboxTestCase(TestCase):
+
+    def test_message_is_chunked(self):
+        outbox = Outbox()
+        outbox.write(b"\x01\x02\x03")
+        outbox.chunk()
+        outbox.chunk()
+        self.assertEqual(b"".join(outbox.buffers()), b"\x00\x03\x01\x02\x03\x00\x00")
+        self.assertEqual(len(outbox), 7)
+
+    def test_large_write_is_split_into_chunks(self):
+        outbox = Outbox(max_chunk_size=4)
+        outbox.write(b"\x01\x02")
+        outbox.write(b"\x03\x04\x05")
+        outbox.write(b"\x06\x07\x08\x09\x0A\x0B")
+        self.assertEqual(b"".join(outbox.buffers()),
+                         b"\x00\x02\x01\x02\x00\x04\x03\x04\x05\x06"
+                         b"\x00\x04\x07\x08\x09\x0A\x00\x01\x0B")
+        self.assertEqual(len(outbox), 19)
+
+    def test_written_data_is_not_copied(self):
+        data = bytearray(b"\x01\x02")
+        outbox = Outbox()
+        outbox.write(data)
+        data[0] = 0xFF
+        self.assertEqual(b"".join(outbox.buffers()), b"\x00\x02\xFF\x02")
+
+    def test_rewind(self):
+        outbox = Outbox(max_chunk_size=4)
+        outbox.write(b"\x01\x02")
+        mark = outbox.mark()
+        outbox.write(b"\x03\x04\x05\x06\x07")
+        outbox.chunk()
+        self.assertTrue(outbox.rewind(mark))
+        self.assertEqual(b"".join(outbox.buffers()), b"\x00\x02\x01\x02")
+        self.assertEqual(len(outbox), 4)
+
+    def test_end_message(self):
+        outbox = Outbox()
+        outbox.write(b"\x01\x02\x03")
+        outbox.end_message()
+        outbox.write(b"\x04")
+        outbox.end_message()
+        self.assertEqual(b"".join(outbox.buffers()),
+                         b"\x00\x03\x01\x02\x03\x00\x00\x00\x01\x04\x00\x00")
+        self.assertEqual(len(outbox), 12)
+
+    def test_end_message_after_full_chunk(self):
+        outbox = Outbox(max_chunk_size=2)
+        outbox.write(b"\x01\x02\x03\x04")
+        outbox.end_message()
+        self.assertEqual(b"".join(outbox.buffers()),
+                         b"\x00\x02\x01\x02\x00\x02\x03\x04\x00\x00")
+        self.assertEqual(len(outbox), 10)
+
+    def test_clear(self):
+        outbox = Outbox()
+        outbox.write(b"\x01\x02")
+        outbox.chunk()
+        outbox.clear()
+        self.assertEqual(outbox.buffers(), [])
+        self.assertEqual(len(outbox), 0)
+
+
+class CoalesceTestCase(TestCase):
+
+    def test_small_buffers_are_joined(self):
+        self.assertEqual(coalesce([b"\x00\x02", b"\x01\x02", b"\x00\x00"]),
+                         [b"\x00\x02\x01\x02\x00\x00"])
+
+    def test_large_buffers_are_not_copied(self):
+        large = memoryview(bytearray(8))
+        coalesced = coalesce([b"\x00\x08", large, b"\x00\x00"], threshold=4)
+        self.assertEqual(coalesced, [b"\x00\x08", large, b"\x00\x00"])
+        self.assertIs(coalesced[1], large)
+
+    def test_runs_either_side_of_large_buffer(self):
+        large = b"\xFF" * 4
+        coalesced = coalesce([b"\x01", b"\x02", large, b"\x03", b"\x04"], threshold=4)
+        self.assertEqual(coalesced, [b"\x01\x02", large, b"\x03\x04"])
+
+
+class AutoChunkSizeTestCase(TestCase):
+
+    def test_whole_segments_within_send_buffer(self):
+        sock = TunedSocket(("127.0.0.1", 7687), 1460, 16384)
+        self.assertEqual(auto_chunk_size(sock), 11 * 1460 - 2)
+
+    def test_limited_by_chunk_header(self):
+        sock = TunedSocket(("127.0.0.1", 7687), 1460, 1 << 20)
+        self.assertEqual(auto_chunk_size(sock), 44 * 1460 - 2)
+
+    def test_single_large_segment(self):
+        sock = TunedSocket(("127.0.0.1", 7687), 65483, 1 << 20)
+        self.assertEqual(auto_chunk_size(sock), 65481)
+
+    def test_connection_with_auto_chunk_size(self):
+        sock = TunedSocket(("127.0.0.1", 7687), 1460, 16384)
+        connection = Connection(3, ("127.0.0.1", 7687), sock, max_chunk_size="auto")
+        self.assertEqual(connection.outbox.max_chunk_size(), 11 * 1460 - 2)
+
+    def test_connection_with_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            _ = Connection(3, ("127.0.0.1", 7687), FakeSocket(("127.0.0.1", 7687)),
+                           max_chunk_size=0x10000)
+
+
+class SendBuffersTestCase(TestCase):
+
+    def test_buffers_are_sent_in_one_call(self):
+        sock = ScatterGatherSocket(1000)
+        send_buffers(sock, [b"\x00\x02", b"\x01\x02", b"\x00\x00"])
+        self.assertEqual(sock.sent, b"\x00\x02\x01\x02\x00\x00")
+        self.assertEqual(sock.calls, 1)
+
+    def test_partial_sends_are_resumed(self):
+        sock = ScatterGatherSocket(3)
+        buffers = [b"\x00\x02", b"\x01\x02", b"\x00\x05", b"\x03\x04\x05\x06\x07"]
+        send_buffers(sock, buffers)
+        self.assertEqual(sock.sent, b"".join(buffers))
+        self.assertEqual(sock.calls, 4)
+
+    def test_small_buffers_are_coalesced(self):
+        sock = ScatterGatherSocket(1 << 20)
+        buffers = []
+        for _ in range(2 * MAX_SEND_BUFFERS):
+            buffers.extend([b"\x00\x01", b"\x01", b"\x00\x00"])
+        send_buffers(sock, buffers)
+        self.assertEqual(sock.sent, b"".join(buffers))
+        self.assertEqual(sock.calls, 1)
+
+    def test_socket_without_sendmsg(self):
+        sock = FakeSocket(("127.0.0.1", 7687))
+        send_buffers(sock, [b"\x00\x02", b"\x01\x02"])
+        self.assertEqual(sock.sent, b"\x00\x02\x01\x02")
+
+
+class SocketOptionsTestCase(TestCase):
+
+    def test_defaults(self):
+        s = OptionSocket()
+        apply_socket_options(s)
+        self.assertEqual(s.options[(socket.SOL_SOCKET, socket.SO_KEEPALIVE)], 1)
+        self.assertEqual(s.options[(socket.IPPROTO_TCP, socket.TCP_NODELAY)], 1)
+        self.assertNotIn((socket.SOL_SOCKET, socket.SO_SNDBUF), s.options)
+        self.assertNotIn((socket.SOL_SOCKET, socket.SO_RCVBUF), s.options)
+
+    def test_settings(self):
+        s = OptionSocket()
+        apply_socket_options(s, tcp_no_delay=False, send_buffer_size=65536)
+        self.assertEqual(s.options[(socket.IPPROTO_TCP, socket.TCP_NODELAY)], 0)
+        self.assertEqual(s.options[(socket.SOL_SOCKET, socket.SO_SNDBUF)], 65536)
+
+    def test_invalid_setting_is_named(self):
+        s = OptionSocket()
+        with self.assertRaises(ValueError) as context:
+            apply_socket_options(s, send_buffer_size=-1)
+        self.assertIn("send_buffer_size", str(context.exception))
+
+    def test_invalid_setting_is_not_reported_as_unreachable_server(self):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        try:
+            with self.assertRaises(ValueError):
+                _connect(listener.getsockname(), send_buffer_size="large")
+        finally:
+            listener.close()
+
+    @skipUnless(hasattr(socket, "TCP_USER_TIMEOUT"), "TCP_USER_TIMEOUT not available")
+    def test_user_timeout_is_set_in_milliseconds(self):
+        s = OptionSocket()
+        apply_socket_options(s, tcp_user_timeout=2.5)
+        self.assertEqual(s.options[(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT)], 2500)
+
+    @skipUnless(hasattr(socket, "TCP_KEEPIDLE"), "TCP_KEEPIDLE not available")
+    def test_effective_values(self):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        try:
+            s = _connect(listener.getsockname(), keep_alive_idle=45, tcp_no_delay=True,
+                         receive_buffer_size=65536)
+            try:
+                connection = Connection(3, listener.getsockname(), s)
+                options = connection.socket_options()
+            finally:
+                s.close()
+        finally:
+            listener.close()
+        self.assertIs(options["keep_alive"], True)
+        self.assertIs(options["tcp_no_delay"], True)
+        self.assertEqual(options["keep_alive_idle"], 45)
+        self.assertGreaterEqual(options["receive_buffer_size"], 65536)
+
+
+class FakeConnection:
+
+    def __init__(self, name):
+        self.name = name
+        self.closed = Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def attempt(name, duration, error=None):
+    """ Return a connection attempt that takes a given time and then
+    either raises an error or returns a connection.
+    """
+    def f():
+        sleep(duration)
+        if error:
+            raise error
+        return FakeConnection(name)
+    return f
+
+
+class InterleaveTestCase(TestCase):
+
+    def test_families_alternate(self):
+        v6a, v6b = ("::1", 7687, 0, 0), ("::2", 7687, 0, 0)
+        v4a, v4b, v4c = ("127.0.0.1", 7687), ("127.0.0.2", 7687), ("127.0.0.3", 7687)
+        self.assertEqual(_interleave([v6a, v6b, v4a, v4b, v4c]), [v6a, v4a, v6b, v4b, v4c])
+        self.assertEqual(_interleave([v4a, v4b, v6a]), [v4a, v6a, v4b])
+
+    def test_single_family(self):
+        v4a, v4b = ("127.0.0.1", 7687), ("127.0.0.2", 7687)
+        self.assertEqual(_interleave([v4a, v4b]), [v4a, v4b])
+
+
+class RaceTestCase(TestCase):
+
+    def test_first_attempt_succeeds_within_delay(self):
+        connection = _race([attempt("a", 0), attempt("b", 0)], delay=1)
+        self.assertEqual(connection.name, "a")
+
+    def test_slow_attempt_does_not_hold_up_others(self):
+        t0 = perf_counter()
+        connection = _race([attempt("dead", 2, ServiceUnavailable("timed out")),
+                            attempt("live", 0)], delay=0.05)
+        self.assertEqual(connection.name, "live")
+        self.assertLess(perf_counter() - t0, 1)
+
+    def test_failure_starts_next_attempt_immediately(self):
+        t0 = perf_counter()
+        connection = _race([attempt("refused", 0, ServiceUnavailable("refused")),
+                            attempt("live", 0)], delay=5)
+        self.assertEqual(connection.name, "live")
+        self.assertLess(perf_counter() - t0, 1)
+
+    def test_losing_connections_are_closed(self):
+        losers = []
+
+        def slow():
+            sleep(0.2)
+            losers.append(FakeConnection("slow"))
+            return losers[-1]
+
+        connection = _race([slow, attempt("fast", 0.05)], delay=0.01)
+        self.assertEqual(connection.name, "fast")
+        self.assertFalse(connection.closed.is_set())
+        for _ in range(100):
+            if losers:
+                break
+            sleep(0.05)
+        self.assertTrue(losers[0].closed.wait(5))
+
+    def test_last_error_is_raised_if_all_fail(self):
+        with self.assertRaises(ServiceUnavailable) as context:
+            _race([attempt("a", 0, ServiceUnavailable("a")),
+                   attempt("b", 0.05, ServiceUnavailable("b"))], delay=0.01)
+        self.assertEqual(context.exception.args, ("b",))
+
+
+class HandshakeServer(Thread):
+    """ Server that accepts a single connection and then replies to
+    the Bolt handshake and HELLO, or stays silent if told to.
+    """
+
+    def __init__(self, silent=False, connections=1, version=3):
+        super(HandshakeServer, self).__init__(daemon=True)
+        self.silent = silent
+        self.version = version
+        self.connections = connections
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.address = Address(self.listener.getsockname())
+        self.done = Event()
+
+    def run(self):
+        try:
+            for _ in range(self.connections):
+                s, _ = self.listener.accept()
+                try:
+                    if self.silent:
+                        self.done.wait(5)
+                    else:
+                        s.settimeout(5)
+                        s.recv(20)
+                        s.sendall(struct_pack(">I", self.version))
+                        if self.version:
+                            s.recv(65536)
+                            s.sendall(b"\x00\x03\xB1\x70\xA0\x00\x00")
+                        # Wait for the client to close the connection
+                        while s.recv(65536):
+                            pass
+                finally:
+                    s.close()
+        finally:
+            self.listener.close()
+
+
+class FakeSecureSocket:
+    """ Stand-in for an SSL socket, wrapping a plain socket.
+    """
+
+    def __init__(self, s, session, resume=True):
+        self._socket = s
+        self.session_reused = resume and session is not None
+        self.session = session or object()
+
+    def __getattr__(self, name):
+        return getattr(self._socket, name)
+
+    def getpeercert(self, binary_form=False):
+        return b"certificate"
+
+
+class FakeSSLContext:
+    """ Stand-in for an SSL context, recording the sessions passed
+    to it for resumption, and resuming them only if told to.
+    """
+
+    def __init__(self, resume=True):
+        self.sessions = []
+        self.resume = resume
+
+    def wrap_socket(self, s, server_hostname=None, session=None):
+        self.sessions.append(session)
+        return FakeSecureSocket(s, session, self.resume)
+
+
+class HandshakeTestCase(TestCase):
+
+    def test_steps_are_timed(self):
+        server = HandshakeServer()
+        server.start()
+        try:
+            connection = connect(server.address, connection_timeout=5)
+            self.assertEqual(connection.protocol_version, 3)
+            self.assertEqual(list(connection.timings), ["connect", "handshake", "hello"])
+            self.assertTrue(all(duration >= 0 for duration in connection.timings.values()))
+            self.assertIsNone(connection.socket.gettimeout())
+            connection.close()
+        finally:
+            server.done.set()
+
+    def test_read_timeout_is_set(self):
+        server = HandshakeServer()
+        server.start()
+        try:
+            connection = connect(server.address, connection_timeout=5, read_timeout=30)
+            self.assertEqual(connection.socket.gettimeout(), 30)
+            connection.close()
+        finally:
+            server.done.set()
+
+    def test_tls_session_is_reused(self):
+        ssl_context = FakeSSLContext()
+        cache = TLSSessionCache()
+        server = HandshakeServer(connections=2)
+        server.start()
+        connections = []
+        for _ in range(2):
+            connection = connect(server.address, ssl_context=ssl_context,
+                                 tls_session_cache=cache)
+            connections.append(connection)
+            connection.close()
+        self.assertIn("secure", connections[0].timings)
+        self.assertEqual(ssl_context.sessions, [None, connections[0].socket.session])
+        self.assertTrue(connections[1].socket.session_reused)
+        self.assertEqual(len(cache), 1)
+
+    def test_no_agreed_version(self):
+        server = HandshakeServer(version=0)
+        server.start()
+        try:
+            with self.assertRaises(ServiceUnavailable):
+                _ = connect(server.address, connection_timeout=5)
+        finally:
+            server.done.set()
+
+    def test_tls_session_not_resumed_is_discarded(self):
+        ssl_context = FakeSSLContext(resume=False)
+        cache = TLSSessionCache()
+        server = HandshakeServer(version=0)
+        server.start()
+        try:
+            cache.put((server.address[0], server.address), object())
+            with self.assertRaises(ServiceUnavailable):
+                _ = connect(server.address, ssl_context=ssl_context,
+                            tls_session_cache=cache)
+            self.assertEqual(len(cache), 0)
+        finally:
+            server.done.set()
+
+    def test_silent_server_times_out(self):
+        server = HandshakeServer(silent=True)
+        server.start()
+        try:
+            t0 = perf_counter()
+            with self.assertRaises(ServiceUnavailable):
+                _ = connect(server.address, connection_timeout=0.2)
+            self.assertLess(perf_counter() - t0, 2)
+        finally:
+            server.done.set()
+
+
+class BufferedSocketTestCase(TestCase):
+
+    @staticmethod
+    def read(sock, n_bytes):
+        sock.fill(n_bytes)
+        data = bytes(sock.buffer[sock.r_pos:(sock.r_pos + n_bytes)])
+        sock.r_pos += n_bytes
+        return data
+
+    def test_reads_ahead(self):
+        sock = BufferedSocket(ReadableSocket(b"\x01\x02\x03\x04"), 16)
+        self.assertEqual(self.read(sock, 2), b"\x01\x02")
+        self.assertEqual(self.read(sock, 2), b"\x03\x04")
+        self.assertEqual(sock.socket.reads, 1)
+
+    def test_reads_until_enough_data(self):
+        sock = BufferedSocket(ReadableSocket(b"\x01", b"\x02", b"\x03"), 16)
+        self.assertEqual(self.read(sock, 3), b"\x01\x02\x03")
+
+    def test_grows_to_fit_data(self):
+        data = bytes(range(100))
+        sock = BufferedSocket(ReadableSocket(data), 16)
+        self.assertEqual(self.read(sock, 100), data)
+
+    def test_closed_socket(self):
+        sock = BufferedSocket(ReadableSocket(b"\x01"), 16)
+        with self.assertRaises(OSError):
+            sock.fill(2)
+
+    def test_timeout_is_raised(self):
+        sock = BufferedSocket(ReadableSocket(SocketTimeout("timed out")), 16)
+        with self.assertRaises(SocketTimeout):
+            sock.fill(2)
+
+
+class ResettableConnection:
+
+    def __init__(self):
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+
+class ResponseTestCase(TestCase):
+
+    def test_handlers_are_called(self):
+        calls = []
+        response = Response(ResettableConnection(),
+                            on_records=lambda records: calls.append(("records", records)),
+                            on_success=lambda metadata: calls.append(("success", metadata)),
+                            on_summary=lambda: calls.append(("summary",)))
+        response.on_records([[1]])
+        response.on_success({u"t_last": 1})
+        self.assertEqual(calls, [("records", [[1]]), ("success", {u"t_last": 1}), ("summary",)])
+
+    def test_missing_handlers_are_skipped(self):
+        response = Response(ResettableConnection())
+        response.on_records([[1]])
+        response.on_success({})
+        response.on_ignored({})
+
+    def test_failure_resets_connection(self):
+        calls = []
+        connection = ResettableConnection()
+        response = Response(connection,
+                            on_failure=lambda metadata: calls.append("failure"),
+                            on_summary=lambda: calls.append("summary"))
+        with self.assertRaises(CypherError):
+            response.on_failure({u"code": u"Neo.ClientError.Statement.SyntaxError",
+                                 u"message": u"Invalid input"})
+        self.assertEqual(connection.resets, 1)
+        self.assertEqual(calls, ["failure", "summary"])
+
+    def test_ignored(self):
+        calls = []
+        response = Response(ResettableConnection(),
+                            on_ignored=lambda metadata: calls.append("ignored"),
+                            on_summary=lambda: calls.append("summary"))
+        response.on_ignored({})
+        self.assertEqual(calls, ["ignored", "summary"])
+
+    def test_unknown_handler_is_rejected(self):
+        with self.assertRaises(TypeError):
+            _ = Response(ResettableConnection(), on_record=print)
+
+    def test_has_no_instance_dictionary(self):
+        self.assertFalse(hasattr(Response(ResettableConnection()), "__dict__"))
+
+
+def chunked(message, chunk_size):
+    """ Encode a message and split it into chunks of a given size.
+    """
+    stream = BytesIO()
+    Packer(stream).pack(message)
+    data = stream.getvalue()
+    chunks = []
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:(start + chunk_size)]
+        chunks.append(struct_pack(">H", len(chunk)) + chunk)
+    chunks.append(b"\x00\x00")
+    return b"".join(chunks)
+
+
+class InboxTestCase(TestCase):
+
+    def fetch(self, data, piece_size, n_messages):
+        pieces = [data[i:(i + piece_size)] for i in range(0, len(data), piece_size)]
+        inbox = Inbox(BufferedSocket(ReadableSocket(*pieces), 16), on_error=None)
+        messages = []
+        for _ in range(n_messages):
+            details, summary_signature, summary_metadata = next(inbox)
+            messages.append((list(details), summary_signature, summary_metadata))
+        return messages
+
+    def test_single_and_multiple_chunk_messages(self):
+        record = Structure(b"\x71", [u"Alice", list(range(100)), {u"x": 1.5}])
+        success = Structure(b"\x70", {u"fields": [u"a", u"b", u"c"]})
+        data = (chunked(success, 1000) + b"\x00\x00" + chunked(record, 50) +
+                chunked(record, 1000) + chunked(success, 7))
+        for piece_size in (1, 3, 64, len(data)):
+            messages = self.fetch(data, piece_size, 4)
+            self.assertEqual(messages[0], ([], b"\x70", {u"fields": [u"a", u"b", u"c"]}))
+            self.assertEqual(messages[1][0], [[u"Alice", list(range(100)), {u"x": 1.5}]])
+            self.assertEqual(messages[2][0], [[u"Alice", list(range(100)), {u"x": 1.5}]])
+            self.assertEqual(messages[3], ([], b"\x70", {u"fields": [u"a", u"b", u"c"]}))
+
+    def test_lazy_records_are_copied(self):
+        record = Structure(b"\x71", [u"Alice", 33])
+        data = chunked(record, 1000) + chunked(record, 3)
+        pieces = [data[i:(i + 5)] for i in range(0, len(data), 5)]
+        inbox = Inbox(BufferedSocket(ReadableSocket(*pieces), 16), on_error=None)
+        inbox.lazy_records = True
+        unpackers = [next(inbox)[0][0], next(inbox)[0][0]]
+        for unpacker in unpackers:
+            self.assertEqual(unpacker.unpack(), [u"Alice", 33])
+
+    def test_lazy_records_share_string_cache(self):
+        record = Structure(b"\x71", [u"Alice", 33])
+        data = chunked(record, 1000) * 2
+        cache = StringCache()
+        inbox = Inbox(BufferedSocket(ReadableSocket(data), 16), on_error=None,
+                      string_cache=cache)
+        inbox.lazy_records = True
+        values = [next(inbox)[0][0].unpack(), next(inbox)[0][0].unpack()]
+        self.assertIs(values[0][0], values[1][0])
+        self.assertEqual(cache.hits, 1)
+
+
+class RunCacheTestCase(TestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = RunCache(capacity=2)
+        cache.encode("A", u"A", {})
+        cache.encode("B", u"B", {})
+        cache.encode("A", u"A", {})
+        cache.encode("C", u"C", {})
+        self.assertEqual(list(cache.entries), ["A", "C"])
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 3)
+
+    def test_encoded_parts(self):
+        cache = RunCache()
+        head, tail = cache.encode("A", u"RETURN 1", {u"mode": u"r"})
+        self.assertEqual(head, b"\xB3\x10\x88RETURN 1")
+        self.assertEqual(tail, b"\xA1\x84mode\x81r")
+
+
+def dechunk(data):
+    """ Split chunked data into a list of messages.
+    """
+    messages = []
+    message = bytearray()
+    p = 0
+    while p < len(data):
+        size, = struct_unpack(">H", data[p:(p + 2)])
+        p += 2
+        if size == 0:
+            messages.append(bytes(message))
+            message = bytearray()
+        else:
+            message += data[p:(p + size)]
+            p += size
+    return messages
+
+
 class ConnectionPoolTestCase(TestCase):
 
     def setUp(self):
@@ -200,6 +1160,433 @@ class ConnectionPoolTestCase(TestCase):
             self.assert_pool_size(address, 0, 5, pool)
 
 
+    def test_most_recently_released_connection_is_reused(self):
+        address = ("127.0.0.1", 7687)
+        connections = [self.pool.acquire_direct(address) for _ in range(3)]
+        for connection in connections:
+            self.pool.release(connection)
+        self.assertIs(self.pool.acquire_direct(address), connections[2])
+        self.assertIs(self.pool.acquire_direct(address), connections[1])
+
+    def test_only_the_candidate_connection_is_checked(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(checked_connector, address, max_connection_pool_size=-1) as pool:
+            in_use = [pool.acquire_direct(address) for _ in range(500)]
+            idle = pool.acquire_direct(address)
+            pool.release(idle)
+            for _ in range(100):
+                pool.release(pool.acquire_direct(address))
+            # Checked each time it is taken and each time it is released
+            self.assertEqual(idle.checks, 201)
+            self.assertEqual(sum(connection.checks for connection in in_use), 0)
+            self.assertEqual(pool.in_use_connection_count(address), 500)
+
+    def test_closed_idle_connection_is_discarded(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(checked_connector, address) as pool:
+            connection_1 = pool.acquire_direct(address)
+            connection_2 = pool.acquire_direct(address)
+            pool.release(connection_1)
+            pool.release(connection_2)
+            connection_2.is_closed = True
+            self.assertIs(pool.acquire_direct(address), connection_1)
+            self.assert_pool_size(address, 1, 0, pool)
+
+    def test_closed_connection_is_not_returned_on_release(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(checked_connector, address) as pool:
+            connection = pool.acquire_direct(address)
+            connection.is_closed = True
+            pool.release(connection)
+            self.assertFalse(connection.in_use)
+            self.assert_pool_size(address, 0, 0, pool)
+
+    def test_connection_removed_while_in_use_is_not_returned(self):
+        address = ("127.0.0.1", 7687)
+        connection = self.pool.acquire_direct(address)
+        self.pool.remove(address)
+        connection.release()
+        self.assertFalse(connection.in_use)
+        self.assert_pool_size(address, 0, 0)
+        self.assertIsNot(self.pool.acquire_direct(address), connection)
+
+    def test_sessions_wake_waiting_threads(self):
+        # Many more threads than connections, each borrowing connections
+        # through sessions. Any thread not woken when a connection is
+        # released would wait out the acquisition timeout.
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, max_connection_pool_size=10,
+                            connection_acquisition_timeout=30) as pool:
+            errors = []
+
+            def borrow():
+                try:
+                    for _ in range(4):
+                        session = Session(pool.acquire)
+                        session._connect()
+                        sleep(0.001)
+                        session._disconnect()
+                except Exception as error:
+                    errors.append(error)
+
+            threads = [Thread(target=borrow) for _ in range(500)]
+            t0 = perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(errors, [])
+            self.assertLess(perf_counter() - t0, 20)
+            self.assert_pool_size(address, 0, 10, pool)
+
+    def test_closing_pool_wakes_waiting_threads(self):
+        address = ("127.0.0.1", 7687)
+        pool = ConnectionPool(connector, address, max_connection_pool_size=1,
+                              connection_acquisition_timeout=30)
+        pool.acquire_direct(address)
+        errors = []
+
+        def wait_for_connection():
+            try:
+                pool.acquire_direct(address)
+            except Exception as error:
+                errors.append(error)
+
+        t = Thread(target=wait_for_connection)
+        t.start()
+        sleep(0.1)
+        t0 = perf_counter()
+        pool.close()
+        t.join(5)
+        self.assertLess(perf_counter() - t0, 5)
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], ServiceUnavailable)
+
+    def test_slow_connect_does_not_block_other_addresses(self):
+        slow_address = ("127.0.0.1", 7687)
+        fast_address = ("127.0.0.1", 7688)
+        connecting = Event()
+        proceed = Event()
+
+        def slow_connector(address, **kwargs):
+            if address == slow_address:
+                connecting.set()
+                proceed.wait(5)
+            return connector(address)
+
+        with ConnectionPool(slow_connector, slow_address) as pool:
+            t = Thread(target=pool.acquire_direct, args=(slow_address,))
+            t.start()
+            try:
+                self.assertTrue(connecting.wait(5))
+                t0 = perf_counter()
+                connection = pool.acquire_direct(fast_address)
+                self.assertLess(perf_counter() - t0, 1)
+                self.assertEqual(connection.address, fast_address)
+                self.assertEqual(pool.in_use_connection_count(slow_address), 1)
+            finally:
+                proceed.set()
+                t.join(5)
+            self.assert_pool_size(slow_address, 1, 0, pool)
+            self.assertEqual(pool.reservations, {})
+
+    def test_connections_being_opened_count_towards_max_pool_size(self):
+        address = ("127.0.0.1", 7687)
+        opened = []
+        proceed = Event()
+
+        def slow_connector(address, **kwargs):
+            opened.append(address)
+            proceed.wait(5)
+            return connector(address)
+
+        with ConnectionPool(slow_connector, address, max_connection_pool_size=3,
+                            connection_acquisition_timeout=30) as pool:
+            acquired = []
+            threads = [Thread(target=lambda: acquired.append(pool.acquire_direct(address)))
+                       for _ in range(6)]
+            for t in threads:
+                t.start()
+            sleep(0.2)
+            self.assertEqual(len(opened), 3)
+            proceed.set()
+            sleep(0.1)
+            for connection in list(acquired):
+                pool.release(connection)
+            for t in threads:
+                t.join(5)
+            self.assertEqual(len(opened), 3)
+            self.assertEqual(len(acquired), 6)
+            self.assert_pool_size(address, 3, 0, pool)
+
+    def test_connection_released_at_acquisition_timeout_is_used(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, max_connection_pool_size=1,
+                            connection_acquisition_timeout=1) as pool:
+            connection = pool.acquire_direct(address)
+            condition = pool._condition(address)
+            clock = [0.0]
+
+            def wait(timeout=None):
+                # The connection is released just as the wait times out
+                clock[0] += timeout
+                pool.release(connection)
+                return False
+
+            condition.wait = wait
+            with patch("neo4j.bolt.direct.perf_counter", lambda: clock[0]):
+                self.assertIs(pool.acquire_direct(address), connection)
+            self.assert_pool_size(address, 1, 0, pool)
+
+    def test_failed_connect_gives_up_reservation(self):
+        address = ("127.0.0.1", 7687)
+
+        def failing_connector(address, **kwargs):
+            raise ServiceUnavailable("Failed to establish connection")
+
+        with ConnectionPool(failing_connector, address, max_connection_pool_size=1) as pool:
+            for _ in range(2):
+                with self.assertRaises(ServiceUnavailable):
+                    pool.acquire_direct(address)
+            self.assertEqual(pool.reservations, {})
+            self.assertEqual(pool.in_use_connection_count(address), 0)
+
+    def test_failed_top_up_wakes_all_waiters(self):
+        address = ("127.0.0.1", 7687)
+
+        def failing_connector(address, **kwargs):
+            raise ServiceUnavailable("Failed to establish connection")
+
+        with ConnectionPool(failing_connector, address, min_idle_connections=1) as pool:
+            condition = pool._condition(address)
+            wakeups = []
+            condition.notify = lambda n=1: wakeups.append(n)
+            condition.notify_all = lambda: wakeups.append("all")
+            pool.maintain()
+            self.assertEqual(wakeups, ["all"])
+
+    def test_failed_liveness_check_wakes_all_waiters(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, liveness_check_timeout=60) as pool:
+            connection = pool.acquire_direct(address)
+            pool.release(connection)
+            connection.idle_since -= 120
+            connection.alive = False
+            condition = pool._condition(address)
+            wakeups = []
+            condition.notify = lambda n=1: wakeups.append(n)
+            condition.notify_all = lambda: wakeups.append("all")
+            self.assertIsNot(pool.acquire_direct(address), connection)
+            self.assertEqual(wakeups, ["all"])
+
+    def test_warm_up_opens_idle_connections(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, min_idle_connections=3) as pool:
+            pool.warm_up()
+            self.assert_pool_size(address, 0, 3, pool)
+            connection = pool.acquire_direct(address)
+            self.assertIsNotNone(connection.idle_since)
+            self.assert_pool_size(address, 1, 2, pool)
+
+    def test_warm_up_opens_one_connection_without_minimum(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address) as pool:
+            pool.warm_up()
+            pool.warm_up()
+            self.assert_pool_size(address, 0, 1, pool)
+
+    def test_warm_up_does_not_exceed_max_pool_size(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, max_connection_pool_size=2) as pool:
+            pool.acquire_direct(address)
+            pool.warm_up(5)
+            self.assert_pool_size(address, 1, 1, pool)
+
+    def test_maintain_closes_unusable_connections(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(checked_connector, address, min_idle_connections=2) as pool:
+            pool.warm_up()
+            stale = pool.idle_connections[address][0]
+            stale.is_closed = True
+            pool.maintain()
+            self.assertIsNone(stale.pool)
+            self.assertNotIn(stale, pool.connections[address])
+            self.assert_pool_size(address, 0, 2, pool)
+
+    def test_maintain_closes_surplus_long_idle_connections(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, min_idle_connections=1, max_idle_time=60) as pool:
+            connections = [pool.acquire_direct(address) for _ in range(3)]
+            for connection in connections:
+                pool.release(connection)
+            for connection in connections:
+                connection.idle_since -= 120
+            pool.maintain()
+            # The most recently used connection is kept
+            self.assertEqual(pool.idle_connections[address], [connections[-1]])
+            self.assert_pool_size(address, 0, 1, pool)
+
+    def test_maintain_keeps_recently_idle_connections(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, max_idle_time=60) as pool:
+            connections = [pool.acquire_direct(address) for _ in range(3)]
+            for connection in connections:
+                pool.release(connection)
+            connections[0].idle_since -= 120
+            pool.maintain()
+            self.assertEqual(pool.idle_connections[address], connections[1:])
+
+    def test_maintain_skips_unreachable_addresses(self):
+        address = ("127.0.0.1", 7687)
+
+        def failing_connector(address, **kwargs):
+            raise ServiceUnavailable("Failed to establish connection")
+
+        with ConnectionPool(failing_connector, address, min_idle_connections=1) as pool:
+            pool.maintain()
+            self.assert_pool_size(address, 0, 0, pool)
+            self.assertEqual(pool.reservations, {})
+
+    def test_failed_top_up_keeps_connections_in_use(self):
+        address = ("127.0.0.1", 7687)
+        reachable = [True]
+
+        def flaky_connector(address, **kwargs):
+            if not reachable[0]:
+                raise ServiceUnavailable("Failed to establish connection")
+            return checked_connector(address)
+
+        with ConnectionPool(flaky_connector, address, min_idle_connections=1) as pool:
+            connection = pool.acquire_direct(address)
+            reachable[0] = False
+            pool.maintain()
+            self.assertIs(connection.pool, pool)
+            self.assertFalse(connection.is_closed)
+            self.assert_pool_size(address, 1, 0, pool)
+            self.assertEqual(pool.reservations, {})
+
+    def test_maintenance_thread_tops_up_idle_connections(self):
+        address = ("127.0.0.1", 7687)
+        pool = ConnectionPool(connector, address, min_idle_connections=2,
+                              maintenance_interval=0.01)
+        pool.start_maintenance()
+        try:
+            t0 = perf_counter()
+            while len(pool.idle_connections.get(address, ())) < 2 and perf_counter() - t0 < 5:
+                sleep(0.01)
+            self.assert_pool_size(address, 0, 2, pool)
+            pool.acquire_direct(address)
+            pool.acquire_direct(address)
+            t0 = perf_counter()
+            while len(pool.idle_connections[address]) < 2 and perf_counter() - t0 < 5:
+                sleep(0.01)
+            self.assert_pool_size(address, 2, 2, pool)
+        finally:
+            pool.close()
+        pool._maintenance.join(5)
+        self.assertFalse(pool._maintenance.is_alive())
+
+    def test_maintenance_thread_not_started_by_default(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address) as pool:
+            pool.start_maintenance()
+            self.assertIsNone(pool._maintenance)
+
+    def test_recently_idle_connection_is_not_checked(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, liveness_check_timeout=60) as pool:
+            connection = pool.acquire_direct(address)
+            pool.release(connection)
+            self.assertIs(pool.acquire_direct(address), connection)
+            self.assertFalse(hasattr(connection, "liveness_checks"))
+            self.assertEqual(pool.liveness_check_metrics["checks"], 0)
+
+    def test_long_idle_connection_is_checked(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, liveness_check_timeout=60) as pool:
+            connection = pool.acquire_direct(address)
+            pool.release(connection)
+            connection.idle_since -= 120
+            self.assertIs(pool.acquire_direct(address), connection)
+            self.assertEqual(connection.liveness_checks, 1)
+            self.assertEqual(pool.liveness_check_metrics["checks"], 1)
+            self.assertEqual(pool.liveness_check_metrics["failures"], 0)
+            self.assertGreater(pool.liveness_check_metrics["duration"], 0)
+
+    def test_connection_failing_liveness_check_is_discarded(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address, liveness_check_timeout=60,
+                            max_connection_pool_size=2) as pool:
+            old, older = pool.acquire_direct(address), pool.acquire_direct(address)
+            pool.release(older)
+            pool.release(old)
+            for connection in (old, older):
+                connection.idle_since -= 120
+                connection.alive = False
+            connection = pool.acquire_direct(address)
+            self.assertNotIn(connection, (old, older))
+            self.assertIsNone(old.pool)
+            self.assertIsNone(older.pool)
+            self.assertFalse(old.in_use)
+            self.assertEqual(pool.liveness_check_metrics["checks"], 2)
+            self.assertEqual(pool.liveness_check_metrics["failures"], 2)
+            self.assert_pool_size(address, 1, 0, pool)
+
+    def test_failed_liveness_check_closes_only_that_connection(self):
+        address = ("127.0.0.1", 7687)
+        sockets = [TimedReplyingSocket(address, chunked(Structure(b"\x70", {}), 1024)),
+                   TimedReplyingSocket(address, SocketTimeout("timed out"))]
+
+        def real_connector(address, **kwargs):
+            return Connection(3, address, sockets.pop(0))
+
+        with ConnectionPool(real_connector, address, liveness_check_timeout=60) as pool:
+            healthy, broken = pool.acquire_direct(address), pool.acquire_direct(address)
+            pool.release(healthy)
+            pool.release(broken)
+            for connection in (healthy, broken):
+                connection.idle_since -= 120
+            with self.assertLogs("neobolt", level="DEBUG") as logs:
+                self.assertIs(pool.acquire_direct(address), healthy)
+            self.assertEqual([record for record in logs.records if record.levelno >= ERROR], [])
+            self.assertTrue(broken.closed())
+            self.assertIsNone(broken.pool)
+            self.assertFalse(healthy.closed())
+            self.assertIs(healthy.pool, pool)
+            self.assertEqual(pool.liveness_check_metrics["failures"], 1)
+            self.assert_pool_size(address, 1, 0, pool)
+
+    def test_connection_raising_in_liveness_check_is_discarded(self):
+        address = ("127.0.0.1", 7687)
+
+        def raise_error(timeout=None):
+            raise CypherError("The client is unauthorized")
+
+        with ConnectionPool(connector, address, liveness_check_timeout=60,
+                            max_connection_pool_size=1) as pool:
+            connection = pool.acquire_direct(address)
+            pool.release(connection)
+            connection.idle_since -= 120
+            connection.check_liveness = raise_error
+            with self.assertRaises(CypherError):
+                pool.acquire_direct(address)
+            self.assertFalse(connection.in_use)
+            self.assertIsNone(connection.pool)
+            self.assertEqual(pool.liveness_check_metrics["failures"], 1)
+            self.assert_pool_size(address, 0, 0, pool)
+            # The place held by the discarded connection is free again
+            self.assertIsNot(pool.acquire_direct(address), connection)
+
+    def test_liveness_check_disabled_by_default(self):
+        address = ("127.0.0.1", 7687)
+        with ConnectionPool(connector, address) as pool:
+            connection = pool.acquire_direct(address)
+            pool.release(connection)
+            connection.idle_since -= 3600
+            self.assertIs(pool.acquire_direct(address), connection)
+            self.assertFalse(hasattr(connection, "liveness_checks"))
+
+
 def acquire_release_conn(pool, address, releasing_event):
     conn = pool.acquire_direct(address)
     releasing_event.wait()
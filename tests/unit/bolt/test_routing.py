@@ -23,6 +23,7 @@ from collections import OrderedDict
 from unittest import TestCase
 
 from neo4j.bolt.direct import Connection
+from neo4j.exceptions import ServiceUnavailable
 from neo4j.bolt.routing import READ_ACCESS, WRITE_ACCESS, OrderedSet, \
     RoutingTable, RoutingConnectionPool, RoutingProtocolError, \
     LeastConnectedLoadBalancingStrategy
@@ -56,6 +57,55 @@ def connector(address, error_handler):
     return Connection.open(address, error_handler=error_handler, auth=("neotest", "neotest"))
 
 
+class RoutingConnection:
+    """ Connection that replies to a routing procedure call with the
+    given metadata, or that raises the given error when results are
+    fetched.
+    """
+
+    local_port = 0
+
+    def __init__(self, address, metadata=None, error=None):
+        self.address = self.unresolved_address = address
+        self.metadata = metadata
+        self.error = error
+        self._closed = False
+
+    def run(self, statement, parameters, on_success=None, on_failure=None):
+        self.on_failure = on_failure
+
+    def pull_all(self, on_success=None, on_records=None):
+        self.on_records = on_records
+
+    def send_all(self):
+        pass
+
+    def fetch_all(self):
+        if self.error:
+            raise self.error
+        if self.metadata:
+            self.on_failure(self.metadata)
+        self.on_records([[VALID_ROUTING_RECORD["ttl"], VALID_ROUTING_RECORD["servers"]]])
+
+    def close(self):
+        self._closed = True
+
+    def closed(self):
+        return self._closed
+
+    def defunct(self):
+        return False
+
+    def timedout(self):
+        return False
+
+
+def routing_connector(**kwargs):
+    def connect(address, **_):
+        return RoutingConnection(address, **kwargs)
+    return connect
+
+
 class OrderedSetTestCase(TestCase):
     def test_should_repr_as_set(self):
         s = OrderedSet([1, 2, 3])
@@ -241,6 +291,38 @@ class RoutingConnectionPoolConstructionTestCase(TestCase):
             assert pool.routing_table.routers == {("127.0.0.1", 9002)}
 
 
+class RoutingConnectionPoolFetchRoutingInfoTestCase(TestCase):
+
+    router = ("127.0.0.1", 9001)
+
+    def test_connection_is_released_after_success(self):
+        with RoutingConnectionPool(routing_connector(), self.router, {}, self.router) as pool:
+            info = pool.fetch_routing_info(self.router)
+            self.assertEqual(len(info), 1)
+            self.assertEqual(pool.in_use_connection_count(self.router), 0)
+            self.assertEqual(len(pool.idle_connections[self.router]), 1)
+            self.assertFalse(pool.idle_connections[self.router][0].closed())
+
+    def test_connection_is_closed_after_failure_reply(self):
+        metadata = {"code": "Neo.ClientError.Procedure.ProcedureNotFound"}
+        with RoutingConnectionPool(routing_connector(metadata=metadata), self.router, {},
+                                   self.router) as pool:
+            with self.assertRaises(ServiceUnavailable):
+                pool.fetch_routing_info(self.router)
+            self.assertEqual(len(pool.connections[self.router]), 0)
+            self.assertEqual(len(pool.idle_connections[self.router]), 0)
+
+    def test_connection_is_closed_after_error(self):
+        error = ServiceUnavailable("Connection lost")
+        with RoutingConnectionPool(routing_connector(error=error), self.router, {},
+                                   self.router) as pool:
+            connection = pool.acquire_direct(self.router)
+            pool.release(connection)
+            self.assertIsNone(pool.fetch_routing_info(self.router))
+            self.assertTrue(connection.closed())
+            self.assertNotIn(connection, pool.idle_connections.get(self.router, ()))
+
+
 class FakeConnectionPool:
 
     def __init__(self, addresses):
@@ -20,7 +20,9 @@
 
 
 import struct
+from array import array
 from collections import OrderedDict
+from enum import IntEnum
 from io import BytesIO
 from math import pi
 from unittest import TestCase
@@ -28,7 +30,20 @@ from uuid import uuid4
 
 from pytest import raises
 
-from neo4j.packstream import Packer, UnpackableBuffer, Unpacker, Structure
+from neo4j import packstream
+from neo4j.packstream import Packer, StringCache, UnpackableBuffer, Unpacker, Structure
+
+
+class IntEnumValue(IntEnum):
+
+    FORTY_TWO = 42
+
+
+class Money:
+
+    def __init__(self, amount, currency):
+        self.amount = amount
+        self.currency = currency
 
 
 class PackStreamTestCase(TestCase):
@@ -217,6 +232,34 @@ class PackStreamTestCase(TestCase):
         l = [1] * 80000
         self.assert_packable(l, b"\xD6\x00\x01\x38\x80" + (b"\x01" * 80000))
 
+    def test_list_of_floats(self):
+        l = [i / 3.0 for i in range(40)]
+        self.assert_packable(l, b"\xD4\x28" + b"".join(b"\xC1" + struct.pack(">d", x) for x in l))
+
+    def test_list_of_int64s(self):
+        l = [2 ** 40 + i for i in range(-20, 20)]
+        self.assert_packable(l, b"\xD4\x28" + b"".join(b"\xCB" + struct.pack(">q", x) for x in l))
+
+    def test_list_of_mixed_numbers(self):
+        l = [float(i) for i in range(39)] + [39]
+        self.assert_packable(l, b"\xD4\x28" + b"".join(b"\xC1" + struct.pack(">d", x)
+                                                       for x in l[:-1]) + b"\x27")
+
+    def test_list_of_floats_as_array(self):
+        l = [i / 3.0 for i in range(40)]
+        unpacker = Unpacker(UnpackableBuffer(self.packb(l)), numeric_arrays=True)
+        unpacked = unpacker.unpack()
+        assert isinstance(unpacked, array)
+        assert unpacked.typecode == "d"
+        assert unpacked.tolist() == l
+
+    def test_nested_list_of_ints_as_array(self):
+        l = [list(range(200, 240)), list(range(40))]
+        unpacker = Unpacker(UnpackableBuffer(self.packb(l)), numeric_arrays=True)
+        unpacked = unpacker.unpack()
+        assert isinstance(unpacked, list)
+        assert [x.tolist() for x in unpacked] == l
+
     def test_nested_lists(self):
         self.assert_packable([[[]]], b"\x91\x91\x90")
 
@@ -243,6 +286,38 @@ class PackStreamTestCase(TestCase):
             raise AssertionError("Unpacked value %r is not equal to expected %r" %
                                  (unpacked, unpacked_value))
 
+    def test_list_stream_from_iterator(self):
+        packed = self.packb(iter([1, 2, 3]))
+        assert packed == b"\xD7\x01\x02\x03\xDF"
+        assert Unpacker(UnpackableBuffer(packed)).unpack() == [1, 2, 3]
+
+    def test_list_stream_from_generator(self):
+        value = {u"rows": ({u"n": n} for n in range(3))}
+        packed = self.packb(value)
+        assert packed == b"\xA1\x84rows\xD7\xA1\x81n\x00\xA1\x81n\x01\xA1\x81n\x02\xDF"
+
+    def test_list_stream_is_flushed_as_it_grows(self):
+
+        class Stream:
+
+            def __init__(self):
+                self.data = bytearray()
+                self.flushed = []
+
+            def write(self, b):
+                self.data += b
+
+            def flush(self):
+                self.flushed.append(len(self.data))
+
+        stream = Stream()
+        packer = Packer(stream)
+        packer.stream_flush_size = 0x100
+        packer.pack(iter(range(1000)))
+        assert len(stream.flushed) > 1
+        assert all(n < len(stream.data) for n in stream.flushed)
+        assert Unpacker(UnpackableBuffer(bytes(stream.data))).unpack() == list(range(1000))
+
     def test_list_size_overflow(self):
         stream_out = BytesIO()
         packer = Packer(stream_out)
@@ -325,6 +400,200 @@ class PackStreamTestCase(TestCase):
             fields = [1] * 16
             self.packb(Structure(b"X", *fields))
 
+    def test_failed_pack_is_discarded(self):
+        stream = BytesIO()
+        packer = Packer(stream)
+        with raises(ValueError):
+            packer.pack([1, 2, uuid4()])
+        packer.pack(3)
+        assert stream.getvalue() == b"\x03"
+
+    def test_struct_is_written_in_one_piece(self):
+        writes = []
+
+        class Stream:
+
+            def write(self, b):
+                writes.append(bytes(b))
+
+        packer = Packer(Stream())
+        packer.pack_struct(b"\x10", (u"RETURN $x", {u"x": [1, 2.0, u"three"]}, {}))
+        assert writes == [b"\xB3\x10\x89RETURN $x\xA1\x81x\x93\x01"
+                          b"\xC1\x40\x00\x00\x00\x00\x00\x00\x00\x85three\xA0"]
+
+    def test_spliced_value(self):
+        stream = BytesIO()
+        Packer(stream).pack_spliced(b"\xB3\x10\x81A", {u"x": 1}, b"\xA0")
+        assert stream.getvalue() == b"\xB3\x10\x81A\xA1\x81x\x01\xA0"
+
     def test_illegal_uuid(self):
         with self.assertRaises(ValueError):
             self.assert_packable(uuid4(), b"\xB0XXX")
+
+    def test_int_subclass(self):
+        self.assert_packable(IntEnumValue.FORTY_TWO, b"\x2A")
+
+    def test_registered_converter(self):
+        Packer.register(Money, lambda money: Structure(b"M", money.amount, money.currency))
+        try:
+            packed = self.packb([Money(5, u"EUR")])
+            assert packed == b"\x91\xB2M\x05\x83EUR"
+        finally:
+            del Packer._converters[Money]
+
+    def test_registered_converter_for_int_subclass(self):
+        Packer.register(IntEnumValue, lambda value: value.name)
+        try:
+            packed = self.packb({u"x": IntEnumValue.FORTY_TWO})
+            assert packed == b"\xA1\x81x\x89FORTY_TWO"
+        finally:
+            del Packer._converters[IntEnumValue]
+
+    def test_converter_registered_after_packer_created(self):
+        stream = BytesIO()
+        packer = Packer(stream)
+        with raises(ValueError):
+            packer.pack(Money(5, u"EUR"))
+        Packer.register(Money, lambda money: Structure(b"M", money.amount, money.currency))
+        try:
+            packer.pack([Money(5, u"EUR")])
+            assert stream.getvalue() == b"\x91\xB2M\x05\x83EUR"
+        finally:
+            del Packer._converters[Money]
+
+    def test_cannot_register_converter_for_core_type(self):
+        with raises(ValueError):
+            Packer.register(dict, list)
+
+    def test_dict_subclass(self):
+        d = OrderedDict([(u"A", 1), (u"B", [OrderedDict([(u"C", 2)])])])
+        self.assert_packable(d, b"\xA2\x81A\x01\x81B\x91\xA1\x81C\x02")
+
+    def test_deeply_nested_lists(self):
+        depth = 100000
+        unpacked = Unpacker(UnpackableBuffer(b"\x91" * depth + b"\x90")).unpack()
+        for _ in range(depth):
+            assert len(unpacked) == 1
+            unpacked, = unpacked
+        assert unpacked == []
+
+    def test_nested_containers(self):
+        value = {u"path": Structure(b"P", [Structure(b"N", 1, [u"A"], {})], [],
+                                    [{u"x": [1, [2, {}]], u"y": []}]),
+                 u"z": [{}, [], Structure(b"X")]}
+        self.assert_packable(value, self.packb(value))
+
+    def test_nested_streams(self):
+        packed = b"\xD7\xDB\x81A\xD7\x01\xDF\xDF\x90\xDF"
+        unpacked = Unpacker(UnpackableBuffer(packed)).unpack()
+        assert unpacked == [{u"A": [1]}, []]
+
+    def test_unknown_marker(self):
+        with raises(ValueError):
+            Unpacker(UnpackableBuffer(b"\x91\xE0")).unpack()
+
+    def test_skip(self):
+        encoded_values = [self.packb(value) for value in [
+            u"hello", {u"A": [1, 2.0, b"\x00"], u"B": {}},
+            Structure(b"N", 1, [u"X"], {}), iter([[1], {u"C": None}]), -1]]
+        packed = b"".join(encoded_values)
+        buffer = UnpackableBuffer(packed)
+        unpacker = Unpacker(buffer)
+        for encoded_value in encoded_values:
+            start = buffer.p
+            unpacker.skip()
+            assert packed[start:buffer.p] == encoded_value
+        assert buffer.p == len(packed)
+
+    def test_skip_truncated_value(self):
+        packed = self.packb({u"A": [1, 2, 3]})
+        with raises(ValueError):
+            Unpacker(UnpackableBuffer(packed[:-1])).skip()
+
+    def test_skip_deeply_nested_lists(self):
+        depth = 100000
+        buffer = UnpackableBuffer(b"\x91" * depth + b"\x90\x01")
+        Unpacker(buffer).skip()
+        assert buffer.p == depth + 1
+
+    def test_skip_unknown_marker(self):
+        with raises(ValueError):
+            Unpacker(UnpackableBuffer(b"\xA1\x81A\xE0")).skip()
+
+    def test_skip_unexpected_end_of_stream(self):
+        with raises(ValueError):
+            Unpacker(UnpackableBuffer(b"\x92\x01\xDF")).skip()
+
+    def test_scan_list_offsets(self):
+        packed = self.packb([1, u"hello", [2, 3], 1000])
+        buffer = UnpackableBuffer(packed + b"\xC0")
+        assert Unpacker(buffer).scan_offsets() == [1, 2, 8, 11, 14]
+        assert buffer.p == 14
+
+    def test_scan_map_offsets(self):
+        packed = self.packb(OrderedDict([(u"A", 1), (u"B", [])]))
+        assert Unpacker(UnpackableBuffer(packed)).scan_offsets() == [1, 3, 4, 6, 7]
+
+    def test_scan_structure_offsets(self):
+        packed = self.packb(Structure(b"N", 1, [u"X"], {}))
+        assert Unpacker(UnpackableBuffer(packed)).scan_offsets() == [2, 3, 6, 7]
+
+    def test_scan_stream_offsets(self):
+        buffer = UnpackableBuffer(self.packb(iter([1, [2]])))
+        assert Unpacker(buffer).scan_offsets() == [1, 2, 4]
+        assert buffer.p == 5
+
+    def test_scan_offsets_of_non_container(self):
+        buffer = UnpackableBuffer(self.packb(u"hello"))
+        with raises(ValueError):
+            Unpacker(buffer).scan_offsets()
+        assert buffer.p == 0
+
+    def test_cached_strings_are_shared(self):
+        cache = StringCache()
+        value = [{u"name": u"Alice"}, {u"name": u"Bob"}]
+        unpacked = Unpacker(UnpackableBuffer(self.packb(value)), string_cache=cache).unpack()
+        assert unpacked == value
+        key_1, = unpacked[0].keys()
+        key_2, = unpacked[1].keys()
+        assert key_1 is key_2
+        assert cache.hits == 1
+        assert cache.misses == 3
+
+    def test_cached_strings_across_unpackers(self):
+        cache = StringCache()
+        packed = self.packb(u"Person" * 10)
+        value_1 = Unpacker(UnpackableBuffer(packed), string_cache=cache).unpack()
+        value_2 = Unpacker(UnpackableBuffer(packed), string_cache=cache).unpack()
+        assert value_1 == u"Person" * 10
+        assert value_1 is value_2
+
+    def test_long_strings_are_not_cached(self):
+        cache = StringCache(max_length=4)
+        value = [u"abcd", u"abcde", u"abcde"]
+        unpacked = Unpacker(UnpackableBuffer(self.packb(value)), string_cache=cache).unpack()
+        assert unpacked == value
+        assert unpacked[1] is not unpacked[2]
+        assert len(cache) == 1
+        assert cache.misses == 1
+
+    def test_string_cache_is_bounded(self):
+        cache = StringCache(capacity=2)
+        value = [u"A", u"B", u"C", u"A"]
+        unpacked = Unpacker(UnpackableBuffer(self.packb(value)), string_cache=cache).unpack()
+        assert unpacked == value
+        assert len(cache) == 2
+        assert cache.hits == 0
+        assert cache.misses == 4
+
+
+class PurePythonPackStreamTestCase(PackStreamTestCase):
+    """ Repeats all PackStream tests with the compiled codec disabled.
+    """
+
+    def setUp(self):
+        self.codec = packstream._codec
+        packstream._codec = None
+
+    def tearDown(self):
+        packstream._codec = self.codec
@@ -19,9 +19,12 @@
 # limitations under the License.
 
 
+from io import BytesIO
 from unittest import TestCase
 
-from neo4j.data import Record
+from neo4j.data import DataHydrator, LazyRecord, Record
+from neo4j.graph import Node
+from neo4j.packstream import Packer, Structure, UnpackableBuffer, Unpacker
 
 
 class RecordTestCase(TestCase):
@@ -162,3 +165,57 @@ class RecordTestCase(TestCase):
     def test_record_get_by_out_of_bounds_index(self):
         r = Record(zip(["name", "age", "married"], ["Alice", 33, True]))
         self.assertIsNone(r[9])
+
+
+class CountingHydrator(DataHydrator):
+
+    def __init__(self):
+        super(CountingHydrator, self).__init__()
+        self.count = 0
+
+    def hydrate(self, values):
+        self.count += len(values)
+        return super(CountingHydrator, self).hydrate(values)
+
+
+def lazy_record(keys, values, hydrant=None):
+    stream = BytesIO()
+    Packer(stream).pack(values)
+    unpacker = Unpacker(UnpackableBuffer(stream.getvalue()))
+    return LazyRecord(keys, unpacker, hydrant or DataHydrator())
+
+
+class LazyRecordTestCase(TestCase):
+
+    def test_values_are_decoded_on_access(self):
+        hydrant = CountingHydrator()
+        r = lazy_record(["name", "age", "friends"],
+                        ["Alice", 33, [{"name": "Bob"}] * 100], hydrant)
+        self.assertEqual(hydrant.count, 0)
+        self.assertEqual(r["age"], 33)
+        self.assertEqual(hydrant.count, 1)
+        self.assertEqual(r[1], 33)
+        self.assertEqual(hydrant.count, 1)
+
+    def test_lazy_record_equals_record(self):
+        r = lazy_record(["name", "age", "married"], ["Alice", 33, True])
+        self.assertIsInstance(r, Record)
+        self.assertEqual(r, Record(zip(["name", "age", "married"], ["Alice", 33, True])))
+        self.assertEqual(list(r), ["Alice", 33, True])
+        self.assertEqual(r.data(), {"name": "Alice", "age": 33, "married": True})
+        self.assertEqual(r.items(), [("name", "Alice"), ("age", 33), ("married", True)])
+        self.assertEqual(r.values("age", "name"), [33, "Alice"])
+        self.assertEqual(r.get("married"), True)
+        self.assertEqual(r.get("spouse", "nobody"), "nobody")
+        self.assertEqual(r[0:2], Record(zip(["name", "age"], ["Alice", 33])))
+        self.assertIsNone(r[9])
+        self.assertIn(33, r)
+        self.assertNotIn(None, r)
+        self.assertEqual(repr(r), "<LazyRecord name='Alice' age=33 married=True>")
+
+    def test_lazy_record_values_are_hydrated(self):
+        r = lazy_record(["n"], [Structure(b"N", 1, ["Person"], {"name": "Alice"})])
+        node = r["n"]
+        self.assertIsInstance(node, Node)
+        self.assertEqual(node["name"], "Alice")
+        self.assertIs(r["n"], node)
@@ -21,6 +21,7 @@
 
 from unittest import TestCase
 from neo4j import kerberos_auth, basic_auth, custom_auth
+from neo4j.bolt.security import TLSSessionCache
 
 
 class AuthTokenTestCase(TestCase):
@@ -56,3 +57,44 @@ class AuthTokenTestCase(TestCase):
         assert auth.credentials == "meoooow"
         assert auth.realm == "cat_cafe"
         assert auth.parameters == {"age": "1", "color": "white"}
+
+
+class TLSSessionCacheTestCase(TestCase):
+
+    def test_empty(self):
+        cache = TLSSessionCache()
+        assert cache.get(("localhost", ("127.0.0.1", 7687))) is None
+        assert len(cache) == 0
+
+    def test_put_and_get(self):
+        cache = TLSSessionCache()
+        key = ("localhost", ("127.0.0.1", 7687))
+        session = object()
+        cache.put(key, session)
+        assert cache.get(key) is session
+        assert cache.get(("localhost", ("127.0.0.2", 7687))) is None
+
+    def test_put_replaces(self):
+        cache = TLSSessionCache()
+        key = ("localhost", ("127.0.0.1", 7687))
+        session = object()
+        cache.put(key, object())
+        cache.put(key, session)
+        assert cache.get(key) is session
+        assert len(cache) == 1
+
+    def test_put_none_removes(self):
+        cache = TLSSessionCache()
+        key = ("localhost", ("127.0.0.1", 7687))
+        cache.put(key, object())
+        cache.put(key, None)
+        assert cache.get(key) is None
+        assert len(cache) == 0
+
+    def test_remove(self):
+        cache = TLSSessionCache()
+        key = ("localhost", ("127.0.0.1", 7687))
+        cache.put(key, object())
+        cache.remove(key)
+        cache.remove(key)
+        assert len(cache) == 0